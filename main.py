@@ -1,18 +1,35 @@
 # main script that coniniously monitors the log file as per the set interval
+import asyncio
 import os
-import time
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from langchain import hub
 from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.tools import BaseTool
 from langchain_openai import ChatOpenAI
 from utils.logger import logger
 
 from tools.file import FilteredLogReaderTool
 from tools.jira import CreateJiraTicketTool
-from tools.oncall_employees import GetOncallEmployeesTool
+from tools.log_stats import EndpointStatsTool
+from tools.oncall_employees import DEFAULT_ROSTER, GetOncallEmployeesTool
+from utils.anomaly import RateAnomalyDetector
+from utils.batching import IncidentBatcher
+from utils.direct_triage import DirectTriage
+from utils.fingerprint import FingerprintTracker, Incident, group_incidents
+from utils.latency import LatencyMonitor
+from utils.log_scan import shutdown_scan_pool
+from utils.log_sources import LogSourceRegistry
+from utils.log_store import LogEventStore
+from utils.log_watcher import LogWatcher
+from utils.outbox import Outbox
+from utils.prefilter import ALERT_LEVELS, ErrorPrefilter
+from utils.roster import OncallRoster
+from utils.routing import DEFAULT_RULES, TeamRouter, load_rules
+from utils.state_store import StateStore
 
 # Load environment variables
 load_dotenv()
@@ -21,28 +38,148 @@ load_dotenv()
 LOG_FILE_PATH = Path(os.getenv("LOG_FILE_PATH", "output/logs.log"))
 LOG_FILE_PATH.parent.mkdir(exist_ok=True)
 
-# Monitoring interval in seconds
+# Every log file to monitor: comma separated files, glob patterns or directories (their *.log files)
+LOG_SOURCES = os.getenv("LOG_SOURCES", str(LOG_FILE_PATH)).split(",")
+
+# Monitoring interval in seconds; log changes wake the monitor up earlier, this is the longest it waits
 MONITORING_INTERVAL = int(os.getenv("MONITORING_INTERVAL", 60))
 
-# Keep track of issues we've already addressed
-processed_issues = set()
+# Seconds a burst of log writes has to settle before it is processed as one batch
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", 0.2))
+
+# Levels and extra regex patterns (comma separated) that make a log entry worth the agent's attention
+ALERT_LOG_LEVELS = os.getenv("ALERT_LOG_LEVELS", ",".join(ALERT_LEVELS)).split(",")
+ALERT_PATTERNS = os.getenv("ALERT_PATTERNS", "").split(",")
+
+# How long (in seconds) an error keeps being treated as already reported after its last occurrence
+INCIDENT_TTL = int(os.getenv("INCIDENT_TTL", 3600))
+
+# Error rates are counted in buckets of this many seconds, and a rate is anomalous when it is at
+# least ANOMALY_MIN_COUNT occurrences per bucket and ANOMALY_THRESHOLD standard deviations above its
+# baseline, which needs ANOMALY_WARMUP_BUCKETS buckets of history
+ANOMALY_BUCKET_SECONDS = float(os.getenv("ANOMALY_BUCKET_SECONDS", 60))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", 3.0))
+ANOMALY_MIN_COUNT = int(os.getenv("ANOMALY_MIN_COUNT", 5))
+ANOMALY_WARMUP_BUCKETS = int(os.getenv("ANOMALY_WARMUP_BUCKETS", 10))
+
+# Response time percentiles are tracked per endpoint in intervals of this many seconds, and an
+# endpoint regresses when its p50, p95 or p99 over the last LATENCY_RECENT_INTERVALS intervals is
+# LATENCY_REGRESSION_RATIO times the one of the hour before, with LATENCY_MIN_SAMPLES on both sides
+LATENCY_INTERVAL_SECONDS = float(os.getenv("LATENCY_INTERVAL_SECONDS", 60))
+LATENCY_RECENT_INTERVALS = int(os.getenv("LATENCY_RECENT_INTERVALS", 5))
+LATENCY_REGRESSION_RATIO = float(os.getenv("LATENCY_REGRESSION_RATIO", 1.5))
+LATENCY_MIN_SAMPLES = int(os.getenv("LATENCY_MIN_SAMPLES", 30))
+
+# How incidents are triaged: "direct" fetches the logs and the roster up front and triages each
+# batch of incidents with a single LLM call, "react" lets the ReAct agent call the tools step by
+# step. Incidents the direct triage fails on fall back to the agent.
+TRIAGE_MODE = os.getenv("TRIAGE_MODE", "direct")
+
+# The direct triage batches the incidents of consecutive checks: a batch goes out once it holds
+# TRIAGE_BATCH_SIZE incidents or TRIAGE_BATCH_DELAY seconds after its first one, whichever is first
+TRIAGE_BATCH_SIZE = int(os.getenv("TRIAGE_BATCH_SIZE", 20))
+TRIAGE_BATCH_DELAY = float(os.getenv("TRIAGE_BATCH_DELAY", 10))
+
+# Maximum number of incidents triaged by the agent at the same time
+MAX_CONCURRENT_TRIAGES = int(os.getenv("MAX_CONCURRENT_TRIAGES", 4))
+
+# Where the monitor keeps its position in the log and the errors it already reported
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH", "output/state.db"))
+
+# Tickets are queued in a durable outbox (in the state database) and created in the background by
+# OUTBOX_WORKERS workers, at most OUTBOX_RATE_LIMIT per second, failed ones being retried with
+# backoff up to OUTBOX_MAX_ATTEMPTS times. 0 workers creates tickets inline instead.
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_RATE_LIMIT = float(os.getenv("OUTBOX_RATE_LIMIT", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+
+# On-call roster file (.json, .yaml or .ics, see the README), reloaded when it changes; without one
+# the static demonstration roster is used
+ONCALL_ROSTER_PATH = os.getenv("ONCALL_ROSTER_PATH") or None
+
+# Rules file (.json or .yaml, see the README) mapping exception types, components and endpoints to
+# the teams that own them; incidents a rule covers are assigned without asking the LLM
+ROUTING_RULES_PATH = os.getenv("ROUTING_RULES_PATH") or None
+
+# How long (in seconds) parsed log records stay queryable by the endpoint_stats tool
+LOG_STORE_RETENTION = int(os.getenv("LOG_STORE_RETENTION", 3600))
+
+# Directory records past the retention are written to as Parquet files (requires pyarrow)
+LOG_STORE_SPILL_DIR = os.getenv("LOG_STORE_SPILL_DIR") or None
+
+# Shared state and services, set up by `setup_state` when the monitor starts rather than on import:
+# the log scan processes import this module too
+state: Optional[StateStore] = None
+processed_issues: Optional[FingerprintTracker] = None
+outbox: Optional[Outbox] = None
+anomaly_detector: Optional[RateAnomalyDetector] = None
+event_store: Optional[LogEventStore] = None
+latency_monitor: Optional[LatencyMonitor] = None
+oncall_roster: Optional[OncallRoster] = None
+team_router: Optional[TeamRouter] = None
 last_check_time = None
 
 
-def setup_agent():
+def setup_state():
+    """Open the state database and the outbox, and set up the detectors and the routing."""
+    global state, processed_issues, outbox, anomaly_detector, event_store
+    global latency_monitor, oncall_roster, team_router
+    # Keep track of issues we've already addressed
+    state = StateStore(STATE_DB_PATH)
+    processed_issues = FingerprintTracker(ttl=INCIDENT_TTL, store=state)
+    outbox = (
+        Outbox(
+            STATE_DB_PATH,
+            workers=OUTBOX_WORKERS,
+            rate=OUTBOX_RATE_LIMIT,
+            max_attempts=OUTBOX_MAX_ATTEMPTS,
+        )
+        if OUTBOX_WORKERS > 0
+        else None
+    )
+    anomaly_detector = RateAnomalyDetector(
+        bucket_seconds=ANOMALY_BUCKET_SECONDS,
+        threshold=ANOMALY_THRESHOLD,
+        min_count=ANOMALY_MIN_COUNT,
+        warmup=ANOMALY_WARMUP_BUCKETS,
+    )
+    event_store = LogEventStore(
+        retention=LOG_STORE_RETENTION, spill_dir=LOG_STORE_SPILL_DIR
+    )
+    latency_monitor = LatencyMonitor(
+        interval_seconds=LATENCY_INTERVAL_SECONDS,
+        recent=LATENCY_RECENT_INTERVALS,
+        ratio=LATENCY_REGRESSION_RATIO,
+        min_samples=LATENCY_MIN_SAMPLES,
+    )
+    oncall_roster = (
+        OncallRoster(path=ONCALL_ROSTER_PATH)
+        if ONCALL_ROSTER_PATH
+        else OncallRoster(DEFAULT_ROSTER)
+    )
+    team_router = TeamRouter(
+        load_rules(ROUTING_RULES_PATH) if ROUTING_RULES_PATH else DEFAULT_RULES,
+        oncall_roster,
+    )
+
+
+def setup_tools(log_reader: FilteredLogReaderTool) -> List[BaseTool]:
+    """The tools shared by the ReAct agent and the direct triage."""
+    return [
+        log_reader,
+        EndpointStatsTool(event_store),
+        GetOncallEmployeesTool(roster=oncall_roster),
+        CreateJiraTicketTool(state_store=state, outbox=outbox),
+    ]
+
+
+def setup_agent(tools: List[BaseTool]):
     """Set up the ReAct agent with the necessary tools."""
     llm = ChatOpenAI(model="gpt-4o-mini")
 
     # Load ReAct prompt
     prompt = hub.pull("hwchase17/react")
 
-    # Initialize tools
-    tools = [
-        FilteredLogReaderTool(log_file_path=LOG_FILE_PATH),
-        GetOncallEmployeesTool(),
-        CreateJiraTicketTool(),
-    ]
-
     # Create the agent
     agent = create_react_agent(llm, tools, prompt)
 
@@ -58,21 +195,94 @@ def setup_agent():
     return agent_executor
 
 
-def monitor_logs():
-    """Main function to periodically monitor logs."""
+def setup_direct_triage(tools: List[BaseTool]) -> Optional[DirectTriage]:
+    """Set up the single-shot triage, None in the "react" triage mode."""
+    if TRIAGE_MODE != "direct":
+        return None
+    log_reader, endpoint_stats, oncall, jira = tools
+    return DirectTriage(
+        ChatOpenAI(model="gpt-4o-mini"),
+        log_reader,
+        endpoint_stats,
+        oncall,
+        jira,
+        router=team_router,
+    )
+
+
+async def monitor_logs():
+    """
+    Main function to monitor logs. New incidents are triaged in background tasks, bounded by
+    MAX_CONCURRENT_TRIAGES, so a slow agent never delays the detection of the next errors.
+    """
     logger.info("Starting log monitoring service...")
 
     global last_check_time
+    setup_state()
 
-    # Initialize last_check_time to a short while ago for the first run
-    last_check_time = datetime.now() - timedelta(minutes=5)
-
-    # Set up the agent
-    agent = setup_agent()
+    # Resume from where the previous run stopped, or start a short while ago on the first run
+    last_check_time = state.get_last_check_time() or (
+        datetime.now() - timedelta(minutes=5)
+    )
 
     # Ensure log file exists
     _ensure_log_file_exists()
 
+    # Set up the agent, sharing the log reader so the per-file tail cursors persist across checks.
+    # All sources are tailed by this one loop and merged into a single stream in time order.
+    sources = LogSourceRegistry(LOG_SOURCES)
+    log_reader = FilteredLogReaderTool(
+        log_file_path=LOG_FILE_PATH, sources=sources, state_store=state
+    )
+    tools = setup_tools(log_reader)
+    agent = setup_agent(tools)
+    direct_triage = setup_direct_triage(tools)
+    prefilter = ErrorPrefilter(levels=ALERT_LOG_LEVELS, patterns=ALERT_PATTERNS)
+    watcher = LogWatcher(sources, debounce=WATCH_DEBOUNCE)
+    # Load the records logged during the retention window before the first check
+    event_store.extend(
+        log_reader.iter_window(
+            last_check_time - timedelta(seconds=LOG_STORE_RETENTION),
+            last_check_time - timedelta(seconds=1),
+        )
+    )
+    logger.info(f"Loaded {len(event_store)} recent log records into the event store")
+    # The backfill only builds the latency baselines, past regressions are not reported
+    latency_monitor.update(event_store)
+    # Create the tickets queued by this run and any left over by the previous one (the task is
+    # referenced here as asyncio only keeps weak references to tasks)
+    outbox_workers: Optional[asyncio.Task] = None
+
+    def start_outbox():
+        nonlocal outbox_workers
+        outbox_workers = asyncio.create_task(outbox.run())
+        outbox_workers.add_done_callback(restart_outbox)
+
+    def restart_outbox(task: asyncio.Task):
+        if task.cancelled():
+            return
+        logger.opt(exception=task.exception()).error(
+            f"Outbox workers stopped, restarting them in {MONITORING_INTERVAL}s"
+        )
+        asyncio.get_running_loop().call_later(MONITORING_INTERVAL, start_outbox)
+
+    if outbox:
+        start_outbox()
+    triage_slots = asyncio.Semaphore(MAX_CONCURRENT_TRIAGES)
+    # Strong references to the running triages, asyncio only keeps weak ones
+    triages = set()
+
+    def dispatch(batch: List[Incident], from_time: datetime, to_time: datetime):
+        triage = asyncio.create_task(
+            _triage(agent, direct_triage, triage_slots, from_time, to_time, batch)
+        )
+        triages.add(triage)
+        triage.add_done_callback(triages.discard)
+
+    batcher = IncidentBatcher(
+        dispatch, max_size=TRIAGE_BATCH_SIZE, max_delay=TRIAGE_BATCH_DELAY
+    )
+
     while True:
         try:
             current_time = datetime.now()
@@ -80,19 +290,79 @@ def monitor_logs():
                 f"\n[{current_time.strftime('%Y-%m-%d %H:%M:%S')}] Checking logs..."
             )
 
-            # Check for and process any new errors
-            _process_new_errors(agent, last_check_time, current_time)
+            # Only read what was appended since the last check, and only wake the agent up
+            # when something in it looks like an error
+            incidents = group_incidents(
+                prefilter.select(
+                    event_store.ingest(log_reader.iter_new(since=last_check_time))
+                )
+            )
+            new_incidents = _select_incidents(incidents)
+            # Response time regressions, reported once per endpoint like errors
+            new_incidents += processed_issues.filter_new(
+                latency_monitor.update(event_store)
+            )
 
-            # Update the last check time
+            if new_incidents:
+                logger.info(
+                    f"Found {len(new_incidents)} new or spiking distinct errors and regressions "
+                    f"({len(incidents) - len(new_incidents)} already reported or within their "
+                    "usual rate), invoking the agent"
+                )
+                # The direct triage takes whole batches in one call, the agent one incident
+                # at a time
+                if direct_triage is not None:
+                    batcher.add(new_incidents, last_check_time, current_time)
+                else:
+                    for incident in new_incidents:
+                        dispatch([incident], last_check_time, current_time)
+            else:
+                logger.debug("No new errors in the new log entries, skipping the agent")
+
+            # Update the last check time, and persist it with the cursors and fingerprints
             last_check_time = current_time
-
-            # Wait for the next check
-            logger.debug(f"Waiting {MONITORING_INTERVAL} seconds until next check...")
-            time.sleep(MONITORING_INTERVAL)
+            log_reader.save_cursors()
+            state.set_last_check_time(last_check_time)
+            state.commit()
+
+            # Wait for the log to change, or for the next check at the latest. A record held back
+            # as possibly incomplete is handed over once the log stays quiet for the debounce delay
+            timeout = (
+                WATCH_DEBOUNCE
+                if log_reader.has_partial_records
+                else MONITORING_INTERVAL
+            )
+            logger.debug(f"Waiting up to {timeout} seconds for new log entries...")
+            await watcher.wait(timeout=timeout)
 
         except Exception as e:
             logger.debug(f"Error in monitoring loop: {str(e)}")
-            time.sleep(MONITORING_INTERVAL)
+            await asyncio.sleep(MONITORING_INTERVAL)
+
+
+def _select_incidents(incidents: List[Incident]) -> List[Incident]:
+    """
+    The incidents worth the agent's time: errors never reported before, unless they recur at a
+    rate their history shows as normal, and errors whose rate deviates from their baseline.
+    Recurrences of errors that were already handed to the agent are skipped; the new errors
+    selected are only marked as reported once triaged (see `_triage`).
+    """
+    anomaly_detector.observe(incidents)
+    new_fingerprints = {
+        incident.fingerprint for incident in processed_issues.filter_new(incidents)
+    }
+    selected = []
+    for incident in incidents:
+        incident.reason = anomaly_detector.spike(incident)
+        if incident.reason:
+            selected.append(incident)
+        elif incident.fingerprint in new_fingerprints:
+            if anomaly_detector.has_baseline(incident):
+                logger.debug(f"{incident} recurs at its usual rate, not escalating it")
+                processed_issues.confirm([incident])
+            else:
+                selected.append(incident)
+    return selected
 
 
 def _ensure_log_file_exists():
@@ -103,22 +373,78 @@ def _ensure_log_file_exists():
         logger.debug(f"Created empty log file at {LOG_FILE_PATH}")
 
 
-def _process_new_errors(agent, from_time, to_time):
-    """Check for new errors and process them if found."""
+async def _triage(
+    agent,
+    direct_triage: Optional[DirectTriage],
+    slots: asyncio.Semaphore,
+    from_time: datetime,
+    to_time: datetime,
+    incidents: List[Incident],
+):
+    """
+    Triage a batch of incidents once a slot is free: with the direct triage if enabled, and with
+    the agent for whatever it couldn't triage. The incidents are marked as reported, and
+    persisted right away, once their ticket is created or queued; failures are logged and
+    released, so that the next occurrence of the error is triaged again.
+    """
+    async with slots:
+        if direct_triage is not None:
+            try:
+                left_out = await direct_triage.triage(incidents, from_time, to_time)
+            except Exception as e:
+                logger.exception(
+                    f"Direct triage failed, falling back to the agent: {e}"
+                )
+            else:
+                processed_issues.confirm(
+                    incident for incident in incidents if incident not in left_out
+                )
+                state.commit()
+                incidents = left_out
+        for incident in incidents:
+            try:
+                await _process_new_errors(agent, from_time, to_time, [incident])
+            except Exception as e:
+                logger.exception(
+                    f"Failed to triage incident {incident.fingerprint}: {e}"
+                )
+                processed_issues.release([incident])
+            else:
+                processed_issues.confirm([incident])
+                state.commit()
+
+
+async def _process_new_errors(agent, from_time, to_time, incidents: List[Incident]):
+    """Have the agent triage the new distinct errors found between from_time and to_time."""
     from_time_str = from_time.strftime("%Y-%m-%d %H:%M:%S")
     to_time_str = to_time.strftime("%Y-%m-%d %H:%M:%S")
+    incident_list = "\n".join(
+        f"- [Fingerprint: {incident.fingerprint}] {incident.summary()}"
+        f"{TeamRouter.describe(team_router.route(incident))}"
+        for incident in incidents
+    )
 
     prompt = (
         f"Read logs from {from_time_str} to {to_time_str} and check for any errors or critical issues. "
         "Use the filtered_log_reader tool with these exact timestamps to only look at new logs since the last check."
         "You need to then idenify the potential cause and the possible solution for each of the error you saw."
+        "The endpoint_stats tool tells how widespread failures of an API endpoint are over the same window."
+        "Response time regressions come with their p50/p95/p99 response times before and after, look for what slowed the endpoint down."
         "After idenifying the potential cause and possible solution use get_oncall_employees tool to find filter out on-call employees best suited to handle each error"
+        ", except for errors listed with an owner and an assignee: assign those to that employee without looking up the on-call employees. "
         "Finally use create_jira_ticket to create appropriate tickets and assign it to the right employee"
+        "\nOnly the following distinct errors are new, create exactly one ticket for each of them "
+        "and ignore any other error in the logs as it has already been reported. "
+        "End each ticket description with the line 'Fingerprint: <fingerprint>' of its error:\n"
+        f"{incident_list}"
     )
 
-    response = agent.invoke({"input": prompt})
+    response = await agent.ainvoke({"input": prompt})
     logger.debug(f"Final response from agent: {response}")
 
 
 if __name__ == "__main__":
-    monitor_logs()
+    try:
+        asyncio.run(monitor_logs())
+    finally:
+        shutdown_scan_pool()
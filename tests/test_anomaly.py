@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+from utils.anomaly import RateAnomalyDetector
+from utils.fingerprint import group_incidents
+from utils.log_events import iter_events
+
+START = datetime(2025, 5, 1, 10, 0)
+
+
+SYSTEM = "[DatabasePool] [db-01] [PID:4242] "
+
+
+def _incidents(minute: int, count: int, message: str = SYSTEM + "Connection timeout"):
+    """`count` occurrences spread over one minute."""
+    lines = []
+    for number in range(count):
+        at = START + timedelta(minutes=minute, seconds=number * 60 // count)
+        lines.append(f"[{at:%Y-%m-%d %H:%M:%S}.000] [ERROR] {message}\n")
+    return group_incidents(iter_events(lines))
+
+
+def _detector(**kwargs):
+    return RateAnomalyDetector(bucket_seconds=60, warmup=10, **kwargs)
+
+
+def _steady(detector, minutes: int, count: int = 4):
+    for minute in range(minutes):
+        detector.observe(_incidents(minute, count))
+
+
+def test_steady_rates_are_not_spikes():
+    detector = _detector()
+    _steady(detector, 30)
+
+    (incident,) = _incidents(30, 5)
+    detector.observe([incident])
+
+    assert detector.has_baseline(incident)
+    assert detector.spike(incident) is None
+
+
+def test_spikes_are_reported_once_until_the_rate_is_back_to_normal():
+    detector = _detector()
+    _steady(detector, 30)
+
+    (incident,) = _incidents(30, 60)
+    detector.observe([incident])
+    spike = detector.spike(incident)
+
+    assert spike.startswith("fingerprint ")
+    assert "rate spike" in spike
+    assert detector.spike(incident) is None
+
+    # Back to normal, then spiking again
+    for incidents in (_incidents(minute, 4) for minute in range(31, 40)):
+        detector.observe(incidents)
+        detector.spike(incidents[0])
+    (again,) = _incidents(40, 60)
+    detector.observe([again])
+    assert detector.spike(again) is not None
+
+
+def test_no_verdict_while_warming_up():
+    detector = _detector()
+    _steady(detector, 3)
+
+    (incident,) = _incidents(3, 60)
+    detector.observe([incident])
+
+    assert not detector.has_baseline(incident)
+    assert detector.spike(incident) is None
+
+
+def test_components_are_tracked_across_fingerprints():
+    detector = _detector()
+    _steady(detector, 30)
+
+    # A new error of the same component: no baseline of its own, but its component spikes
+    (incident,) = _incidents(30, 60, SYSTEM + "Deadlock detected")
+    detector.observe([incident])
+
+    assert not detector.has_baseline(incident)
+    assert detector.spike(incident).startswith("component DatabasePool")
+
+
+def test_quiet_baselines_decay():
+    detector = _detector(ring_size=10)
+    _steady(detector, 30, count=1)
+    (incident,) = _incidents(30, 1)
+    assert detector.has_baseline(incident)
+
+    # Hours later, the baseline has decayed away
+    (later,) = _incidents(300, 1)
+    detector.observe([later])
+    detector.spike(later)
+
+    assert not detector.has_baseline(later)
+
+
+def test_series_are_bounded():
+    detector = _detector(max_series=10)
+
+    for number in range(20):
+        detector.observe(
+            _incidents(0, 1, f"Error kind {'abcdefghijklmnopqrst'[number]}")
+        )
+
+    assert len(detector) == 10
@@ -0,0 +1,113 @@
+from utils.compaction import LogCompactor, estimate_tokens
+from utils.log_events import iter_events
+
+
+def _record(second: int, message: str, frames=()) -> list:
+    lines = [
+        f"[2025-05-01 10:{second // 60:02d}:{second % 60:02d}.000] [ERROR] {message}\n"
+    ]
+    for module in frames:
+        lines.append(f'  File "/app/{module}.py", line {second + 10}, in run\n')
+        lines.append(f"    {module}.run()\n")
+    return lines
+
+
+def _events(records):
+    return list(iter_events(line for record in records for line in record))
+
+
+RECORDS = [
+    _record(second, message, frames)
+    for second, (message, frames) in enumerate(
+        [
+            ("Database connection lost", ("db", "pool")),
+            ("Timeout after 12ms", ()),
+            ("Database connection lost", ("db", "pool")),
+            ("Cache miss storm", ("pool", "cache")),
+            ("Timeout after 7ms", ()),
+        ]
+        * 20
+    )
+]
+
+
+def _compacted(events, **limits):
+    compactor = LogCompactor(limits.pop("token_budget", 10_000), **limits)
+    for event in events:
+        compactor.add(event)
+    return compactor
+
+
+def _summary(compactor):
+    return (
+        compactor.render(),
+        len(compactor),
+        compactor.folded_records,
+        compactor.omitted_records,
+        compactor.omitted_lines,
+        [
+            (group.incident.count, group.incident.first_seen, group.incident.last_seen)
+            for group in compactor._groups.values()
+        ],
+    )
+
+
+def test_repeats_are_folded_into_their_first_occurrence():
+    compactor = _compacted(_events(RECORDS))
+
+    output = "".join(compactor.render())
+
+    assert len(compactor) == 3
+    assert compactor.folded_records == 97
+    assert "40x [ERROR] Database connection lost" in output
+    assert "first seen 2025-05-01 10:00:00, last seen 2025-05-01 10:01:37" in output
+    # The frame of `pool` shown for the first error is elided in the second one
+    assert output.count('File "/app/pool.py"') == 1
+    assert "  ... 1 frame shown above\n" in output
+
+
+def test_output_is_cut_at_the_limits():
+    events = _events(RECORDS)
+
+    compactor = _compacted(events, max_records=2)
+
+    assert len(compactor) == 2
+    # Everything from the first group that doesn't fit is only counted
+    assert compactor.omitted_records == len(events) - 3
+    assert compactor.omitted_lines == sum(len(event.lines) for event in events[3:])
+
+
+def test_output_stays_within_the_token_budget():
+    compactor = _compacted(_events(RECORDS), token_budget=100)
+
+    assert len(compactor) == 1
+    assert 0 < compactor.tokens <= 100
+    assert estimate_tokens("".join(compactor.render())) <= 100
+
+
+def test_merging_split_streams_matches_a_single_pass():
+    events = _events(RECORDS)
+    for limits in ({}, {"max_records": 2}, {"max_lines": 8}, {"token_budget": 80}):
+        expected = _summary(_compacted(events, **limits))
+        for cut in (1, 2, 3, 4, 37, 99):
+            merged = _compacted(events[:cut], **limits)
+            # A scan worker compacts the rest of the window with the same limits
+            merged.merge(_compacted(events[cut:], **limits))
+
+            assert _summary(merged) == expected, (limits, cut)
+
+
+def test_merging_keeps_sources_apart():
+    events = _events(RECORDS[:5])
+    compactor = LogCompactor(10_000)
+    for event in events:
+        compactor.add(event, "a.log")
+    # Compacted without the source, as a scan worker of b.log does
+    other = _compacted(events)
+
+    compactor.merge(other, "b.log")
+
+    assert len(compactor) == 6
+    output = compactor.render()
+    assert output.count("[a.log] ") == 3
+    assert output.count("[b.log] ") == 3
@@ -0,0 +1,167 @@
+import pytest
+
+from utils import fingerprint as fingerprint_module
+from utils.fingerprint import (
+    FingerprintTracker,
+    fingerprint,
+    group_incidents,
+    normalize,
+)
+from utils.log_events import iter_events
+from utils.state_store import StateStore
+
+
+def _event(text: str):
+    (event,) = iter_events([text])
+    return event
+
+
+def _fingerprint(message: str, at: str = "2025-05-01 10:00:00.000") -> str:
+    return fingerprint(_event(f"[{at}] [ERROR] {message}\n"))
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        # ISO-8601 timestamps inside the message, at any precision and offset
+        (
+            "Token expired at 2025-05-01T09:59:58Z",
+            "Token expired at 2025-06-12T23:01:07Z",
+        ),
+        (
+            "Lock held since 2025-05-01T09:59:58.123+02:00",
+            "Lock held since 2025-05-03T11:00:00.999+02:00",
+        ),
+        (
+            "Job started 2025-05-01 09:59:58 failed",
+            "Job started 2025-05-02 18:00:01 failed",
+        ),
+        ("Retry scheduled for 09:59:58", "Retry scheduled for 17:03:11"),
+        # Request, trace and span ids, short ones included
+        ("Upstream timeout trace=1a2b3c4d", "Upstream timeout trace=9f8e7d6c"),
+        ("Upstream timeout trace=1a2b3c4d", "Upstream timeout trace=12345678"),
+        (
+            "Request 141e496c-6f90-4e69-9cd7-10fd536a631c failed",
+            "Request 8c3e1f2a-0b4d-4c5e-9f6a-7b8c9d0e1f2a failed",
+        ),
+        ("Payment of 12.50 took 130ms", "Payment of 999 took 7ms"),
+        ("Connection to 10.0.0.1:5432 refused", "Connection to 10.0.3.17:6432 refused"),
+    ],
+)
+def test_volatile_tokens_keep_the_fingerprint(first, second):
+    assert _fingerprint(first) == _fingerprint(second)
+
+
+def test_header_timestamp_is_not_part_of_the_fingerprint():
+    message = "Database connection lost"
+    assert _fingerprint(message, "2025-05-01 10:00:00.000") == _fingerprint(
+        message, "2025-05-02 23:59:59.999"
+    )
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("GET /api/auth - Status: 500", "GET /api/auth - Status: 503"),
+        ("Upload failed: S3UploadError", "Upload failed: S4UploadError"),
+        ("GET /api/v1/users failed", "GET /api/v2/users failed"),
+    ],
+)
+def test_distinct_errors_keep_distinct_fingerprints(first, second):
+    assert _fingerprint(first) != _fingerprint(second)
+
+
+def test_traceback_frames_are_part_of_the_fingerprint():
+    def traceback(module: str, line: int) -> str:
+        (event,) = iter_events(
+            [
+                "[2025-05-01 10:00:00.000] [ERROR] Unhandled exception\n",
+                f'  File "/app/{module}.py", line {line}, in run\n',
+            ]
+        )
+        return fingerprint(event)
+
+    assert traceback("db", 10) == traceback("db", 42)
+    assert traceback("db", 10) != traceback("cache", 10)
+
+
+def test_normalize_keeps_http_status_codes():
+    assert normalize("HTTP 503 after 12ms") == "HTTP 503 after <n>ms"
+
+
+def test_group_incidents_counts_occurrences():
+    lines = [
+        f"[2025-05-01 10:00:0{second}.000] [ERROR] Timeout after {second}ms\n"
+        for second in range(5)
+    ]
+
+    (incident,) = group_incidents(iter_events(lines))
+
+    assert incident.count == 5
+    assert incident.summary().startswith("5x [ERROR] Timeout after <n>ms")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fingerprint_module.time, "time", lambda: now[0])
+    return now
+
+
+def _incidents(*messages):
+    return group_incidents(
+        iter_events(
+            f"[2025-05-01 10:00:00.000] [ERROR] {message}\n" for message in messages
+        )
+    )
+
+
+def test_tracker_reports_new_fingerprints_once_confirmed(clock):
+    tracker = FingerprintTracker(ttl=60)
+    incidents = _incidents("Disk full", "Cache miss storm")
+
+    assert tracker.filter_new(incidents) == incidents
+    # Pending until reported: not reported twice meanwhile, not known yet either
+    assert tracker.filter_new(incidents) == []
+    assert len(tracker) == 0
+    tracker.confirm(incidents)
+    assert len(tracker) == 2
+    assert tracker.filter_new(incidents) == []
+
+
+def test_tracker_released_fingerprints_come_back(clock):
+    tracker = FingerprintTracker(ttl=60)
+    incidents = _incidents("Disk full")
+
+    tracker.filter_new(incidents)
+    tracker.release(incidents)
+
+    assert tracker.filter_new(incidents) == incidents
+
+
+def test_tracker_forgets_fingerprints_after_their_ttl(clock):
+    tracker = FingerprintTracker(ttl=60)
+    disk, cache = _incidents("Disk full", "Cache miss storm")
+    tracker.confirm([disk, cache])
+
+    # Recurring keeps a fingerprint known, a quiet one expires
+    clock[0] += 40
+    assert tracker.filter_new([disk]) == []
+    clock[0] += 40
+
+    assert tracker.filter_new([disk, cache]) == [cache]
+
+
+def test_tracker_survives_restarts(clock, tmp_path):
+    store = StateStore(tmp_path / "state.db")
+    incidents = _incidents("Disk full")
+    tracker = FingerprintTracker(ttl=60, store=store)
+    tracker.filter_new(incidents)
+    tracker.confirm(incidents)
+    store.commit()
+
+    restarted = FingerprintTracker(ttl=60, store=store)
+
+    assert incidents[0].fingerprint in restarted
+    assert restarted.filter_new(incidents) == []
+    store.close()
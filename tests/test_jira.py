@@ -0,0 +1,220 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from tools import jira
+from tools.jira import CreateJiraTicketTool
+
+
+class StubJira(BaseHTTPRequestHandler):
+    """
+    Stand-in for Jira's search, bulk create and comment endpoints, which throttles one request
+    in three the first time it is sent, alternating both forms of Retry-After.
+    """
+
+    # Keep-alive, so that connection reuse can be observed
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status: int, response: dict):
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _create(self, fields: dict) -> dict:
+        key = f"OPS-{len(self.server.issues) + 1}"
+        self.server.issues[key] = fields.get("labels", [])
+        return {"key": key}
+
+    def _count(self):
+        self.server.requests.append((self.command, self.path.split("?")[0]))
+        self.server.connections.add(self.client_address)
+
+    def do_GET(self):
+        self._count()
+        query = parse_qs(urlparse(self.path).query)
+        jql = query["jql"][0]
+        labels = set(re.findall(r'"(sre-fingerprint-[0-9a-f]+)"', jql))
+        matches = [
+            {"key": key, "fields": {"labels": issue_labels}}
+            for key, issue_labels in self.server.issues.items()
+            if labels.intersection(issue_labels)
+        ]
+        matches.reverse()
+        start = int(query.get("startAt", ["0"])[0])
+        page = matches[start : start + int(query.get("maxResults", ["50"])[0])]
+        self._reply(200, {"issues": page, "startAt": start, "total": len(matches)})
+
+    def do_POST(self):
+        self._count()
+        payload = self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.loads(payload)
+        if payload not in self.server.seen and len(self.server.seen) % 3 == 2:
+            self.server.seen.add(payload)
+            self.server.throttled += 1
+            self.send_response(429)
+            if self.server.throttled % 2:
+                self.send_header("Retry-After", "0.1")
+            else:
+                self.send_header("Retry-After", formatdate(time.time(), usegmt=True))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.seen.add(payload)
+        if self.path == "/rest/api/2/issue/bulk":
+            issues = [self._create(update["fields"]) for update in body["issueUpdates"]]
+            self._reply(201, {"issues": issues, "errors": []})
+        elif self.path.endswith("/comment"):
+            self.server.comments += 1
+            self._reply(201, {"id": str(self.server.comments)})
+        else:
+            self._reply(201, self._create(body["fields"]))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_jira():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubJira)
+    server.requests: List[tuple] = []
+    server.connections = set()
+    server.seen = set()
+    server.throttled = 0
+    server.comments = 0
+    # Key -> labels of the issues created
+    server.issues: Dict[str, List[str]] = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tool(stub_jira):
+    tool = CreateJiraTicketTool()
+    tool.jira_base_url = f"http://127.0.0.1:{stub_jira.server_port}"
+    tool.jira_email = "sre-agent@example.com"
+    tool.jira_api_token = "token"
+    tool.jira_project_name = "OPS"
+    return tool
+
+
+def _tickets(count: int) -> List[dict]:
+    return [
+        {
+            "summary": f"Storm ticket {number}",
+            "description": f"{number}x Load test\nFingerprint: {number:016x}",
+        }
+        for number in range(count)
+    ]
+
+
+def _run(tool: CreateJiraTicketTool, coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await tool.aclose()
+
+    return asyncio.run(run())
+
+
+def test_bulk_create_retries_throttled_requests(tool, stub_jira):
+    results = _run(tool, tool.acreate_many(_tickets(120)))
+
+    assert all(result.startswith("Successfully created") for result in results)
+    assert len(stub_jira.issues) == 120
+    # 50 issues per bulk request, each sent again once if it was throttled
+    bulk = stub_jira.requests.count(("POST", "/rest/api/2/issue/bulk"))
+    assert bulk == 3 + stub_jira.throttled
+    assert stub_jira.throttled > 0
+
+
+def test_connections_are_pooled(tool, stub_jira):
+    async def storm():
+        return await asyncio.gather(*(tool._arun(ticket) for ticket in _tickets(40)))
+
+    results = _run(tool, storm())
+
+    assert all(result.startswith("Successfully created") for result in results)
+    assert len(stub_jira.requests) > jira.JIRA_MAX_CONCURRENCY
+    assert len(stub_jira.connections) <= jira.JIRA_MAX_CONCURRENCY
+
+
+def test_recurrences_are_commented_on_the_open_ticket(tool, stub_jira):
+    tickets = _tickets(10)
+    _run(tool, tool.acreate_many(tickets))
+    requests, throttled = len(stub_jira.requests), stub_jira.throttled
+
+    results = _run(tool, tool.acreate_many(tickets + tickets))
+
+    assert len(stub_jira.issues) == 10
+    assert stub_jira.comments == 10
+    assert all("already open" in result for result in results)
+    # Open tickets are cached: only the comments (and their retries) are sent
+    retries = stub_jira.throttled - throttled
+    assert len(stub_jira.requests) - requests == 10 + retries
+
+
+def test_tickets_of_a_new_error_make_one_issue(tool, stub_jira):
+    tickets = _tickets(3)
+    duplicate = dict(tickets[0], description=f"Again\n{tickets[0]['description']}")
+
+    results = _run(tool, tool.acreate_many([tickets[0], duplicate, *tickets[1:]]))
+
+    assert len(stub_jira.issues) == 3
+    assert results[0] == results[1]
+    assert all(result.startswith("Successfully created") for result in results)
+
+
+def test_open_tickets_are_paged_through(tool, stub_jira, monkeypatch):
+    monkeypatch.setattr(jira, "_SEARCH_PAGE_SIZE", 2)
+    stub_jira.issues.update(
+        (f"OLD-{number}", [f"sre-fingerprint-{0:016x}"]) for number in range(5)
+    )
+    stub_jira.issues["OLD-5"] = [f"sre-fingerprint-{1:016x}"]
+
+    results = _run(tool, tool.acreate_many(_tickets(3)))
+
+    assert "OLD-4" in results[0]
+    assert "OLD-5" in results[1]
+    assert results[2].startswith("Successfully created")
+    searches = stub_jira.requests.count(("GET", "/rest/api/2/search"))
+    assert searches == 3
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, 2.0),
+        ("3", 3.0),
+        ("-1", 0.0),
+        (formatdate(time.time() - 60, usegmt=True), 0.0),
+        ("not a date", 2.0),
+    ],
+)
+def test_retry_after(value, expected):
+    headers = {"Retry-After": value} if value is not None else {}
+    response = httpx.Response(429, headers=headers)
+
+    assert jira._retry_after(response, 2.0) == expected
+
+
+def test_retry_after_http_date():
+    response = httpx.Response(
+        503, headers={"Retry-After": formatdate(time.time() + 30, usegmt=True)}
+    )
+
+    assert 28 <= jira._retry_after(response, 2.0) <= 30
@@ -0,0 +1,63 @@
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from utils.latency import LatencyMonitor
+from utils.log_events import iter_events
+from utils.log_store import LogEventStore
+
+START = datetime(2025, 5, 1, 10, 0)
+
+
+def _request(at: datetime, endpoint: str, millis: float) -> str:
+    return (
+        f"[{at:%Y-%m-%d %H:%M:%S}.000] [INFO] [RequestID: 141e496c-6f90-4e69-9cd7-10fd536a631c] "
+        f"GET {endpoint} - User: alice - Session: s1 - IP: 10.0.0.1 - Status: 200 - "
+        f"Time: {millis:.1f}ms\n"
+    )
+
+
+def _minutes(first: int, last: int, slow_from: Optional[int] = None):
+    """Two requests per second to each endpoint, /api/auth slowing down from `slow_from`."""
+    random.seed(first)
+    for second in range(first * 60, last * 60):
+        at = START + timedelta(seconds=second)
+        slow = slow_from is not None and second >= slow_from * 60
+        for _ in range(2):
+            yield _request(at, "/api/auth", random.uniform(20, 40) * (3 if slow else 1))
+            yield _request(at, "/api/transfer", random.uniform(50, 80))
+
+
+def _monitor():
+    return LatencyMonitor(interval_seconds=60, recent=2, warmup=4, min_samples=30)
+
+
+def test_regressions_are_reported_as_their_intervals_close():
+    store = LogEventStore(retention=24 * 3600)
+    monitor = _monitor()
+    store.extend(iter_events(_minutes(0, 10)))
+    assert monitor.update(store) == []
+
+    store.extend(iter_events(_minutes(10, 13, slow_from=10)))
+    regressions = monitor.update(store)
+
+    # Intervals 10 and 11 closed, each time with a slow interval among the recent ones; the
+    # fingerprint is the same, so that the regression is reported once
+    assert len(regressions) == 2
+    assert {regression.fingerprint for regression in regressions} == {
+        regressions[0].fingerprint
+    }
+    regression = regressions[-1]
+    assert regression.template == "Response time regression on GET /api/auth"
+    assert regression.sample is None
+    assert regression.reason.startswith("p50 30")
+    assert regression.count == 240
+
+
+def test_steady_response_times_are_not_regressions():
+    store = LogEventStore(retention=24 * 3600)
+    monitor = _monitor()
+
+    store.extend(iter_events(_minutes(0, 20)))
+
+    assert monitor.update(store) == []
@@ -0,0 +1,114 @@
+import gzip
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import log_archive
+from utils.log_archive import CompressedLogArchive, open_archive
+from utils.log_events import iter_events
+from utils.log_scan import filter_events
+
+START = datetime(2025, 5, 1, 10, 0)
+
+
+def _lines(count: int, first: int = 0):
+    for number in range(first, first + count):
+        at = START + timedelta(seconds=number)
+        yield f"[{at:%Y-%m-%d %H:%M:%S}.000] [ERROR] Timeout {number}\n"
+        if number % 7 == 0:
+            yield '  File "/app/db.py", line 10, in run\n'
+
+
+@pytest.fixture(autouse=True)
+def small_reads(monkeypatch):
+    # Checkpoints are taken between reads: read small archives in many small chunks
+    monkeypatch.setattr(log_archive, "_READ_SIZE", 512)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    # Two gzip members, as `cat` of two rotated archives makes
+    path = tmp_path / "app.log.1.gz"
+    with open(path, "wb") as file:
+        file.write(gzip.compress("".join(_lines(3000)).encode()))
+        file.write(gzip.compress("".join(_lines(3000, 3000)).encode()))
+    return path
+
+
+def _window(archive, from_dt, to_dt):
+    return [
+        event.lines
+        for event in filter_events(
+            iter_events(archive.iter_lines(from_dt)), from_dt, to_dt
+        )
+    ]
+
+
+def _expected(from_dt, to_dt):
+    return [
+        event.lines
+        for event in filter_events(iter_events(_lines(6000)), from_dt, to_dt)
+    ]
+
+
+def test_windows_read_from_checkpoints_match_a_full_read(archive_path):
+    archive = CompressedLogArchive(archive_path, span=16 * 1024)
+    # The first read fills the index in
+    assert _window(archive, None, None) == _expected(None, None)
+    assert len(archive._keys) > 10
+
+    for offset in (0, 1, 59, 1500, 2999, 3000, 3001, 5990):
+        from_dt = START + timedelta(seconds=offset)
+        to_dt = from_dt + timedelta(seconds=30)
+        assert _window(archive, from_dt, to_dt) == _expected(from_dt, to_dt)
+
+
+def test_windows_start_from_the_preceding_checkpoint(archive_path):
+    archive = CompressedLogArchive(archive_path, span=16 * 1024)
+    list(archive.iter_lines())
+    from_dt = START + timedelta(seconds=4000)
+
+    start = archive._start(from_dt)
+
+    assert start.position > 0
+    assert start.key < log_archive.datetime_to_key(from_dt)
+    first = next(iter_events(archive.iter_lines(from_dt)))
+    assert first.key <= log_archive.datetime_to_key(from_dt)
+
+
+def test_checkpoints_are_thinned_out(archive_path, monkeypatch):
+    monkeypatch.setattr(log_archive, "_MAX_ARCHIVE_CHECKPOINTS", 8)
+    archive = CompressedLogArchive(archive_path, span=4 * 1024)
+
+    list(archive.iter_lines())
+
+    assert 4 <= len(archive._keys) <= 8
+    assert archive.span > 4 * 1024
+    assert archive._keys == sorted(archive._keys)
+    assert len(archive._checkpoints) == len(archive._keys) + 1
+    from_dt = START + timedelta(seconds=5000)
+    to_dt = from_dt + timedelta(seconds=60)
+    assert _window(archive, from_dt, to_dt) == _expected(from_dt, to_dt)
+
+
+def test_index_follows_renamed_archives(archive_path):
+    archive = open_archive(archive_path)
+    list(archive.iter_lines())
+    renamed = archive_path.with_name("app.log.2.gz")
+    archive_path.rename(renamed)
+
+    assert open_archive(renamed) is archive
+    assert archive.path == renamed
+
+
+def test_zstd_archives(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "app.log.1.zst"
+    path.write_bytes(
+        zstandard.ZstdCompressor().compress("".join(_lines(6000)).encode())
+    )
+    archive = open_archive(path)
+    from_dt = START + timedelta(seconds=2000)
+    to_dt = from_dt + timedelta(seconds=30)
+
+    assert _window(archive, from_dt, to_dt) == _expected(from_dt, to_dt)
@@ -0,0 +1,66 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import log_events
+from utils.log_events import datetime_to_key, iter_events, parse_header
+
+
+def test_header_keys_match_the_logged_time():
+    random.seed(0)
+    clock = datetime(2024, 2, 28, 23, 59)
+    for _ in range(2000):
+        clock += timedelta(seconds=random.uniform(0.1, 4000.0))
+        clock = clock.replace(microsecond=clock.microsecond // 1000 * 1000)
+        line = f"[{clock:%Y-%m-%d %H:%M:%S.%f}"[:24] + "] [ERROR] Timeout\n"
+
+        assert parse_header(line) == (datetime_to_key(clock), "ERROR")
+
+
+def test_header_keys_do_not_depend_on_the_cache():
+    line = "[2025-05-01 10:00:00.250] [INFO] Started\n"
+    first = parse_header(line)
+    log_events._day_keys.clear()
+
+    assert parse_header(line) == first
+    assert log_events._day_keys
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        # Shorter fractions and other levels go through the slower path
+        (
+            "[2025-05-01 10:00:00.25] [WARNING] Slow\n",
+            (datetime_to_key(datetime(2025, 5, 1, 10, 0, 0, 250000)), "WARNING"),
+        ),
+        (
+            "[2025-05-01 10:00:00.250] [AUDIT] Login\n",
+            (datetime_to_key(datetime(2025, 5, 1, 10, 0, 0, 250000)), "AUDIT"),
+        ),
+        # Not timestamps: continuation lines
+        ("[2025-02-30 10:00:00.000] [ERROR] Timeout\n", None),
+        ("[2025-W18-4 10:00:00.000] [ERROR] Timeout\n", None),
+        ("[2025-05-01 24:00:00.000] [ERROR] Timeout\n", None),
+        ("[2025-05-01 10:60:00.000] [ERROR] Timeout\n", None),
+        ('  File "/app/db.py", line 10, in run\n', None),
+    ],
+)
+def test_parse_header(line, expected):
+    assert parse_header(line) == expected
+
+
+def test_continuation_lines_belong_to_the_previous_record():
+    events = list(
+        iter_events(
+            [
+                "[2025-05-01 10:00:00.000] [ERROR] Unhandled exception\n",
+                '  File "/app/db.py", line 10, in run\n',
+                "[2025-05-01 10:00:01.000] [INFO] Recovered\n",
+            ]
+        )
+    )
+
+    assert [len(event.lines) for event in events] == [2, 1]
+    assert [event.level for event in events] == ["ERROR", "INFO"]
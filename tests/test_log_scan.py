@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import log_scan
+from utils.compaction import LogCompactor
+from utils.log_events import iter_events
+from utils.log_scan import filter_events, iter_mapped_events, scan_parallel
+
+START = datetime(2025, 5, 1, 10, 0)
+MESSAGES = [
+    "Database connection lost",
+    "Timeout after {number}ms",
+    "Payment {number} declined",
+    "Cache miss storm",
+]
+
+
+@pytest.fixture(scope="module")
+def log_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("logs") / "app.log"
+    lines = []
+    for number in range(4000):
+        at = START + timedelta(milliseconds=900 * number)
+        message = MESSAGES[number % 7 % len(MESSAGES)].format(number=number)
+        level = "ERROR" if number % 3 else "INFO"
+        lines.append(
+            f"[{at:%Y-%m-%d %H:%M:%S}.{at.microsecond // 1000:03d}] [{level}] {message}\n"
+        )
+        if number % 11 == 0:
+            lines.append("Traceback (most recent call last):\n")
+            lines.append(
+                f'  File "/app/module_{number % 13}.py", line {number}, in run\n'
+            )
+            lines.append("    run()\n")
+    path.write_text("".join(lines))
+    return path
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    """Scan any window in small ranges with two worker processes."""
+    monkeypatch.setattr(log_scan, "LOG_SCAN_WORKERS", 2)
+    monkeypatch.setattr(log_scan, "LOG_SCAN_PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(log_scan, "_SCAN_BLOCK_BYTES", 8 * 1024)
+    yield
+    log_scan.shutdown_scan_pool()
+
+
+def _state(compactor):
+    return (
+        compactor.render(),
+        compactor.folded_records,
+        compactor.omitted_records,
+        compactor.omitted_lines,
+    )
+
+
+def test_mapped_scan_matches_a_plain_read(log_path):
+    from_dt, to_dt = START + timedelta(minutes=10), START + timedelta(minutes=20)
+    with open(log_path) as file:
+        expected = [
+            event.lines for event in filter_events(iter_events(file), from_dt, to_dt)
+        ]
+
+    events = [event.lines for event in iter_mapped_events(log_path, 0, from_dt, to_dt)]
+
+    assert events == expected
+    assert events[0][0].startswith("[2025-05-01 10:10:00")
+
+
+@pytest.mark.parametrize(
+    "limits",
+    [(100_000, None, None, None), (100_000, 3, None, None), (300, None, None, None)],
+)
+@pytest.mark.parametrize(
+    "window",
+    [(None, None), (START + timedelta(minutes=7), START + timedelta(minutes=50))],
+)
+def test_parallel_scan_matches_the_serial_scan(log_path, parallel, limits, window):
+    serial = LogCompactor(*limits)
+    for event in iter_mapped_events(log_path, 0, *window):
+        serial.add(event)
+
+    compactor = LogCompactor(*limits)
+    assert scan_parallel(log_path, 0, *window, compactor)
+
+    assert _state(compactor) == _state(serial)
+    # The limited outputs are cut
+    assert bool(compactor.omitted_records) == (limits != (100_000, None, None, None))
+
+
+def test_small_windows_are_left_to_the_serial_scan(log_path, monkeypatch):
+    monkeypatch.setattr(log_scan, "LOG_SCAN_WORKERS", 2)
+    window = (START, START + timedelta(seconds=10))
+
+    assert not scan_parallel(log_path, 0, *window, LogCompactor(1000))
+
+
+def test_parallel_scans_can_be_turned_off(log_path, monkeypatch):
+    monkeypatch.setattr(log_scan, "LOG_SCAN_WORKERS", 1)
+    monkeypatch.setattr(log_scan, "LOG_SCAN_PARALLEL_MIN_BYTES", 0)
+
+    assert not scan_parallel(log_path, 0, None, None, LogCompactor(1000))
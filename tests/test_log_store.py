@@ -0,0 +1,55 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from utils.log_events import iter_events
+from utils.log_store import LogEventStore
+
+LINES = [
+    "[2025-05-01 10:00:00.250] [ERROR] [RequestID: 141e496c-6f90-4e69-9cd7-10fd536a631c] "
+    "GET /api/auth - User: alice - Session: s1 - IP: 10.0.0.1 - Status: 500 - Time: 12.5ms\n",
+    "[2025-05-01 10:30:00.000] [INFO] [RequestID: 241e496c-6f90-4e69-9cd7-10fd536a631c] "
+    "GET /api/auth - User: alice - Session: s1 - IP: 10.0.0.1 - Status: 200 - Time: 3.0ms\n",
+    "[2025-05-01 12:00:00.000] [INFO] [RequestID: 341e496c-6f90-4e69-9cd7-10fd536a631c] "
+    "GET /api/auth - User: alice - Session: s1 - IP: 10.0.0.1 - Status: 200 - Time: 4.0ms\n",
+]
+
+
+@pytest.fixture
+def pacific_time(monkeypatch):
+    """Run in a timezone away from UTC, where epoch/local conversions would show."""
+    monkeypatch.setenv("TZ", "America/Los_Angeles")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_columns_keep_the_logged_wall_clock_time(pacific_time):
+    store = LogEventStore(retention=24 * 3600)
+    store.extend(iter_events(LINES))
+
+    columns = store._columns(1)
+
+    assert columns["timestamp"] == [datetime(2025, 5, 1, 10, 0, 0, 250000)]
+    assert columns["status"] == [500]
+    assert columns["endpoint"] == ["/api/auth"]
+
+
+def test_spilled_rows_round_trip(pacific_time, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    store = LogEventStore(retention=3600, spill_dir=tmp_path)
+
+    # The last record pushes the first two past the retention
+    store.extend(iter_events(LINES))
+
+    assert len(store) == 1
+    (path,) = tmp_path.glob("events-*.parquet")
+    table = parquet.read_table(path).to_pydict()
+    assert table["timestamp"] == [
+        datetime(2025, 5, 1, 10, 0, 0, 250000),
+        datetime(2025, 5, 1, 10, 30),
+    ]
+    assert table["request_id"][0] == "141e496c-6f90-4e69-9cd7-10fd536a631c"
+    assert table["response_ms"] == [12.5, 3.0]
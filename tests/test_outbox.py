@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.outbox import Outbox, _TokenBucket
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db", workers=2, batch_size=50, rate=20)
+    yield outbox
+    outbox.close()
+
+
+def _rows(outbox):
+    return outbox._conn.execute(
+        "SELECT idempotency_key, payload, status FROM outbox ORDER BY id"
+    ).fetchall()
+
+
+def test_queued_actions_get_the_newer_payload(outbox):
+    first = outbox.enqueue("ticket", {"summary": "Disk full"}, key="fp-1")
+    again = outbox.enqueue("ticket", {"summary": "Disk full (x2)"}, key="fp-1")
+
+    assert again == first
+    assert _rows(outbox) == [("fp-1", '{"summary": "Disk full (x2)"}', "pending")]
+
+
+def test_actions_in_flight_are_left_alone(outbox):
+    outbox.enqueue("ticket", {"summary": "Disk full"}, key="fp-1")
+    (claimed,) = outbox._claim(10)
+
+    outbox.enqueue("ticket", {"summary": "Disk full (x2)"}, key="fp-1")
+
+    assert _rows(outbox) == [("fp-1", '{"summary": "Disk full"}', "in_flight")]
+    outbox._finish([claimed], [(True, "OPS-1")])
+    # Finished: queued again, with the new payload
+    outbox.enqueue("ticket", {"summary": "Disk full (x3)"}, key="fp-1")
+    assert _rows(outbox) == [("fp-1", '{"summary": "Disk full (x3)"}', "pending")]
+
+
+def test_failed_actions_are_retried_then_given_up(outbox):
+    outbox.max_attempts = 2
+    outbox.backoff = 0
+    outbox.enqueue("ticket", {"summary": "Disk full"})
+
+    for _ in range(2):
+        actions = outbox._claim(10)
+        outbox._finish(actions, [(False, "HTTP 503")] * len(actions))
+
+    assert [row[2] for row in _rows(outbox)] == ["failed"]
+    assert outbox.pending() == 0
+
+
+def test_unfinished_actions_are_replayed_on_restart(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db")
+    outbox.enqueue("ticket", {"summary": "Disk full"})
+    outbox._claim(10)
+    outbox.close()
+
+    restarted = Outbox(tmp_path / "outbox.db")
+
+    assert [row[2] for row in _rows(restarted)] == ["pending"]
+    restarted.close()
+
+
+def test_delivery_rate_is_capped(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db", workers=2, batch_size=50, rate=20)
+    batches = []
+
+    async def create(payloads):
+        batches.append((time.monotonic(), len(payloads)))
+        return [(True, "OPS-1")] * len(payloads)
+
+    async def run():
+        outbox.register("ticket", create)
+        for number in range(60):
+            outbox.enqueue("ticket", {"number": number})
+        worker = asyncio.create_task(outbox.run())
+        while outbox.pending():
+            await asyncio.sleep(0.05)
+        worker.cancel()
+
+    start = time.monotonic()
+    asyncio.run(run())
+    outbox.close()
+
+    assert sum(size for _, size in batches) == 60
+    # A full bucket (one second's worth), then 20 per second
+    assert max(size for _, size in batches) <= 20
+    assert time.monotonic() - start >= 1.9
+    for at, _ in batches:
+        sent = sum(size for other, size in batches if other <= at)
+        assert sent <= 20 + 20 * (at - start) + 1
+
+
+def test_token_bucket_hands_out_what_is_available():
+    async def run():
+        bucket = _TokenBucket(rate=10, burst=10)
+        assert await bucket.take(50) == 10
+        started = time.monotonic()
+        assert await bucket.take(50) >= 1
+        waited = time.monotonic() - started
+        bucket.give_back(100)
+        return waited, bucket._tokens
+
+    waited, tokens = asyncio.run(run())
+
+    assert 0.08 <= waited < 0.5
+    assert tokens == 10
+
+
+def test_unlimited_rate():
+    assert asyncio.run(_TokenBucket(rate=0, burst=1).take(50)) == 50
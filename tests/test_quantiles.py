@@ -0,0 +1,64 @@
+import math
+import random
+
+import pytest
+
+from utils.quantiles import DDSketch
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.fixture
+def values():
+    random.seed(0)
+    # Response times: mostly fast, with a long tail
+    return [random.lognormvariate(3, 1.2) for _ in range(20000)]
+
+
+@pytest.mark.parametrize("q", [0.01, 0.5, 0.9, 0.95, 0.99, 0.999])
+def test_quantiles_are_within_the_relative_accuracy(values, q):
+    sketch = DDSketch(accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.quantile(q) == pytest.approx(_exact(values, q), rel=0.01)
+
+
+def test_merged_sketches_equal_a_single_sketch(values):
+    single = DDSketch()
+    parts = [DDSketch() for _ in range(7)]
+    for number, value in enumerate(values):
+        single.add(value)
+        parts[number % 7].add(value)
+
+    merged = DDSketch.merged(parts)
+
+    assert merged.count == single.count
+    assert merged.bins == single.bins
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == single.quantile(q)
+
+
+def test_bins_are_bounded_at_the_cost_of_the_lowest_quantiles(values):
+    sketch = DDSketch(accuracy=0.01, max_bins=64)
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch.bins) <= 64
+    assert sketch.quantile(0.99) == pytest.approx(_exact(values, 0.99), rel=0.01)
+    assert sketch.quantile(0.5) > _exact(values, 0.5) * 1.02
+
+
+def test_zero_and_empty():
+    sketch = DDSketch()
+    assert math.isnan(sketch.quantile(0.5))
+
+    sketch.add(0.0, count=3)
+    sketch.add(10.0)
+
+    assert len(sketch) == 4
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(10.0, rel=0.01)
@@ -0,0 +1,178 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.roster import OncallEmployee, OncallRoster, Shift, load_roster
+
+ICS = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+SUMMARY:Alice Johnson
+ATTENDEE;CN=Alice Johnson:mailto:alice@example.com
+CATEGORIES:Infrastructure
+X-ROLE:Senior SRE
+DTSTART:20250505T070000Z
+DTEND:20250505T150000Z
+RRULE:FREQ=WEEKLY;COUNT=4
+END:VEVENT
+BEGIN:VEVENT
+SUMMARY:Bob Smith
+ATTENDEE:mailto:bob@example.com
+CATEGORIES:Platform
+X-ROLE:DevOps Engineer
+DTSTART;TZID=Europe/Paris:20250505T090000
+DTEND;TZID=Europe/Paris:20250505T170000
+RRULE:FREQ=DAILY;UNTIL=20250510T000000Z
+END:VEVENT
+BEGIN:VEVENT
+SUMMARY:Carol Davis
+ATTENDEE:mailto:carol@example.com
+CATEGORIES:Platform
+X-ROLE:SRE Manager
+DTSTART:20250505T090000
+DTEND:20250505T170000
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+@pytest.fixture
+def pacific_time(monkeypatch):
+    """Run in a timezone away from UTC and Paris, where conversions would show."""
+    monkeypatch.setenv("TZ", "America/Los_Angeles")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _write(path, text):
+    path.write_text(text)
+    return path
+
+
+def test_ics_times_are_read_as_local_wall_clock_time(pacific_time, tmp_path):
+    alice, bob, carol = load_roster(_write(tmp_path / "roster.ics", ICS))
+
+    # UTC, with the rotation and the UTC end of the rule
+    assert alice.shifts == (
+        Shift(
+            datetime(2025, 5, 5, 0),
+            datetime(2025, 5, 5, 8),
+            every=timedelta(weeks=1),
+            count=4,
+        ),
+    )
+    # Paris (UTC+2 in May) is 9 hours ahead
+    assert bob.shifts[0].start == datetime(2025, 5, 5, 0)
+    assert bob.shifts[0].end == datetime(2025, 5, 5, 8)
+    assert bob.shifts[0].until == datetime(2025, 5, 9, 17)
+    # Floating times are taken as they are
+    assert carol.shifts[0].start == datetime(2025, 5, 5, 9)
+    assert (alice.email, alice.team, alice.role) == (
+        "alice@example.com",
+        "Infrastructure",
+        "Senior SRE",
+    )
+
+
+def test_unknown_ics_time_zones_are_read_as_local_time(tmp_path):
+    text = ICS.replace("TZID=Europe/Paris", "TZID=Mars/Olympus_Mons")
+
+    _, bob, _ = load_roster(_write(tmp_path / "roster.ics", text))
+
+    assert bob.shifts[0].start == datetime(2025, 5, 5, 9)
+
+
+def test_rotations(pacific_time, tmp_path):
+    roster = OncallRoster(path=_write(tmp_path / "roster.ics", ICS))
+
+    def names(at, team=None):
+        return [employee.name for employee in roster.on_call(team, at)]
+
+    assert names(datetime(2025, 5, 5, 1)) == ["Alice Johnson", "Bob Smith"]
+    assert names(datetime(2025, 5, 5, 10), "platform") == ["Carol Davis"]
+    # Bob's daily shift, until the rule ends
+    assert names(datetime(2025, 5, 9, 7), "Platform") == ["Bob Smith"]
+    assert names(datetime(2025, 5, 10, 7), "Platform") == []
+    # Alice's weekly shift, 4 times
+    assert names(datetime(2025, 5, 26, 7), "Infrastructure") == ["Alice Johnson"]
+    assert names(datetime(2025, 6, 2, 7), "Infrastructure") == []
+
+
+def test_lookups_by_role(tmp_path):
+    roster = OncallRoster(path=_write(tmp_path / "roster.ics", ICS))
+
+    assert [employee.name for employee in roster.by_role("sre manager")] == [
+        "Carol Davis"
+    ]
+    at = datetime(2025, 5, 5, 12)
+    assert roster.on_call("Platform", at, role="SRE Manager")[0].name == "Carol Davis"
+    assert roster.on_call("Infrastructure", at, role="SRE Manager") == []
+
+
+def test_responses_are_cached_until_the_next_shift_change():
+    shift = Shift(datetime(2025, 5, 5, 9), datetime(2025, 5, 5, 17))
+    roster = OncallRoster(
+        [
+            OncallEmployee("Alice", "alice@example.com", "SRE", "Infra"),
+            OncallEmployee("Bob", "bob@example.com", "SRE", "Infra", (shift,)),
+        ]
+    )
+
+    before = roster.format("infra", datetime(2025, 5, 5, 8))
+    assert "Bob" not in before
+    assert roster.format("infra", datetime(2025, 5, 5, 8, 59)) is before
+    during = roster.format("infra", datetime(2025, 5, 5, 9))
+    assert "Bob" in during
+    assert roster.format("Infra", datetime(2025, 5, 5, 16)) is during
+    assert "Bob" not in roster.format("infra", datetime(2025, 5, 5, 17))
+    assert roster.format("Nobody", datetime(2025, 5, 5, 17)).startswith(
+        "No on-call employees found"
+    )
+
+
+def test_roster_file_is_reloaded_when_it_changes(tmp_path):
+    path = tmp_path / "roster.json"
+    employee = {"name": "Alice", "email": "a@example.com", "role": "SRE"}
+    path.write_text(json.dumps([dict(employee, team="Infra")]))
+    roster = OncallRoster(path=path, check_interval=0)
+    assert roster.teams == ["Infra"]
+
+    path.write_text(json.dumps({"employees": [dict(employee, team="Platform")]}))
+    os.utime(path, ns=(0, time.time_ns() + 10**9))
+
+    assert roster.has_team("platform")
+    assert roster.teams == ["Platform"]
+    assert roster.on_call("Platform")[0].name == "Alice"
+
+    # An invalid file keeps the previous roster
+    path.write_text("{")
+    os.utime(path, ns=(0, time.time_ns() + 2 * 10**9))
+    assert roster.has_team("platform")
+
+
+def test_yaml_roster(tmp_path):
+    pytest.importorskip("yaml")
+    path = _write(
+        tmp_path / "roster.yaml",
+        """employees:
+  - name: Alice
+    email: a@example.com
+    role: SRE
+    team: Infra
+    shifts:
+      - start: 2025-05-05T09:00:00
+        end: 2025-05-05T17:00:00
+        rotation_days: 14
+        count: 2
+""",
+    )
+
+    (alice,) = load_roster(path)
+
+    assert alice.on_call(datetime(2025, 5, 19, 10))
+    assert not alice.on_call(datetime(2025, 5, 12, 10))
+    assert not alice.on_call(datetime(2025, 6, 2, 10))
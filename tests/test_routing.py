@@ -0,0 +1,106 @@
+import pytest
+
+from utils.fingerprint import group_incidents
+from utils.log_events import iter_events
+from utils.roster import OncallEmployee, OncallRoster
+from utils.routing import DEFAULT_RULES, TeamRouter, load_rules
+
+ROSTER = OncallRoster(
+    [
+        OncallEmployee("Alice", "alice@example.com", "SRE", "Infrastructure"),
+        OncallEmployee("Dave", "dave@example.com", "Backend Engineer", "API Services"),
+        OncallEmployee("Eva", "eva@example.com", "DBA", "Data Platform"),
+    ]
+)
+
+
+def _incident(*lines):
+    (incident,) = group_incidents(
+        iter_events([f"[2025-05-01 10:00:00.000] [ERROR] {lines[0]}\n", *lines[1:]])
+    )
+    return incident
+
+
+@pytest.fixture
+def router():
+    return TeamRouter(DEFAULT_RULES, ROSTER)
+
+
+def test_exceptions_win_over_components(router):
+    incident = _incident(
+        "[APIGateway] [gw-01] [PID:12] Upstream call failed\n",
+        "Traceback (most recent call last):\n",
+        '  File "/app/db.py", line 10, in run\n',
+        "DatabaseConnectionError: connection refused\n",
+    )
+
+    route = router.route(incident)
+
+    assert route.team == "Data Platform"
+    assert route.assignee.name == "Eva"
+    assert route.rule == "exception DatabaseConnectionError"
+
+
+def test_components_win_over_endpoints(router):
+    route = router.route(
+        _incident("[CacheService] [cache-01] [PID:7] GET /api/auth slow\n")
+    )
+
+    assert (route.team, route.rule) == ("Infrastructure", "component CacheService")
+
+
+def test_longest_endpoint_prefix_wins():
+    rules = {"endpoints": {"/api": "API Services", "/api/payments": "Data Platform"}}
+    router = TeamRouter(rules, ROSTER)
+
+    assert router.route(_incident("GET /api/payments/42 - Status: 500\n")).team == (
+        "Data Platform"
+    )
+    assert router.route(_incident("GET /api/auth - Status: 500\n")).team == (
+        "API Services"
+    )
+    # Prefixes match whole path segments only
+    assert router.route(_incident("GET /apiv2/auth - Status: 500\n")) is None
+
+
+def test_keywords_match_whole_words(router):
+    assert router.route(_incident("MyDatabasePoolWrapper exploded\n")) is None
+
+
+def test_rules_naming_unknown_teams_are_skipped():
+    rules = {
+        "exceptions": {"MemoryError": "Nobody"},
+        "components": {"AuthService": "API Services"},
+    }
+    router = TeamRouter(rules, ROSTER)
+
+    route = router.route(
+        _incident("[AuthService] [auth-01] [PID:3] Out of memory\n", "MemoryError\n")
+    )
+
+    assert (route.team, route.rule) == ("API Services", "component AuthService")
+
+
+def test_nobody_on_call_is_described():
+    roster = OncallRoster(
+        [OncallEmployee("Carol", "carol@example.com", "SRE", "Reliability", ())]
+    )
+    router = TeamRouter(
+        {"exceptions": {"CircuitBreakerOpenError": "Reliability"}}, roster
+    )
+    route = router.route(_incident("CircuitBreakerOpenError: open\n"))
+
+    assert TeamRouter.describe(route) == (
+        " [Owner: Reliability, assignee: Carol <carol@example.com>]"
+    )
+    assert TeamRouter.describe(route._replace(assignee=None)) == (
+        " [Owner: Reliability, nobody on call]"
+    )
+    assert TeamRouter.describe(None) == ""
+
+
+def test_rules_files(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"endpoints": {"/api": "API Services"}}')
+
+    assert load_rules(path) == {"endpoints": {"/api": "API Services"}}
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tools import file as file_module
+from tools.file import LogFileReader
+from utils.log_scan import filter_events
+
+
+def _record(at: datetime, message: str) -> str:
+    return f"[{at:%Y-%m-%d %H:%M:%S.%f}"[:24] + f"] [ERROR] {message}\n"
+
+
+class Monitor:
+    """Polls a log file the way `monitor_logs` does, writing records logged just before each poll."""
+
+    def __init__(self, path):
+        self.path = path
+        self.path.write_text("")
+        self.reader = LogFileReader(path)
+        self.last_check_time = datetime.now() - timedelta(minutes=5)
+        self.records = 0
+        self.logged_at = self.last_check_time
+
+    def log(self, count: int, traceback: bool = False):
+        # In time order, and up to now
+        at = max(self.logged_at, datetime.now() - timedelta(milliseconds=count))
+        with self.path.open("a") as log:
+            for _ in range(count):
+                at += timedelta(milliseconds=1)
+                log.write(_record(at, f"Timeout {self.records:03d}"))
+                self.records += 1
+            if traceback:
+                log.write('  File "/app/db.py", line 10, in run\n')
+        self.logged_at = at
+
+    def poll(self):
+        """The window the monitor hands over to the agent, as `FilteredLogReaderTool` parses it."""
+        current_time = datetime.now()
+        list(self.reader.iter_new(since=self.last_check_time))
+        window = (
+            self.last_check_time.replace(microsecond=0),
+            current_time.replace(microsecond=0),
+        )
+        self.last_check_time = current_time
+        return window
+
+
+def _messages(events):
+    return [event.header for event in events]
+
+
+def test_monitor_windows_are_served_from_the_buffer(tmp_path):
+    monitor = Monitor(tmp_path / "app.log")
+    windows = []
+    for _ in range(12):
+        monitor.log(5)
+        windows.append(monitor.poll())
+
+    for from_dt, to_dt in windows:
+        tail = monitor.reader.tail
+        assert tail.covers(from_dt, to_dt)
+        assert _messages(filter_events(tail.events, from_dt, to_dt)) == _messages(
+            monitor.reader.iter_file(from_dt, to_dt)
+        )
+
+
+def test_held_record_is_buffered_as_read(tmp_path):
+    monitor = Monitor(tmp_path / "app.log")
+    monitor.log(3, traceback=True)
+    from_dt, to_dt = monitor.poll()
+
+    # The last record may still be being written: what was read of it is served
+    assert monitor.reader.has_partial_record
+    tail = monitor.reader.tail
+    assert tail.covers(from_dt, to_dt)
+    assert [len(event.lines) for event in tail.events] == [1, 1, 2]
+
+    # The next poll hands it over whole, without buffering it twice
+    with monitor.path.open("a") as log:
+        log.write("    db.connect()\n")
+    monitor.poll()
+    monitor.poll()
+
+    assert not monitor.reader.has_partial_record
+    tail = monitor.reader.tail
+    assert [len(event.lines) for event in tail.events] == [1, 1, 3]
+    assert tail.size == sum(event.size for event in tail.events)
+    assert tail.covers(from_dt, to_dt)
+
+
+def test_oldest_events_are_dropped_over_the_limit(tmp_path, monkeypatch):
+    monitor = Monitor(tmp_path / "app.log")
+    monitor.log(10)
+    from_dt, to_dt = monitor.poll()
+    size = monitor.reader.tail.size
+    monkeypatch.setattr(file_module, "TAIL_BUFFER_MAX_BYTES", size)
+
+    monitor.log(4)
+    monitor.poll()
+
+    tail = monitor.reader.tail
+    assert tail.size <= size
+    assert len(tail.events) == 10
+    assert tail.events[0].header.endswith("Timeout 004\n")
+    assert not tail.covers(from_dt, to_dt)
+    assert tail.covers(_second_after(tail.events[0].key), to_dt)
+
+
+def _second_after(key: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(milliseconds=key - key % 1000 + 1000)
+
+
+@pytest.mark.parametrize("to_dt", [None, datetime(2999, 1, 1)])
+def test_open_or_future_windows_are_not_covered(tmp_path, to_dt):
+    monitor = Monitor(tmp_path / "app.log")
+    monitor.log(2)
+    monitor.poll()
+
+    assert not monitor.reader.tail.covers(None, to_dt)
@@ -1,18 +1,234 @@
-import re
+import asyncio
+import itertools
+import os
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 from langchain_core.tools.base import ArgsSchema
 from pydantic import BaseModel, Field
 
 from tools.base import AutoSreAgentBaseTool
+from utils.compaction import LogCompactor
+from utils.log_archive import COMPRESSED_SUFFIXES, open_archive
+from utils.log_events import LogEvent, datetime_to_key, iter_events
+from utils.log_index import SparseTimestampIndex
+from utils.log_scan import (
+    filter_events,
+    iter_mapped_events,
+    merge_events,
+    scan_parallel,
+)
+from utils.log_sources import LogSourceRegistry
+from utils.log_tail import LogTailCursor
 from utils.logger import logger
 
 LOG_FILE_PATH = Path(
     "/Users/suyog/personal/sreAgent/output/logs.log"
 )  # Default system log on macOS
 
+# Upper bound on the recent events kept in memory; windows starting before them are read through the index
+TAIL_BUFFER_MAX_BYTES = 8 * 1024 * 1024
+
+
+class TailBuffer(NamedTuple):
+    """
+    Events read by the recent polls, holding every record logged in the key range
+    [from_key, to_key): a None lower bound means since the top of the file, a None upper bound
+    that the buffer is unusable. Each poll replaces it as a whole, so a reader holding it sees
+    consistent events even while the next poll runs.
+    """
+
+    events: List[LogEvent]
+    from_key: Optional[int]
+    to_key: Optional[int]
+    # Bytes of the events, kept within TAIL_BUFFER_MAX_BYTES
+    size: int = 0
+
+    def covers(self, from_dt: Optional[datetime], to_dt: Optional[datetime]) -> bool:
+        """Whether the events contain everything logged in [from_dt, to_dt]."""
+        if (
+            self.to_key is None
+            or not to_dt
+            or datetime_to_key(to_dt) + 999 >= self.to_key
+        ):
+            return False
+        return self.from_key is None or bool(
+            from_dt and datetime_to_key(from_dt) >= self.from_key
+        )
+
+
+class LogFileReader:
+    """Tail cursor, timestamp index and buffer of the recent polls of one log file."""
+
+    def __init__(self, path: Path, offset: int = 0, inode: Optional[int] = None):
+        self.path = Path(path)
+        self.cursor = LogTailCursor(self.path, offset, inode)
+        self._index = SparseTimestampIndex(self.path)
+        # Windows may be scanned in a worker thread (see `FilteredLogReaderTool._arun`) while
+        # the monitor polls
+        self._index_lock = threading.Lock()
+        # Events read by the recent `iter_new` calls, read from worker threads as well
+        self.tail = TailBuffer([], None, None)
+        # Key right after the last record `iter_new` went past, None if it went past none
+        self._read_to_key: Optional[int] = None
+        # Lines of the last record read, held back until it is known to be complete
+        self._partial: Tuple[str, ...] = ()
+
+    @property
+    def has_partial_record(self) -> bool:
+        return bool(self._partial)
+
+    @property
+    def committed_offset(self) -> int:
+        """
+        Byte offset to persist: the start of the record held back, so that a restart reads it
+        again (exact unless the record contained bytes that are not valid UTF-8).
+        """
+        return max(self.cursor.offset - len("".join(self._partial).encode()), 0)
+
+    def indexed_offset(self, dt: datetime) -> int:
+        """Byte offset to start scanning from to see every entry logged at or after `dt`."""
+        with self._index_lock:
+            self._index.update()
+            return self._index.lookup(dt)
+
+    def iter_new(self, since: Optional[datetime] = None) -> Iterator[LogEvent]:
+        """
+        Stream the log events appended since the previous poll. On the first poll, `since` places
+        the cursor (through the index) and events logged before it are skipped; after that only the
+        byte cursor decides what is new, so late or out-of-order entries are never dropped.
+
+        The last record read is held back until the next poll, which either sees the record that
+        follows it or finds that nothing was appended in between: a traceback written across two
+        polls is still handed over whole. The events are also added to the tail buffer, which keeps
+        the most recent TAIL_BUFFER_MAX_BYTES of them, so that reading the windows of the last polls
+        (what the monitor hands over to the agent) doesn't have to rescan the file.
+
+        A poll reads everything logged up to the moment it runs: records logged later in that same
+        second are left to the next poll, the monitor's windows ending at its polls as well, so the
+        buffer is complete up to the end of the second of the poll. The record held back is
+        buffered as read so far, which is what reading the file at that moment would return, and
+        replaced by the whole record once the next poll hands it over.
+        """
+        now_key = datetime_to_key(datetime.now())
+        from_dt = None
+        if self.cursor.inode is None:
+            if since:
+                # Log timestamps are compared at second precision
+                from_dt = since.replace(microsecond=0)
+                # First poll: start from the indexed position of `since` rather than the top
+                self.cursor.offset = self.indexed_offset(from_dt)
+                self._read_to_key = datetime_to_key(from_dt)
+        position = (self.cursor.offset, self.cursor.inode)
+
+        tail = self.tail
+        if tail.to_key is None:
+            tail = TailBuffer([], self._read_to_key, None)
+        elif self._partial and tail.events and tail.events[-1].lines is self._partial:
+            # The held record, read again below
+            held = tail.events[-1]
+            tail = tail._replace(events=tail.events[:-1], size=tail.size - held.size)
+        new_events: List[LogEvent] = []
+
+        def handed_over(event: LogEvent) -> LogEvent:
+            new_events.append(event)
+            if event.key is not None and (
+                self._read_to_key is None or event.key >= self._read_to_key
+            ):
+                self._read_to_key = event.key + 1
+            return event
+
+        previous: Optional[LogEvent] = None
+        lines = itertools.chain(self._partial, self.cursor.read_new())
+        for event in filter_events(iter_events(lines, self.path.name), from_dt, None):
+            if previous is not None:
+                yield handed_over(previous)
+            previous = event
+
+        self._partial = ()
+        if previous is not None:
+            if (self.cursor.offset, self.cursor.inode) != position:
+                # Its continuation lines may still be being written
+                self._partial = previous.lines
+            else:
+                yield handed_over(previous)
+
+        if self._partial:
+            new_events.append(previous)
+        self.tail = self._trimmed_tail(
+            tail.events + new_events,
+            tail.from_key,
+            now_key - now_key % 1000 + 1000,
+            tail.size + sum(event.size for event in new_events),
+        )
+        logger.debug(
+            f"Tailed {len(new_events)} new log events from {self.path}, cursor at byte {self.cursor.offset}"
+        )
+
+    @staticmethod
+    def _trimmed_tail(
+        events: List[LogEvent], from_key: Optional[int], to_key: int, size: int
+    ) -> TailBuffer:
+        """The tail buffer of `events`, without the oldest ones past TAIL_BUFFER_MAX_BYTES."""
+        start = 0
+        while size > TAIL_BUFFER_MAX_BYTES and start < len(events):
+            event = events[start]
+            size -= event.size
+            start += 1
+            if event.key is not None and (from_key is None or event.key >= from_key):
+                # Only what was logged after it is left
+                from_key = event.key + 1
+        if start:
+            logger.debug(
+                f"Dropped the {start} oldest tailed events over {TAIL_BUFFER_MAX_BYTES} bytes"
+            )
+        return TailBuffer(events[start:], from_key, to_key, size)
+
+    def scan_window(
+        self,
+        from_dt: Optional[datetime],
+        to_dt: Optional[datetime],
+        compactor: LogCompactor,
+    ) -> bool:
+        """`scan_parallel` over the window of the file, False when it should be read with `iter_file`."""
+        if not self.path.exists():
+            return False
+        offset = self.indexed_offset(from_dt) if from_dt else 0
+        return scan_parallel(self.path, offset, from_dt, to_dt, compactor)
+
+    def iter_file(
+        self, from_dt: Optional[datetime], to_dt: Optional[datetime]
+    ) -> Iterator[LogEvent]:
+        """The events of the file logged in [from_dt, to_dt]."""
+        if not self.path.exists():
+            return
+        logger.debug(f"Scanning log file: {self.path}")
+        # Jump straight to the first checkpoint before from_time
+        offset = self.indexed_offset(from_dt) if from_dt else 0
+        yield from iter_mapped_events(self.path, offset, from_dt, to_dt)
+
+
+def _iter_rotated(
+    path: Path, from_dt: Optional[datetime], to_dt: Optional[datetime]
+) -> Iterator[LogEvent]:
+    """
+    The events of a rotated (no longer written) file inside the window. Compressed archives are
+    decompressed from their checkpoint preceding `from_dt`, and only up to `to_dt`.
+    """
+    if from_dt and datetime.fromtimestamp(path.stat().st_mtime) < from_dt:
+        # Last written before the window starts
+        return
+    if path.suffix in COMPRESSED_SUFFIXES:
+        archive = open_archive(path)
+        if archive is not None:
+            yield from filter_events(
+                iter_events(archive.iter_lines(from_dt), path.name), from_dt, to_dt
+            )
+        return
+    yield from iter_mapped_events(path, 0, from_dt, to_dt)
+
 
 class FilteredLogReaderInput(BaseModel):
     from_time: Optional[str] = Field(
@@ -24,43 +240,194 @@ class FilteredLogReaderInput(BaseModel):
 
 
 class FilteredLogReaderTool(AutoSreAgentBaseTool):
-    """Tool that reads and filters log entries by timestamp."""
+    """
+    Tool that reads and filters log entries by timestamp, across every file of its log sources.
+    Each file has its own tail cursor and index; their events are merged in time order.
+    """
 
     name: str = "filtered_log_reader"
     description: str = """
     Use this tool to read log entries filtered by timestamp.
     Provide 'from_time' and 'to_time' in the format 'YYYY-MM-DD HH:MM:SS'.
     If no timestamps are provided, returns the entire log entries.
+    When several log files are monitored, each entry is prefixed with its file name in brackets.
+    Repeated entries are shown once, prefixed with their count and first/last seen times.
+    Long results are truncated with a note on how many records were left out.
     """
     args_schema: ArgsSchema = FilteredLogReaderInput
     log_file_path: Path = Field(default=LOG_FILE_PATH)
+    # Limits on what a single call returns to the agent, whichever is hit first
+    max_output_bytes: int = int(os.environ.get("LOG_READER_MAX_BYTES", 32 * 1024))
+    max_output_lines: int = int(os.environ.get("LOG_READER_MAX_LINES", 500))
+    max_output_records: int = int(os.environ.get("LOG_READER_MAX_RECORDS", 100))
+    max_output_tokens: int = int(os.environ.get("LOG_READER_MAX_TOKENS", 4000))
 
-    def __init__(self, log_file_path: Path = LOG_FILE_PATH):
+    def __init__(
+        self,
+        log_file_path: Path = LOG_FILE_PATH,
+        sources: Optional[LogSourceRegistry] = None,
+        state_store=None,
+    ):
         super().__init__()
         self.log_file_path = log_file_path
+        self._sources = sources or LogSourceRegistry([str(log_file_path)])
+        # Optional `StateStore` the per-file cursors are restored from and saved to
+        self._state_store = state_store
+        # Replaced rather than updated, as it is iterated while tool calls running in worker
+        # threads may add readers
+        self._readers: Dict[Path, LogFileReader] = {}
+        self._readers_lock = threading.Lock()
+        self._refresh_readers()
         logger.debug(
-            f"FilteredLogReaderTool initialized with log path: {log_file_path}"
+            f"FilteredLogReaderTool initialized with log sources: {self._sources.patterns}"
         )
 
-    def _parse_timestamp_str(self, timestamp_str: str):
-        try:
-            return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            logger.warning(f"Failed to parse timestamp: {timestamp_str}")
-            return None
+    def _refresh_readers(self) -> List[LogFileReader]:
+        """Start tailing the files that appeared since the last call, resuming saved cursors."""
+        with self._readers_lock:
+            readers = dict(self._readers)
+            for path in self._sources.resolve():
+                if path in readers:
+                    continue
+                saved_cursor = self._state_store and self._state_store.get_cursor(path)
+                if saved_cursor:
+                    logger.info(f"Resuming {path} at byte {saved_cursor[0]}")
+                    readers[path] = LogFileReader(path, *saved_cursor)
+                else:
+                    logger.info(f"Tailing new log source {path}")
+                    readers[path] = LogFileReader(path)
+            self._readers = readers
+        return list(readers.values())
+
+    def save_cursors(self):
+        """Write every file's tail cursor to the state store; committing is up to the caller."""
+        if self._state_store is None:
+            return
+        for reader in self._readers.values():
+            self._state_store.set_cursor(
+                reader.path, reader.committed_offset, reader.cursor.inode
+            )
+
+    def _compact_window(
+        self,
+        readers: List[LogFileReader],
+        from_dt: Optional[datetime],
+        to_dt: Optional[datetime],
+    ) -> LogCompactor:
+        """
+        Compact the events logged in the window into what a single call returns (see
+        `LogCompactor`): repeats of an event already in the response are folded into it and don't
+        count against the output limits, and the rest of the window past them is only counted, so
+        memory and prompt size stay bounded. With several sources, each record is prefixed with
+        the name of the file it comes from.
+        """
+        compactor = LogCompactor(
+            self.max_output_tokens,
+            self.max_output_records,
+            self.max_output_lines,
+            self.max_output_bytes,
+        )
+        if len(readers) > 1:
+            for event in merge_events(self._window_streams(readers, from_dt, to_dt)):
+                compactor.add(event, event.source)
+            return compactor
+
+        # A single source can be scanned in parallel: its rotated files, which hold the start of
+        # the window, are added first and the file's own window is then merged in range order
+        reader = readers[0]
+        tail = reader.tail
+        if tail.covers(from_dt, to_dt):
+            logger.debug(
+                f"Serving the requested window of {reader.path} from the tailed events"
+            )
+            events = filter_events(tail.events, from_dt, to_dt)
+        else:
+            rotated_events = merge_events(
+                _iter_rotated(rotated, from_dt, to_dt)
+                for rotated in self._sources.rotated(reader.path)
+            )
+            for event in rotated_events:
+                compactor.add(event)
+            if reader.scan_window(from_dt, to_dt, compactor):
+                return compactor
+            events = reader.iter_file(from_dt, to_dt)
+        for event in events:
+            compactor.add(event)
+        return compactor
 
-    def _parse_timestamp(self, log_line: str) -> Optional[datetime]:
-        """Extract timestamp from log line."""
-        timestamp_match = re.match(
-            r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)\]", log_line
+    @staticmethod
+    def _render(compactor: LogCompactor) -> str:
+        """The compacted events, with a trailer reporting the records past the output limits."""
+        logger.debug(
+            f"Returning {len(compactor)} distinct log records (~{compactor.tokens} tokens), "
+            f"folded {compactor.folded_records} repeats, omitted {compactor.omitted_records} "
+            "over the output limits"
+        )
+        output = compactor.render()
+        if compactor.omitted_records:
+            output.append(
+                f"... [truncated: {compactor.omitted_records} more log records "
+                f"({compactor.omitted_lines} lines) omitted, request a narrower time window "
+                "to see them]\n"
+            )
+        return "".join(output)
+
+    def iter_new(self, since: Optional[datetime] = None) -> Iterator[LogEvent]:
+        """
+        Stream the log events appended to any source since the previous poll (on the first poll,
+        those logged at or after `since`), merged in time order. See `LogFileReader.iter_new`.
+        """
+        return merge_events(
+            reader.iter_new(since) for reader in self._refresh_readers()
+        )
+
+    def iter_window(
+        self, from_dt: Optional[datetime], to_dt: Optional[datetime]
+    ) -> Iterator[LogEvent]:
+        """Every event logged in [from_dt, to_dt] in any source, merged in time order and unbounded."""
+        return merge_events(
+            self._window_streams(self._refresh_readers(), from_dt, to_dt)
+        )
+
+    def _window_streams(
+        self,
+        readers: List[LogFileReader],
+        from_dt: Optional[datetime],
+        to_dt: Optional[datetime],
+    ) -> List[Iterable[LogEvent]]:
+        """
+        The events of each source in the window: from the recent polls if they cover the window,
+        otherwise from the file and from its rotated files.
+        """
+        streams: List[Iterable[LogEvent]] = []
+        for reader in readers:
+            # Taken once, as the monitor may replace it meanwhile
+            tail = reader.tail
+            if tail.covers(from_dt, to_dt):
+                logger.debug(
+                    f"Serving the requested window of {reader.path} from the tailed events"
+                )
+                streams.append(filter_events(tail.events, from_dt, to_dt))
+                continue
+            streams.append(reader.iter_file(from_dt, to_dt))
+            # Windows reaching back past a rotation continue in the rotated files
+            streams.extend(
+                _iter_rotated(rotated, from_dt, to_dt)
+                for rotated in self._sources.rotated(reader.path)
+            )
+        return streams
+
+    @property
+    def has_partial_records(self) -> bool:
+        """Whether a source holds back its last record, to be handed over by the next poll."""
+        return any(reader.has_partial_record for reader in self._readers.values())
+
+    def _tail_covers(
+        self, from_dt: Optional[datetime], to_dt: Optional[datetime]
+    ) -> bool:
+        return all(
+            reader.tail.covers(from_dt, to_dt) for reader in self._readers.values()
         )
-        if timestamp_match:
-            timestamp_str = timestamp_match.group(1)
-            # Remove milliseconds for easier parsing
-            timestamp_str = timestamp_str.split(".")[0]
-            return self._parse_timestamp_str(timestamp_str)
-        # logger.debug(f"No timestamp found in log line: {log_line[:50]}...")
-        return None
 
     def _run(self, ip: Union[str | dict]) -> str:
         """Read log entries filtered by timestamp."""
@@ -71,8 +438,9 @@ class FilteredLogReaderTool(AutoSreAgentBaseTool):
         )
 
         try:
-            if not self.log_file_path.exists():
-                logger.error(f"Log file not found at: {self.log_file_path}")
+            readers = self._refresh_readers()
+            if not any(reader.path.exists() for reader in readers):
+                logger.error(f"No log file found for: {self._sources.patterns}")
                 return "Log file not found."
 
             # Parse input timestamps if provided
@@ -95,54 +463,39 @@ class FilteredLogReaderTool(AutoSreAgentBaseTool):
                     logger.error(f"Invalid to_time format: {to_time}")
                     return "Invalid to_time format. Please use 'YYYY-MM-DD HH:MM:SS'"
 
-            # Read and filter the log file
-            logger.debug(f"Opening log file: {self.log_file_path}")
-            with open(self.log_file_path, "r") as file:
-                all_lines = file.readlines()
-                logger.debug(f"Read {len(all_lines)} lines from log file")
-
-                if not from_dt and not to_dt:
-                    # If no filtering, return all lines
-                    logger.debug("No time filtering applied, returning all log entries")
-                    return "".join(all_lines)
+            if not from_dt and not to_dt:
+                logger.debug("No time filtering applied, returning all log entries")
 
-                filtered_lines = []
-                added_lines = set()
-                for idx, line in enumerate(all_lines):
-                    line_dt = self._parse_timestamp(line)
+            output = self._render(self._compact_window(readers, from_dt, to_dt))
 
-                    if line_dt:
-                        if from_dt and line_dt < from_dt:
-                            continue
+            if not output:
+                logger.warning("No log entries found in the specified time range")
+                return "No log entries found in the specified time range."
 
-                        if to_dt and line_dt > to_dt:
-                            continue
-
-                    # if consecutive line is not in added_lines continue
-                    if added_lines and (idx - 1) not in added_lines:
-                        continue
-
-                    added_lines.add(idx)
-                    filtered_lines.append(line)
-
-                logger.debug(
-                    f"Filtered {len(filtered_lines)}/{len(all_lines)} log entries"
-                )
-
-                if not filtered_lines:
-                    logger.warning("No log entries found in the specified time range")
-                    return "No log entries found in the specified time range."
-
-                return "".join(filtered_lines)
+            return output
 
         except Exception as e:
             logger.exception(f"Error reading log file: {e}")
             return f"Error reading log file: {str(e)}"
 
-    async def _arun(self, **kwargs):
-        """Async implementation would go here."""
-        logger.warning("Async operation attempted but not implemented")
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, ip: Union[str | dict]) -> str:
+        """
+        Windows covered by the recent polls are served from memory right away; anything that has to
+        be read from the files is read in a worker thread so the event loop keeps tailing.
+        """
+        parsed_input = self._input_parser(ip)
+        try:
+            from_dt, to_dt = (
+                datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value else None
+                for value in (parsed_input.from_time, parsed_input.to_time)
+            )
+        except ValueError:
+            # Let `_run` report the invalid format
+            return self._run(ip)
+
+        if self._tail_covers(from_dt, to_dt):
+            return self._run(ip)
+        return await asyncio.to_thread(self._run, ip)
 
 
 if __name__ == "__main__":
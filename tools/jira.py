@@ -1,12 +1,111 @@
+import asyncio
 import os
-from typing import Optional, Union
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
+import httpx
 from atlassian import Jira
 from langchain_core.tools.base import ArgsSchema
 from pydantic import BaseModel, Field
 
 from tools.base import AutoSreAgentBaseTool
 from utils.logger import logger
+from utils.outbox import Outbox
+from utils.state_store import StateStore
+
+# Tag the monitor asks the agent to end ticket descriptions with, see main._process_new_errors
+FINGERPRINT_PATTERN = re.compile(r"Fingerprint: ([0-9a-f]{16})")
+
+# Requests in flight to Jira at the same time, and retries of a request failing with a 429, a 5xx
+# or a connection error
+JIRA_MAX_CONCURRENCY = int(os.environ.get("JIRA_MAX_CONCURRENCY", 4))
+JIRA_MAX_RETRIES = int(os.environ.get("JIRA_MAX_RETRIES", 3))
+# Seconds before the first retry, doubled on every attempt unless Jira sends a Retry-After
+_RETRY_BACKOFF = 0.5
+# Issues Jira accepts in one bulk create request
+_BULK_SIZE = 50
+# Issues asked for per page of a JQL search
+_SEARCH_PAGE_SIZE = 100
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Seconds an error's open ticket is trusted to still be open before Jira is asked again
+JIRA_TICKET_CACHE_TTL = float(os.environ.get("JIRA_TICKET_CACHE_TTL", 900))
+# Label put on tickets so the open ticket of a fingerprint can be found with JQL
+FINGERPRINT_LABEL_PREFIX = "sre-fingerprint-"
+# Kind of the outbox actions creating tickets
+_OUTBOX_KIND = "jira_ticket"
+
+
+def _retry_after(response: httpx.Response, default: float) -> float:
+    """Seconds to wait before retrying, from Retry-After (seconds or an HTTP date) or `default`."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.debug(f"Ignoring malformed Retry-After: {value}")
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _fingerprint(fields: dict) -> Optional[str]:
+    match = FINGERPRINT_PATTERN.search(fields.get("description") or "")
+    return match.group(1) if match else None
+
+
+def _issue_fingerprints(issue: dict) -> List[str]:
+    """Fingerprints an issue found by a JQL search is labelled with."""
+    return [
+        label[len(FINGERPRINT_LABEL_PREFIX) :]
+        for label in issue.get("fields", {}).get("labels") or []
+        if label.startswith(FINGERPRINT_LABEL_PREFIX)
+    ]
+
+
+class TicketCache:
+    """
+    Fingerprint -> key of the open ticket reporting it. An entry is trusted for `ttl` seconds after
+    the ticket was created or found open, after which Jira is asked again (the ticket may have been
+    resolved meanwhile). With a `state_store`, entries survive restarts.
+    """
+
+    def __init__(self, ttl: float, state_store: Optional[StateStore] = None):
+        self.ttl = ttl
+        self._state_store = state_store
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        entry = self._entries.get(fingerprint)
+        if entry is None and self._state_store is not None:
+            entry = self._state_store.get_ticket(fingerprint)
+            if entry is not None:
+                self._entries[fingerprint] = entry
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            return None
+        return entry[0]
+
+    def set(self, fingerprint: str, ticket_key: str):
+        now = time.time()
+        self._entries[fingerprint] = (ticket_key, now)
+        self._entries.move_to_end(fingerprint)
+        while self._entries and now - next(iter(self._entries.values()))[1] >= self.ttl:
+            self._entries.popitem(last=False)
+        if self._state_store is not None:
+            self._state_store.set_ticket(fingerprint, ticket_key, now)
+            self._state_store.commit()
+        logger.debug(f"Recorded ticket {ticket_key} for fingerprint {fingerprint}")
 
 
 class JiraTicketInput(BaseModel):
@@ -32,6 +131,8 @@ class CreateJiraTicketTool(AutoSreAgentBaseTool):
     description: str = """
     Use this tool to create a Jira ticket. Provide 'summary', 'description',
     and optionally 'issue_type', and 'assignee'.
+    If an open ticket already exists for the error's fingerprint, the new occurrence is added to it
+    as a comment instead.
     """
     args_schema: ArgsSchema = JiraTicketInput
     jira_base_url: str = os.environ.get("JIRA_BASE_URL")
@@ -39,19 +140,97 @@ class CreateJiraTicketTool(AutoSreAgentBaseTool):
     jira_api_token: str = os.environ.get("JIRA_API_TOKEN")
     jira_project_name: str = os.environ.get("JIRA_PROJECT_NAME")
 
-    def _run(self, ip: Union[str | dict], **kwargs) -> str:
-        if not all(
+    def __init__(
+        self,
+        state_store: Optional[StateStore] = None,
+        outbox: Optional[Outbox] = None,
+    ):
+        super().__init__()
+        # Which ticket is open for which error fingerprint
+        self._tickets = TicketCache(JIRA_TICKET_CACHE_TTL, state_store)
+        # With an outbox, tickets are queued there and created by its workers
+        self._outbox = outbox
+        if outbox is not None:
+            outbox.register(_OUTBOX_KIND, self._deliver)
+        # HTTP clients kept for the lifetime of the tool, so their connections are reused
+        self._jira: Optional[Jira] = None
+        self._jira_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_jira(self) -> Jira:
+        with self._jira_lock:
+            if self._jira is None:
+                logger.debug(
+                    f"Connecting to JIRA at {self.jira_base_url} with user {self.jira_email}"
+                )
+                self._jira = Jira(
+                    url=self.jira_base_url,
+                    username=self.jira_email,
+                    password=self.jira_api_token,
+                    cloud=True,
+                )
+            return self._jira
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.jira_base_url,
+                auth=(self.jira_email, self.jira_api_token),
+                timeout=30,
+                limits=httpx.Limits(
+                    max_connections=JIRA_MAX_CONCURRENCY,
+                    max_keepalive_connections=JIRA_MAX_CONCURRENCY,
+                ),
+            )
+            self._slots = asyncio.Semaphore(JIRA_MAX_CONCURRENCY)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Call Jira through the pooled client, at most JIRA_MAX_CONCURRENCY at a time, retrying
+        throttled requests, server errors and connection errors with exponential backoff.
+        """
+        client = self._get_client()
+        for attempt in range(JIRA_MAX_RETRIES + 1):
+            delay = _RETRY_BACKOFF * 2**attempt
+            try:
+                async with self._slots:
+                    response = await client.request(method, path, **kwargs)
+                if (
+                    response.status_code not in _RETRY_STATUSES
+                    or attempt == JIRA_MAX_RETRIES
+                ):
+                    response.raise_for_status()
+                    return response
+                delay = _retry_after(response, delay)
+                logger.warning(
+                    f"Jira answered {response.status_code} to {path}, retrying in {delay}s"
+                )
+            except httpx.TransportError as e:
+                if attempt == JIRA_MAX_RETRIES:
+                    raise
+                logger.warning(
+                    f"Jira request to {path} failed ({e!r}), retrying in {delay}s"
+                )
+            await asyncio.sleep(delay)
+
+    def _credentials_set(self) -> bool:
+        return all(
             [
                 self.jira_base_url,
                 self.jira_email,
                 self.jira_api_token,
                 self.jira_project_name,
             ]
-        ):
-            return (
-                "Error: Jira credentials are not properly set in environment variables"
-            )
+        )
 
+    def _build_fields(self, ip: Union[str | dict]) -> dict:
         parsed_input = self._input_parser(ip)
         summary, description, issue_type, assignee = (
             parsed_input.summary,
@@ -60,16 +239,6 @@ class CreateJiraTicketTool(AutoSreAgentBaseTool):
             parsed_input.assignee,
         )
 
-        logger.debug(
-            f"Connecting to JIRA at {self.jira_base_url} with user {self.jira_email}"
-        )
-        jira = Jira(
-            url=self.jira_base_url,
-            username=self.jira_email,
-            password=self.jira_api_token,
-            cloud=True,
-        )
-
         fields = {
             "project": {"key": self.jira_project_name},
             "summary": summary,
@@ -79,18 +248,283 @@ class CreateJiraTicketTool(AutoSreAgentBaseTool):
 
         if assignee:
             fields["assignee"] = {"name": assignee}
+        fingerprint = _fingerprint(fields)
+        if fingerprint:
+            fields["labels"] = [FINGERPRINT_LABEL_PREFIX + fingerprint]
+        return fields
+
+    def _ticket_created(self, fields: dict, ticket_key: str) -> str:
+        fingerprint = _fingerprint(fields)
+        if fingerprint and ticket_key:
+            self._tickets.set(fingerprint, ticket_key)
+        ticket_url = f"{self.jira_base_url}/browse/{ticket_key}"
+        return f"Successfully created Jira ticket: {ticket_key}. View it here: {ticket_url}"
+
+    def _open_tickets_jql(self, fingerprints: Iterable[str]) -> str:
+        labels = ", ".join(
+            f'"{FINGERPRINT_LABEL_PREFIX}{fingerprint}"' for fingerprint in fingerprints
+        )
+        return (
+            f'project = "{self.jira_project_name}" AND labels in ({labels}) '
+            "AND statusCategory != Done ORDER BY created DESC"
+        )
+
+    def _found_open(self, issues: List[dict]) -> Dict[str, str]:
+        """Cache the fingerprint -> key of the open tickets found by `_open_tickets_jql`."""
+        found = {}
+        # Newest first, so the newest open ticket of a fingerprint wins
+        for issue in reversed(issues):
+            for fingerprint in _issue_fingerprints(issue):
+                found[fingerprint] = issue["key"]
+        for fingerprint, ticket_key in found.items():
+            self._tickets.set(fingerprint, ticket_key)
+        return found
+
+    @staticmethod
+    def _comment_body(occurrences: List[dict]) -> str:
+        """One comment for all the new occurrences of an error: the first line of each description."""
+        lines = [
+            (fields.get("description") or fields.get("summary") or "").split("\n", 1)[0]
+            for fields in occurrences
+        ]
+        return "The error occurred again:\n" + "\n".join(
+            f"- {line}" for line in lines if line
+        )
+
+    def _merge_occurrences(self, occurrences: List[dict]) -> dict:
+        """Fields of the ticket of the first occurrence, its description listing the others."""
+        fields = occurrences[0]
+        if len(occurrences) == 1:
+            return fields
+        return dict(
+            fields,
+            description=f"{fields.get('description') or ''}\n\n"
+            + self._comment_body(occurrences[1:]),
+        )
+
+    def _comment_added(self, ticket_key: str, count: int) -> str:
+        ticket_url = f"{self.jira_base_url}/browse/{ticket_key}"
+        return (
+            f"Jira ticket {ticket_key} is already open for this error, added {count} new "
+            f"occurrence(s) to it as a comment. View it here: {ticket_url}"
+        )
+
+    def _find_open_ticket(self, fields: dict) -> Optional[str]:
+        fingerprint = _fingerprint(fields)
+        if not fingerprint:
+            return None
+        ticket_key = self._tickets.get(fingerprint)
+        if ticket_key is None:
+            result = self._get_jira().jql(
+                self._open_tickets_jql([fingerprint]), fields="labels", limit=1
+            )
+            ticket_key = self._found_open(result.get("issues", [])).get(fingerprint)
+        return ticket_key
+
+    def _enqueue(self, ip: Union[str | dict]) -> str:
+        ticket = self._input_parser(ip).model_dump()
+        # Keyed on the error rather than on the wording of the ticket, so an error already
+        # queued isn't queued again
+        fingerprint = _fingerprint(ticket)
+        action_id = self._outbox.enqueue(
+            _OUTBOX_KIND,
+            ticket,
+            key=f"{_OUTBOX_KIND}:{fingerprint}" if fingerprint else None,
+        )
+        logger.info(f"Queued Jira ticket '{ticket['summary']}' as action {action_id}")
+        return (
+            f"Jira ticket queued for creation (action {action_id}). It will be created shortly, "
+            "or added as a comment to the open ticket of the same error."
+        )
+
+    async def asubmit_many(self, tickets: List[Union[str | dict]]) -> List[str]:
+        """Queue the tickets in the outbox if there is one, or create them right away."""
+        if self._outbox is not None:
+            return [self._enqueue(ticket) for ticket in tickets]
+        return await self.acreate_many(tickets)
+
+    async def _deliver(self, tickets: List[dict]) -> List[Tuple[bool, str]]:
+        """Outbox handler: create (or comment) a batch of queued tickets."""
+        results = await self.acreate_many(tickets)
+        return [(not result.startswith("Error"), result) for result in results]
+
+    def _run(self, ip: Union[str | dict], **kwargs) -> str:
+        if self._outbox is not None:
+            return self._enqueue(ip)
+        if not self._credentials_set():
+            return (
+                "Error: Jira credentials are not properly set in environment variables"
+            )
+
+        fields = self._build_fields(ip)
 
         try:
-            result = jira.issue_create(fields=fields)
-            ticket_key = result.get("key")
-            ticket_url = f"{self.jira_base_url}/browse/{ticket_key}"
-            return f"Successfully created Jira ticket: {ticket_key}. View it here: {ticket_url}"
+            ticket_key = self._find_open_ticket(fields)
+            if ticket_key:
+                self._get_jira().issue_add_comment(
+                    ticket_key, self._comment_body([fields])
+                )
+                return self._comment_added(ticket_key, 1)
+            result = self._get_jira().issue_create(fields=fields)
+            return self._ticket_created(fields, result.get("key"))
         except Exception as e:
             logger.exception("Failed to create Jira ticket")
             return f"Error creating Jira ticket: {str(e)}"
 
-    def _arun(self, query: str):
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, ip: Union[str | dict], **kwargs) -> str:
+        """Queue the ticket, or create it through Jira's REST API with a non-blocking HTTP client."""
+        return (await self.asubmit_many([ip]))[0]
+
+    async def acreate_many(self, tickets: List[Union[str | dict]]) -> List[str]:
+        """
+        Create several tickets, or rather upsert them: tickets for an error that already has an
+        open ticket become a single comment on it, tickets for a new error a single issue. Issues
+        are created through Jira's bulk endpoint, up to 50 per request, the requests running
+        concurrently. Returns the result of
+        each ticket, in order, like `_arun` does.
+        """
+        if not self._credentials_set():
+            return [
+                "Error: Jira credentials are not properly set in environment variables"
+            ] * len(tickets)
+
+        fields = [self._build_fields(ticket) for ticket in tickets]
+        try:
+            open_tickets = await self._find_open_tickets(fields)
+        except Exception as e:
+            logger.exception("Failed to look up open Jira tickets")
+            return [f"Error creating Jira ticket: {str(e)}"] * len(tickets)
+
+        # Occurrences per open ticket, and per ticket to create: the tickets of a new error make
+        # a single issue, listing the other occurrences in its description
+        comments: Dict[str, List[int]] = {}
+        new: Dict[Union[str, int], List[int]] = {}
+        for number, issue_fields in enumerate(fields):
+            fingerprint = _fingerprint(issue_fields)
+            ticket_key = open_tickets.get(fingerprint)
+            if ticket_key:
+                comments.setdefault(ticket_key, []).append(number)
+            else:
+                new.setdefault(fingerprint or number, []).append(number)
+        creations = [
+            (numbers, self._merge_occurrences([fields[number] for number in numbers]))
+            for numbers in new.values()
+        ]
+
+        chunks = [
+            creations[start : start + _BULK_SIZE]
+            for start in range(0, len(creations), _BULK_SIZE)
+        ]
+        chunk_results, comment_results = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    self._create_bulk([issue_fields for _, issue_fields in chunk])
+                    for chunk in chunks
+                )
+            ),
+            asyncio.gather(
+                *(
+                    self._add_comment(
+                        ticket_key, [fields[number] for number in numbers]
+                    )
+                    for ticket_key, numbers in comments.items()
+                )
+            ),
+        )
+        results: List[str] = [""] * len(fields)
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for (numbers, _), result in zip(chunk, chunk_result):
+                for number in numbers:
+                    results[number] = result
+        for numbers, result in zip(comments.values(), comment_results):
+            for number in numbers:
+                results[number] = result
+        return results
+
+    async def _find_open_tickets(self, fields: List[dict]) -> Dict[str, str]:
+        """Fingerprint -> open ticket, from the cache or else from a JQL search."""
+        open_tickets = {}
+        missing = set()
+        for issue_fields in fields:
+            fingerprint = _fingerprint(issue_fields)
+            if not fingerprint:
+                continue
+            ticket_key = self._tickets.get(fingerprint)
+            if ticket_key:
+                open_tickets[fingerprint] = ticket_key
+            else:
+                missing.add(fingerprint)
+        if not missing:
+            return open_tickets
+        jql = self._open_tickets_jql(sorted(missing))
+        issues: List[dict] = []
+        while missing:
+            # A fingerprint may have several open tickets, so the results (newest first) are paged
+            # through until every fingerprint has had one, or there are no more
+            response = await self._request(
+                "GET",
+                "/rest/api/2/search",
+                params={
+                    "jql": jql,
+                    "fields": "labels",
+                    "startAt": len(issues),
+                    "maxResults": _SEARCH_PAGE_SIZE,
+                },
+            )
+            body = response.json()
+            page = body.get("issues", [])
+            issues.extend(page)
+            for issue in page:
+                missing.difference_update(_issue_fingerprints(issue))
+            if not page or len(issues) >= body.get("total", 0):
+                break
+        open_tickets.update(self._found_open(issues))
+        return open_tickets
+
+    async def _add_comment(self, ticket_key: str, occurrences: List[dict]) -> str:
+        try:
+            await self._request(
+                "POST",
+                f"/rest/api/2/issue/{ticket_key}/comment",
+                json={"body": self._comment_body(occurrences)},
+            )
+            logger.info(
+                f"Added {len(occurrences)} occurrences to the open ticket {ticket_key}"
+            )
+            return self._comment_added(ticket_key, len(occurrences))
+        except Exception as e:
+            logger.exception(f"Failed to comment on Jira ticket {ticket_key}")
+            return f"Error commenting on Jira ticket {ticket_key}: {str(e)}"
+
+    async def _create_bulk(self, fields: List[dict]) -> List[str]:
+        try:
+            response = await self._request(
+                "POST",
+                "/rest/api/2/issue/bulk",
+                json={"issueUpdates": [{"fields": issue} for issue in fields]},
+            )
+        except Exception as e:
+            logger.exception(f"Failed to create {len(fields)} Jira tickets")
+            return [f"Error creating Jira ticket: {str(e)}"] * len(fields)
+
+        body = response.json()
+        # Created issues are listed in order, skipping the elements that failed
+        errors: Dict[int, dict] = {
+            error.get("failedElementNumber"): error for error in body.get("errors", [])
+        }
+        created = iter(body.get("issues", []))
+        results = []
+        for number, issue_fields in enumerate(fields):
+            if number in errors:
+                details = errors[number].get("elementErrors", {})
+                logger.error(
+                    f"Jira rejected ticket {issue_fields['summary']}: {details}"
+                )
+                results.append(f"Error creating Jira ticket: {details}")
+                continue
+            issue = next(created, {})
+            results.append(self._ticket_created(issue_fields, issue.get("key")))
+        return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import math
+from datetime import datetime
+from typing import Optional, Union
+
+from langchain_core.tools.base import ArgsSchema
+from pydantic import BaseModel, Field
+
+from tools.base import AutoSreAgentBaseTool
+from utils.log_store import LogEventStore
+from utils.logger import logger
+
+
+class EndpointStatsInput(BaseModel):
+    from_time: Optional[str] = Field(
+        default=None, description="Start of the time window (YYYY-MM-DD HH:MM:SS)"
+    )
+    to_time: Optional[str] = Field(
+        default=None, description="End of the time window (YYYY-MM-DD HH:MM:SS)"
+    )
+
+
+class EndpointStatsTool(AutoSreAgentBaseTool):
+    """Tool that reports per-endpoint traffic and server error rates from the log event store."""
+
+    name: str = "endpoint_stats"
+    description: str = """
+    Use this tool to see which API endpoints are failing and how badly.
+    Provide 'from_time' and 'to_time' in the format 'YYYY-MM-DD HH:MM:SS'.
+    For every endpoint it returns the number of requests, of server errors (5xx responses and
+    unhandled exceptions), the error rate and the mean response time, worst endpoints first.
+    """
+    args_schema: ArgsSchema = EndpointStatsInput
+
+    def __init__(self, store: LogEventStore):
+        super().__init__()
+        self._store = store
+
+    def _run(self, ip: Union[str | dict]) -> str:
+        parsed_input = self._input_parser(ip)
+        try:
+            from_dt, to_dt = (
+                datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value else None
+                for value in (parsed_input.from_time, parsed_input.to_time)
+            )
+        except ValueError:
+            logger.error(f"Invalid time window: {parsed_input}")
+            return "Invalid time format. Please use 'YYYY-MM-DD HH:MM:SS'"
+
+        stats = self._store.endpoint_stats(from_dt, to_dt)
+        if not stats:
+            return "No requests found in the specified time range."
+        return "\n".join(
+            f"{entry.endpoint}: {entry.requests} requests, {entry.server_errors} server errors "
+            f"({entry.error_rate:.1%})"
+            + (
+                ""
+                if math.isnan(entry.avg_response_ms)
+                else f", mean response time {entry.avg_response_ms:.3f}ms"
+            )
+            for entry in stats
+        )
+
+    async def _arun(self, ip: Union[str | dict]) -> str:
+        # Column scans over an in-memory window, cheap enough to run on the event loop
+        return self._run(ip)
@@ -5,13 +5,27 @@ from utils.logger import logger
 from pydantic import BaseModel, Field
 
 from tools.base import AutoSreAgentBaseTool
-
-
-class OncallEmployee(BaseModel):
-    name: str
-    email: str
-    role: str
-    team: str
+from utils.roster import OncallEmployee, OncallRoster
+
+# Static on-call roster for demonstration, used when no roster file is configured
+DEFAULT_ROSTER = [
+    OncallEmployee(
+        "Alice Johnson", "alice.johnson@example.com", "Senior SRE", "Infrastructure"
+    ),
+    OncallEmployee("Bob Smith", "bob.smith@example.com", "DevOps Engineer", "Platform"),
+    OncallEmployee(
+        "Carol Davis", "carol.davis@example.com", "SRE Manager", "Reliability"
+    ),
+    OncallEmployee(
+        "Dave Wilson", "dave.wilson@example.com", "Backend Engineer", "API Services"
+    ),
+    OncallEmployee(
+        "Eva Martinez", "eva.martinez@example.com", "Database Engineer", "Data Platform"
+    ),
+    OncallEmployee(
+        "Frank Lee", "frank.lee@example.com", "Network Engineer", "Infrastructure"
+    ),
+]
 
 
 class OncallTeamInput(BaseModel):
@@ -31,61 +45,19 @@ class GetOncallEmployeesTool(AutoSreAgentBaseTool):
     Use this tool to get information about which employees are currently on-call.
     You can optionally specify a team_name to filter the results. 
     Returns a list of on-call employees with their name, email, role and team.
-    Valid team names: Infrastructure, Platform, Reliability, API Services, Data Platform.
+    An unknown team_name returns every team, along with the valid team names.
     """
     args_schema: ArgsSchema = OncallTeamInput
 
-    # Define allowed team names as a class attribute
-    ALLOWED_TEAMS: List[str] = [
-        "Infrastructure",
-        "Platform",
-        "Reliability",
-        "API Services",
-        "Data Platform",
-    ]
-
-    def __init__(self):
-        """Initialize with static oncall data."""
+    def __init__(self, roster: Optional[OncallRoster] = None):
+        """Initialize with `roster`, or the static demonstration roster if None."""
         super().__init__()
-        # Static on-call roster for demonstration
-        self._oncall_roster = [
-            {
-                "name": "Alice Johnson",
-                "email": "alice.johnson@example.com",
-                "role": "Senior SRE",
-                "team": "Infrastructure",
-            },
-            {
-                "name": "Bob Smith",
-                "email": "bob.smith@example.com",
-                "role": "DevOps Engineer",
-                "team": "Platform",
-            },
-            {
-                "name": "Carol Davis",
-                "email": "carol.davis@example.com",
-                "role": "SRE Manager",
-                "team": "Reliability",
-            },
-            {
-                "name": "Dave Wilson",
-                "email": "dave.wilson@example.com",
-                "role": "Backend Engineer",
-                "team": "API Services",
-            },
-            {
-                "name": "Eva Martinez",
-                "email": "eva.martinez@example.com",
-                "role": "Database Engineer",
-                "team": "Data Platform",
-            },
-            {
-                "name": "Frank Lee",
-                "email": "frank.lee@example.com",
-                "role": "Network Engineer",
-                "team": "Infrastructure",
-            },
-        ]
+        self._roster = roster or OncallRoster(DEFAULT_ROSTER)
+
+    @property
+    def teams(self) -> List[str]:
+        """Teams of the roster, as currently loaded."""
+        return self._roster.teams
 
     def _run(self, ip: Union[str | dict]) -> str:
         """
@@ -99,35 +71,22 @@ class GetOncallEmployeesTool(AutoSreAgentBaseTool):
         """
         parsed_input = self._input_parser(ip=ip)
         team = parsed_input.team_name
-        if team not in self.ALLOWED_TEAMS:
+        note = ""
+        if team and not self._roster.has_team(team):
+            # Listed as the roster is now, it may be reloaded at any time
+            valid_teams = f"Valid team names are: {', '.join(self.teams)}"
             logger.warning(
-                f"Invalid team name provided: {team}. Ignoring the filter ..."
-                f"Valid team names are: {', '.join(self.ALLOWED_TEAMS)}"
+                f"Invalid team name provided: {team}. Ignoring the filter ... {valid_teams}"
             )
+            note = f"Unknown team '{team}', showing every team. {valid_teams}\n"
             team = None
 
-        if team:
-            oncall_list = [emp for emp in self._oncall_roster if emp["team"] == team]
-            if not oncall_list:
-                return f"No on-call employees found for team '{team}'."
-        else:
-            oncall_list = self._oncall_roster
-
-        # Format the response
-        result = "Current on-call employees:\n\n"
-        for emp in oncall_list:
-            result += (
-                f"Name: {emp['name']}\n"
-                f"Email: {emp['email']}\n"
-                f"Role: {emp['role']}\n"
-                f"Team: {emp['team']}\n\n"
-            )
-
-        return result
+        # Cached per team until the next shift change
+        return note + self._roster.format(team)
 
-    def _arun(self, team: str = None):
-        """Async implementation would go here."""
-        raise NotImplementedError("This tool does not support async")
+    async def _arun(self, ip: Union[str | dict]) -> str:
+        """The roster is indexed in memory, so the lookup never blocks the event loop."""
+        return self._run(ip)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+import math
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from utils.fingerprint import Incident
+from utils.log_store import parse_fields
+from utils.logger import logger
+
+
+class _RateSeries:
+    """
+    Occurrence counts of one fingerprint or component in fixed-size time buckets, kept in a ring
+    buffer, with an EWMA baseline (mean and variance) of the closed buckets.
+    """
+
+    __slots__ = ("counts", "bucket", "mean", "var", "closed", "alerting")
+
+    def __init__(self, ring_size: int):
+        self.counts = array("I", bytes(4 * ring_size))
+        # Index of the current (open) bucket
+        self.bucket: Optional[int] = None
+        self.mean = 0.0
+        self.var = 0.0
+        # Number of buckets folded into the baseline
+        self.closed = 0
+        # Whether the current deviation was already escalated
+        self.alerting = False
+
+    def _close(self, count: int, alpha: float):
+        if self.closed == 0:
+            self.mean = float(count)
+        else:
+            delta = count - self.mean
+            self.mean += alpha * delta
+            self.var = (1 - alpha) * (self.var + alpha * delta * delta)
+        self.closed += 1
+
+    def advance(self, bucket: int, alpha: float):
+        """Move to `bucket`, folding the buckets left behind (empty ones included) into the baseline."""
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        steps = bucket - self.bucket
+        if steps <= 0:
+            return
+        ring_size = len(self.counts)
+        self._close(self.counts[self.bucket % ring_size], alpha)
+        # Buckets without any occurrence; past a ring's worth the baseline just decays
+        for _ in range(min(steps - 1, ring_size)):
+            self._close(0, alpha)
+        if steps - 1 > ring_size:
+            decay = (1 - alpha) ** (steps - 1 - ring_size)
+            self.mean *= decay
+            self.var *= decay
+        for index in range(self.bucket + 1, self.bucket + 1 + min(steps, ring_size)):
+            self.counts[index % ring_size] = 0
+        self.bucket = bucket
+
+    def rate(self, fraction: float) -> float:
+        """
+        Occurrences over the last bucket-length: the open bucket plus the part of the previous
+        bucket that is still inside the sliding window. `fraction` is how far into the open
+        bucket we are.
+        """
+        ring_size = len(self.counts)
+        return self.counts[self.bucket % ring_size] + self.counts[
+            (self.bucket - 1) % ring_size
+        ] * (1 - fraction)
+
+
+class RateAnomalyDetector:
+    """
+    Incremental error-rate anomaly detector deciding which incidents are worth the agent's time.
+
+    Every fingerprint and every component (the `[Component]` of system logs, the endpoint of
+    request logs) gets a `_RateSeries` of `bucket_seconds` buckets. Updates are O(1): the count of
+    the open bucket is incremented, and closed buckets are folded into an exponentially weighted
+    mean and variance. The current rate is compared to that baseline with a z-score (the standard
+    deviation being floored at the Poisson one, sqrt(mean)) and a plain ratio, so a steady trickle
+    of a known error is recognised as normal while a sudden multiple of it is not.
+
+    Time comes from the log timestamps, not the clock, so replays and backfills behave like live
+    traffic.
+    """
+
+    def __init__(
+        self,
+        bucket_seconds: float = 60,
+        alpha: float = 0.1,
+        threshold: float = 3.0,
+        min_ratio: float = 3.0,
+        min_count: int = 5,
+        warmup: int = 10,
+        ring_size: int = 60,
+        max_series: int = 10000,
+    ):
+        self.bucket_ms = int(bucket_seconds * 1000)
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_ratio = min_ratio
+        self.min_count = min_count
+        self.warmup = warmup
+        self.ring_size = ring_size
+        self.max_series = max_series
+        # Least recently updated series first, so the oldest can be dropped
+        self._series: "OrderedDict[str, _RateSeries]" = OrderedDict()
+        self._now: Optional[int] = None
+
+    def __len__(self):
+        return len(self._series)
+
+    @staticmethod
+    def component(incident: Incident) -> Optional[str]:
+        fields = parse_fields(incident.sample)
+        return fields.component or fields.endpoint
+
+    def _keys(self, incident: Incident):
+        yield f"fingerprint:{incident.fingerprint}"
+        component = self.component(incident)
+        if component:
+            yield f"component:{component}"
+
+    def _get(self, key: str) -> _RateSeries:
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _RateSeries(self.ring_size)
+            if len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        else:
+            self._series.move_to_end(key)
+        return series
+
+    def observe(self, incidents: Iterable[Incident]):
+        """Count the occurrences of a batch of incidents, in the bucket of their last occurrence."""
+        for incident in incidents:
+            if incident.last_seen is None:
+                continue
+            if self._now is None or incident.last_seen > self._now:
+                self._now = incident.last_seen
+            bucket = incident.last_seen // self.bucket_ms
+            for key in self._keys(incident):
+                series = self._get(key)
+                series.advance(bucket, self.alpha)
+                # Late entries (from a lagging source) count towards the open bucket
+                series.counts[series.bucket % self.ring_size] += incident.count
+
+    def _deviation(self, series: _RateSeries) -> Optional[float]:
+        """z-score of the current rate, None while the baseline is still warming up."""
+        series.advance(self._now // self.bucket_ms, self.alpha)
+        if series.closed < self.warmup:
+            return None
+        fraction = (self._now % self.bucket_ms) / self.bucket_ms
+        rate = series.rate(fraction)
+        if rate < self.min_count or rate < self.min_ratio * series.mean:
+            return 0.0
+        return (rate - series.mean) / math.sqrt(max(series.var, series.mean, 1.0))
+
+    def has_baseline(self, incident: Incident) -> bool:
+        """
+        Whether the fingerprint recurred long enough to have a baseline, and recently enough for it
+        to still be its usual rate: a baseline decayed below one occurrence per ring (e.g. over
+        the quiet period after which the fingerprint was forgotten as reported) doesn't count.
+        """
+        series = self._series.get(f"fingerprint:{incident.fingerprint}")
+        return (
+            series is not None
+            and series.closed >= self.warmup
+            and series.mean * self.ring_size >= 1
+        )
+
+    def spike(self, incident: Incident) -> Optional[str]:
+        """
+        A description of the rate deviation of the incident's fingerprint or component, or None
+        if their rates are in line with the baseline. A deviation is only reported once, until
+        the rate goes back to normal.
+        """
+        if self._now is None:
+            return None
+        for key in self._keys(incident):
+            series = self._series.get(key)
+            if series is None:
+                continue
+            deviation = self._deviation(series)
+            if deviation is None or deviation < self.threshold:
+                series.alerting = False
+                continue
+            if series.alerting:
+                return None
+            series.alerting = True
+            fraction = (self._now % self.bucket_ms) / self.bucket_ms
+            description = (
+                f"{key.replace(':', ' ', 1)} rate spike: {series.rate(fraction):.0f} in the last "
+                f"{self.bucket_ms // 1000}s against a baseline of {series.mean:.1f}"
+            )
+            logger.info(f"Anomaly: {description} (z={deviation:.1f})")
+            return description
+        return None
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from utils.fingerprint import Incident
+from utils.logger import logger
+
+
+class IncidentBatcher:
+    """
+    Accumulates the incidents of consecutive checks so an error storm is triaged in a few large
+    requests rather than many small ones. A batch is dispatched as soon as `max_size` incidents are
+    pending, or `max_delay` seconds after its first incident was added, whichever comes first, so
+    batching never delays an incident by more than `max_delay`.
+
+    `dispatch(incidents, from_time, to_time)` is called from the event loop with each batch and the
+    time window covering all of its checks; it is expected to schedule the triage, not to run it.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[List[Incident], datetime, datetime], None],
+        max_size: int = 20,
+        max_delay: float = 10.0,
+    ):
+        self._dispatch = dispatch
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: List[Incident] = []
+        self._from_time: Optional[datetime] = None
+        self._to_time: Optional[datetime] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, incidents: List[Incident], from_time: datetime, to_time: datetime):
+        """Queue the new incidents of the check of [from_time, to_time]."""
+        for incident in incidents:
+            if not self._pending:
+                self._from_time = from_time
+                if self.max_delay > 0:
+                    self._timer = asyncio.get_running_loop().call_later(
+                        self.max_delay, self.flush
+                    )
+            self._pending.append(incident)
+            self._from_time = min(self._from_time, from_time)
+            self._to_time = (
+                to_time if self._to_time is None else max(self._to_time, to_time)
+            )
+            if len(self._pending) >= self.max_size:
+                self.flush()
+        if self.max_delay <= 0:
+            self.flush()
+
+    def flush(self):
+        """Dispatch the pending incidents now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, from_time, to_time = self._pending, self._from_time, self._to_time
+        self._pending, self._from_time, self._to_time = [], None, None
+        logger.info(
+            f"Dispatching a batch of {len(batch)} incidents from {from_time} to {to_time}"
+        )
+        self._dispatch(batch, from_time, to_time)
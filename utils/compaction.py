@@ -0,0 +1,227 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from utils.fingerprint import Incident, event_template, fingerprint, normalize
+from utils.log_events import LogEvent
+
+_FRAME_PREFIX = '  File "'
+# Characters per prompt token, roughly, for BPE encodings on English and log text
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated number of prompt tokens of `text`."""
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+class _Group:
+    __slots__ = ("incident", "prefix", "body", "tokens", "lines")
+
+    def __init__(self, incident: Incident, prefix: str, body: List[str], tokens: int):
+        self.incident = incident
+        self.prefix = prefix
+        # Continuation lines of the first occurrence, with frames shown earlier elided
+        self.body = body
+        self.tokens = tokens
+        # Lines of every occurrence
+        self.lines = 0
+
+
+class LogCompactor:
+    """
+    Collapses a stream of log events into what the agent needs to see, within a token budget
+    and limits on the records, lines and bytes shown.
+
+    Events are grouped by fingerprint: the first occurrence of an error is kept and every
+    recurrence only increments its count, so a burst of identical tracebacks is rendered once as
+    "50x <template> (first seen ..., last seen ...)". Traceback frames already shown for an earlier
+    error are elided. Once a new group doesn't fit, the output is cut: every later event is only
+    counted, without being fingerprinted, so reading past the limits stays cheap.
+    """
+
+    # Allowance for the count and first/last seen line of a repeated event
+    _SUMMARY_TOKENS = 24
+
+    def __init__(
+        self,
+        token_budget: int,
+        max_records: Optional[int] = None,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.token_budget = token_budget
+        self.max_records = max_records
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.tokens = 0
+        self.lines = 0
+        self.bytes = 0
+        # Recurrences folded into a kept group, and events after the cut
+        self.folded_records = 0
+        self.omitted_records = 0
+        self.omitted_lines = 0
+        self._groups: Dict[str, _Group] = {}
+        self._frames: Set[str] = set()
+        # Key of the last event looked up, which `keep` gets right after `fold` missed it
+        self._last: Tuple[Optional[LogEvent], str] = (None, "")
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __getstate__(self):
+        # Sent back by scan workers: the lookup cache and the frames shown only matter to `add`
+        state = self.__dict__.copy()
+        state["_frames"] = set()
+        state["_last"] = (None, "")
+        return state
+
+    def add(self, event: LogEvent, source: Optional[str] = None):
+        """
+        Fold, keep or count `event`. With `source`, groups are told apart by source as well and
+        the event is prefixed with it.
+        """
+        if self.omitted_records:
+            self._omit(1, len(event.lines))
+        elif self.fold(event, source):
+            self.folded_records += 1
+        elif not self.keep(event, f"[{source}] " if source else "", source):
+            self._omit(1, len(event.lines))
+
+    def merge(self, other: "LogCompactor", source: Optional[str] = None):
+        """
+        Add what `other` compacted (e.g. a scan worker, from the events that follow), as if its
+        events had been added here: its groups are folded into the kept ones or kept in turn, in
+        order of first occurrence, until the output is cut. Recurrences that `other` folded past
+        the point where this output is cut are counted as folded rather than omitted. With
+        `source`, `other` holds events of that source added without it.
+        """
+        for group in other._groups.values():
+            incident = group.incident
+            if self.omitted_records:
+                self._omit(incident.count, group.lines)
+                continue
+            key = f"{source}:{incident.fingerprint}" if source else incident.fingerprint
+            kept = self._groups.get(key)
+            if kept is None:
+                if not self.keep(
+                    incident.sample, f"[{source}] " if source else "", source
+                ):
+                    self._omit(incident.count, group.lines)
+                    continue
+                # Counted from `other` below
+                kept = self._groups[key]
+                kept.incident.count -= 1
+                kept.lines = 0
+            else:
+                self.folded_records += 1
+            self.folded_records += incident.count - 1
+            kept.incident.count += incident.count
+            kept.lines += group.lines
+            if incident.first_seen is not None:
+                if (
+                    kept.incident.first_seen is None
+                    or incident.first_seen < kept.incident.first_seen
+                ):
+                    kept.incident.first_seen = incident.first_seen
+                if (
+                    kept.incident.last_seen is None
+                    or incident.last_seen > kept.incident.last_seen
+                ):
+                    kept.incident.last_seen = incident.last_seen
+        self._omit(other.omitted_records, other.omitted_lines)
+
+    def _omit(self, records: int, lines: int):
+        self.omitted_records += records
+        self.omitted_lines += lines
+
+    def fold(self, event: LogEvent, source: Optional[str] = None) -> bool:
+        """Count `event` as a recurrence of a kept group, False if it starts a new one."""
+        group = self._groups.get(self._key(event, source))
+        if group is None:
+            return False
+        group.incident.add(event)
+        group.lines += len(event.lines)
+        return True
+
+    def keep(
+        self, event: LogEvent, prefix: str = "", source: Optional[str] = None
+    ) -> bool:
+        """Start a new group with `event`, False if it doesn't fit in the budget and limits."""
+        event_bytes = event.size + len(prefix)
+        if (
+            (self.max_records is not None and len(self) >= self.max_records)
+            or (
+                self.max_lines is not None
+                and self.lines + len(event.lines) > self.max_lines
+            )
+            or (
+                self.max_bytes is not None and self.bytes + event_bytes > self.max_bytes
+            )
+        ):
+            return False
+        body = self._elide_frames(event.lines[1:])
+        tokens = (
+            estimate_tokens(prefix + event.header + "".join(body))
+            + self._SUMMARY_TOKENS
+        )
+        if self.tokens + tokens > self.token_budget:
+            return False
+        key = self._key(event, source)
+        incident = Incident(key, event_template(event), event)
+        incident.add(event)
+        group = self._groups[key] = _Group(incident, prefix, body, tokens)
+        group.lines = len(event.lines)
+        self.tokens += tokens
+        self.lines += len(event.lines)
+        self.bytes += event_bytes
+        self._frames.update(
+            normalize(line)
+            for line in event.lines[1:]
+            if line.startswith(_FRAME_PREFIX)
+        )
+        return True
+
+    def _key(self, event: LogEvent, source: Optional[str]) -> str:
+        if self._last[0] is not event:
+            key = fingerprint(event)
+            self._last = (event, f"{source}:{key}" if source else key)
+        return self._last[1]
+
+    def _elide_frames(self, lines) -> List[str]:
+        body = []
+        elided = 0
+        skip_code = False
+        for line in lines:
+            if line.startswith(_FRAME_PREFIX):
+                skip_code = normalize(line) in self._frames
+                if skip_code:
+                    elided += 1
+                    continue
+            elif skip_code and line.startswith("    "):
+                # Source line of an elided frame
+                continue
+            skip_code = False
+            if elided:
+                body.append(self._elided(elided))
+                elided = 0
+            body.append(line)
+        if elided:
+            body.append(self._elided(elided))
+        return body
+
+    @staticmethod
+    def _elided(count: int) -> str:
+        return f"  ... {count} frame{'s' if count > 1 else ''} shown above\n"
+
+    def render(self) -> List[str]:
+        """The kept groups in order of first occurrence, as lines."""
+        output = []
+        for group in self._groups.values():
+            incident = group.incident
+            if incident.count == 1:
+                header = incident.sample.header
+            else:
+                header = f"{incident.summary()}\n"
+            output.append(group.prefix)
+            output.append(header if header.endswith("\n") else header + "\n")
+            output.extend(group.body)
+        return output
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+from utils.fingerprint import Incident
+from utils.logger import logger
+from utils.routing import Route, TeamRouter
+
+_SYSTEM_PROMPT = (
+    "You are an SRE triaging production incidents of a banking backend. For each incident listed, "
+    "use the logs, endpoint statistics and on-call roster provided to identify the most likely "
+    "cause and a possible fix, pick the team that owns it and the on-call employee of that team "
+    "best suited to handle it, and write a Jira ticket for it. Return exactly one ticket per "
+    "incident, with the incident's fingerprint. Incidents listed with an owner and an assignee "
+    "are already routed: use that team and assignee."
+)
+
+
+class TicketDraft(BaseModel):
+    fingerprint: str = Field(
+        description="Fingerprint of the incident the ticket is for"
+    )
+    summary: str = Field(description="Short title of the Jira ticket")
+    cause: str = Field(description="Most likely cause of the incident")
+    fix: str = Field(description="Possible solution or next investigation steps")
+    team: str = Field(description="Team that should handle the incident")
+    assignee: Optional[str] = Field(
+        default=None,
+        description="Email of the on-call employee of that team best suited to handle it",
+    )
+    issue_type: str = Field(default="Bug", description="Jira issue type, e.g. 'Bug'")
+
+
+class TriageReport(BaseModel):
+    tickets: List[TicketDraft] = Field(description="One ticket per incident")
+
+
+class DirectTriage:
+    """
+    Single-shot alternative to the ReAct agent. The context the agent would fetch with its tools
+    (the log window, the endpoint statistics and the on-call roster) is fetched up front, in
+    parallel, and the whole batch of incidents is triaged by one structured-output LLM call. The
+    tickets are then created programmatically, in bulk, so a batch costs one LLM round trip instead of
+    several per incident. With a `router`, incidents a routing rule covers get their team and
+    assignee from it rather than from the LLM, and when every incident is covered the on-call
+    roster is left out of the prompt.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        log_reader: BaseTool,
+        endpoint_stats: BaseTool,
+        oncall: BaseTool,
+        jira: BaseTool,
+        router: Optional[TeamRouter] = None,
+    ):
+        self._llm = llm.with_structured_output(TriageReport)
+        self._log_reader = log_reader
+        self._endpoint_stats = endpoint_stats
+        self._oncall = oncall
+        self._jira = jira
+        self._router = router
+
+    async def _context(
+        self, from_time: datetime, to_time: datetime, with_roster: bool = True
+    ) -> str:
+        window = {
+            "from_time": from_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "to_time": to_time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        fetches = [self._log_reader._arun(window), self._endpoint_stats._arun(window)]
+        if with_roster:
+            fetches.append(self._oncall._arun({}))
+        logs, stats, *roster = await asyncio.gather(*fetches)
+        context = (
+            f"Logs from {window['from_time']} to {window['to_time']}:\n{logs}\n\n"
+            f"Endpoint statistics over the same window:\n{stats}\n\n"
+        )
+        if roster:
+            context += f"{roster[0]}Valid teams: {', '.join(self._oncall.teams)}\n"
+        return context
+
+    async def triage(
+        self, incidents: List[Incident], from_time: datetime, to_time: datetime
+    ) -> List[Incident]:
+        """
+        Triage `incidents` and create their tickets. Returns the incidents the LLM left out or
+        whose ticket could not be created, for the caller to hand to the ReAct agent.
+        """
+        routes: Dict[str, Optional[Route]] = {
+            incident.fingerprint: self._router.route(incident) if self._router else None
+            for incident in incidents
+        }
+        context = await self._context(
+            from_time,
+            to_time,
+            with_roster=not all(
+                route is not None and route.assignee is not None
+                for route in routes.values()
+            ),
+        )
+        incident_list = "\n".join(
+            f"- [Fingerprint: {incident.fingerprint}] {incident.summary()}"
+            f"{TeamRouter.describe(routes[incident.fingerprint])}"
+            for incident in incidents
+        )
+        report: TriageReport = await self._llm.ainvoke(
+            [
+                ("system", _SYSTEM_PROMPT),
+                ("human", f"Incidents:\n{incident_list}\n\n{context}"),
+            ]
+        )
+
+        by_fingerprint: Dict[str, Incident] = {
+            incident.fingerprint: incident for incident in incidents
+        }
+        drafts = []
+        for draft in report.tickets:
+            incident = by_fingerprint.pop(draft.fingerprint, None)
+            if incident is None:
+                logger.warning(
+                    f"Ignoring ticket for unknown incident {draft.fingerprint}"
+                )
+                continue
+            drafts.append((incident, draft))
+        # Queued, or created with one bulk request for the whole batch
+        results = await self._jira.asubmit_many(
+            [
+                self._ticket(incident, draft, routes[incident.fingerprint])
+                for incident, draft in drafts
+            ]
+        )
+        if by_fingerprint:
+            logger.warning(
+                f"{len(by_fingerprint)} incidents missing from the triage report"
+            )
+        for (incident, _), result in zip(drafts, results):
+            logger.info(result)
+            if result.startswith("Error"):
+                by_fingerprint[incident.fingerprint] = incident
+        return list(by_fingerprint.values())
+
+    def _ticket(
+        self, incident: Incident, draft: TicketDraft, route: Optional[Route]
+    ) -> dict:
+        if route is not None:
+            # The routing rules are authoritative, whatever the LLM answered
+            draft.team = route.team
+            if route.assignee is not None:
+                draft.assignee = route.assignee.email
+        elif draft.team not in self._oncall.teams:
+            logger.warning(f"Unknown team {draft.team} for {incident.fingerprint}")
+        description = (
+            f"{incident.summary()}\n\n"
+            f"Team: {draft.team}\n\n"
+            f"Probable cause:\n{draft.cause}\n\n"
+            f"Possible solution:\n{draft.fix}\n\n"
+            f"Fingerprint: {incident.fingerprint}"
+        )
+        return {
+            "summary": draft.summary,
+            "description": description,
+            "issue_type": draft.issue_type,
+            "assignee": draft.assignee,
+        }
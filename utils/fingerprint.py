@@ -0,0 +1,204 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.log_events import LogEvent, key_to_datetime
+from utils.state_store import StateStore
+
+# Volatile tokens replaced before hashing, most specific first
+_NORMALIZERS = [
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        ),
+        "<uuid>",
+    ),
+    # ISO-8601 dates and times (`2025-05-01T09:59:58.123Z`, `+02:00`), and times of day
+    (
+        re.compile(
+            r"\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?"
+            r"(?:Z|[+-]\d{2}(?::?\d{2})?)?)?(?![\w:])"
+            r"|\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?![\w:])"
+        ),
+        "<ts>",
+    ),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"(?<=host: )[^\]\s]+"), "<host>"),
+    # Request/trace ids and other hex tokens of 8 characters or more that contain at least one
+    # digit (so that an id that happens to be all digits still reads <id>)
+    (re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b"), "<id>"),
+    # Line numbers, PIDs, durations, amounts, ... as standalone numbers, optionally followed by a
+    # unit: digits within identifiers (`/api/v1`, `S3UploadError`) are kept, and so are HTTP status
+    # codes, which tell errors apart
+    (
+        re.compile(
+            r"\b((?:HTTP(?:/\d(?:\.\d)?)?|[Ss]tatus|STATUS)(?:[ _][Cc]ode)?[\s:=]+[1-5]\d\d)\b"
+            r"|(?<![A-Za-z0-9.])\d+(?:\.\d+)?"
+            r"(?=(?:[mun]s|s|m|h|[KMGT]i?B|B)?(?![A-Za-z0-9]|\.\d))"
+        ),
+        lambda match: match.group(1) or "<n>",
+    ),
+]
+_FRAME_PREFIX = '  File "'
+
+
+def normalize(text: str) -> str:
+    """Replace the volatile parts of a log line so that recurrences of an error compare equal."""
+    for pattern, placeholder in _NORMALIZERS:
+        text = pattern.sub(placeholder, text)
+    return text.strip()
+
+
+class Incident:
+    """All occurrences of one fingerprint within a batch of log events."""
+
+    __slots__ = (
+        "fingerprint",
+        "template",
+        "count",
+        "first_seen",
+        "last_seen",
+        "sample",
+        "reason",
+    )
+
+    def __init__(self, fingerprint: str, template: str, sample: Optional[LogEvent]):
+        self.fingerprint = fingerprint
+        self.template = template
+        self.count = 0
+        # Epoch millisecond keys, see utils.log_events
+        self.first_seen: Optional[int] = None
+        self.last_seen: Optional[int] = None
+        # None for incidents derived from aggregates rather than log events, see utils.latency
+        self.sample = sample
+        # Why the incident is escalated to the agent if not just for being new, e.g. a rate spike
+        self.reason: Optional[str] = None
+
+    def __repr__(self):
+        return f"Incident({self.fingerprint}, {self.count}x)"
+
+    def add(self, event: LogEvent):
+        self.count += 1
+        if event.key is not None:
+            if self.first_seen is None or event.key < self.first_seen:
+                self.first_seen = event.key
+            if self.last_seen is None or event.key > self.last_seen:
+                self.last_seen = event.key
+
+    def summary(self) -> str:
+        seen = ""
+        if self.first_seen is not None:
+            seen = (
+                f" (first seen {key_to_datetime(self.first_seen):%Y-%m-%d %H:%M:%S}, "
+                f"last seen {key_to_datetime(self.last_seen):%Y-%m-%d %H:%M:%S})"
+            )
+        reason = f" [{self.reason}]" if self.reason else ""
+        return f"{self.count}x {self.template}{seen}{reason}"
+
+
+def event_template(event: LogEvent) -> str:
+    """Normalized header of an event, without its timestamp."""
+    header = event.header
+    if event.key is not None:
+        header = header[header.find("]") + 1 :]
+    return normalize(header)
+
+
+def fingerprint(event: LogEvent) -> str:
+    """
+    Stable identifier of the error an event reports: its normalized header plus the normalized
+    traceback frames, so the same failure from the same code path always hashes the same.
+    """
+    digest = hashlib.blake2b(event_template(event).encode(), digest_size=8)
+    for line in event.lines[1:]:
+        if line.startswith(_FRAME_PREFIX):
+            digest.update(normalize(line).encode())
+    return digest.hexdigest()
+
+
+def group_incidents(events: Iterable[LogEvent]) -> List[Incident]:
+    """Group events by fingerprint, keeping the order in which incidents first appeared."""
+    incidents: Dict[str, Incident] = {}
+    for event in events:
+        key = fingerprint(event)
+        incident = incidents.get(key)
+        if incident is None:
+            incident = incidents[key] = Incident(key, event_template(event), event)
+        incident.add(event)
+    return list(incidents.values())
+
+
+class FingerprintTracker:
+    """
+    Seen-set of fingerprints with a time-to-live. A fingerprint stays known while it keeps
+    recurring and is forgotten after `ttl` seconds without occurrences, so only new errors (or
+    errors coming back after a quiet period) get through `filter_new`.
+
+    A new fingerprint is only pending until its incident is reported: `confirm` adds it to the
+    seen-set, `release` forgets it so that its next occurrence gets through again. A triage that
+    fails, or is cut short by a crash, thus doesn't lose the error.
+
+    With a `store`, the seen-set is loaded from and written through to it so it survives restarts;
+    lookups are always served from memory.
+    """
+
+    def __init__(self, ttl: float = 3600, store: Optional[StateStore] = None):
+        self.ttl = ttl
+        self._store = store
+        # fingerprint -> last time seen, ordered from least to most recently seen
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        # New fingerprints whose incident is being reported
+        self._pending: Set[str] = set()
+        if store is not None:
+            self._seen.update(store.get_fingerprints(seen_after=time.time() - ttl))
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._seen
+
+    def _evict(self, now: float):
+        while self._seen:
+            fingerprint, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl:
+                break
+            self._seen.popitem(last=False)
+
+    def _mark_seen(self, fingerprints: List[str], now: float):
+        for fingerprint in fingerprints:
+            self._seen[fingerprint] = now
+            self._seen.move_to_end(fingerprint)
+        if self._store is not None:
+            self._store.expire_fingerprints(seen_before=now - self.ttl)
+            self._store.set_fingerprints(fingerprints, now)
+
+    def filter_new(self, incidents: Iterable[Incident]) -> List[Incident]:
+        """
+        Return the incidents whose fingerprint is neither known nor pending, now pending, and
+        refresh the known ones.
+        """
+        now = time.time()
+        self._evict(now)
+        new_incidents = []
+        known = []
+        for incident in incidents:
+            if incident.fingerprint in self._seen:
+                known.append(incident.fingerprint)
+            elif incident.fingerprint not in self._pending:
+                self._pending.add(incident.fingerprint)
+                new_incidents.append(incident)
+        self._mark_seen(known, now)
+        return new_incidents
+
+    def confirm(self, incidents: Iterable[Incident]):
+        """Add the fingerprints of incidents returned by `filter_new` to the seen-set."""
+        fingerprints = [incident.fingerprint for incident in incidents]
+        self._pending.difference_update(fingerprints)
+        self._mark_seen(fingerprints, time.time())
+
+    def release(self, incidents: Iterable[Incident]):
+        """Forget the fingerprints of incidents returned by `filter_new` that weren't reported."""
+        self._pending.difference_update(incident.fingerprint for incident in incidents)
@@ -0,0 +1,164 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional
+
+from utils.fingerprint import Incident
+from utils.log_store import LogEventStore
+from utils.logger import logger
+from utils.quantiles import DDSketch
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _RollingSketch:
+    """A ring of per-interval sketches of one operation's response times."""
+
+    __slots__ = ("sketches", "interval", "first")
+
+    def __init__(self, size: int, accuracy: float):
+        self.sketches = [DDSketch(accuracy) for _ in range(size)]
+        # Index of the interval the newest sketch covers, and of the first one ever seen
+        self.interval: Optional[int] = None
+        self.first: Optional[int] = None
+
+    def add(self, interval: int, value: float):
+        if self.interval is None or interval > self.interval:
+            steps = interval - self.interval if self.interval is not None else 0
+            for skipped in range(1, min(steps, len(self.sketches)) + 1):
+                self.sketches[(self.interval + skipped) % len(self.sketches)] = (
+                    DDSketch(self.sketches[0].accuracy)
+                )
+            self.interval = interval
+            if self.first is None:
+                self.first = interval
+        # Late values fall into the newest interval
+        self.sketches[self.interval % len(self.sketches)].add(value)
+
+    def window(self, first: int, last: int) -> DDSketch:
+        """The merge of the sketches of intervals [first, last]."""
+        sketches = [
+            self.sketches[interval % len(self.sketches)]
+            for interval in range(
+                max(first, self.interval - len(self.sketches) + 1), last + 1
+            )
+            if interval <= self.interval
+        ]
+        return DDSketch.merged(sketches, accuracy=self.sketches[0].accuracy)
+
+
+class LatencyMonitor:
+    """
+    Rolling p50/p95/p99 response times per operation (method and endpoint of requests, component
+    of slow query reports), in constant memory: each operation keeps a ring of `intervals`
+    DDSketches of `interval_seconds` each.
+
+    Whenever an interval closes, the last `recent` closed intervals of every operation are compared
+    to the intervals before them, once the operation has been seen for `warmup` intervals (a
+    baseline of a couple of minutes is mostly noise). An operation whose quantiles grew by `ratio` or more, with at
+    least `min_samples` values on both sides, is reported as a regression `Incident` summarising
+    the quantiles, so the agent gets a few numbers instead of thousands of log lines.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 60,
+        intervals: int = 60,
+        recent: int = 5,
+        ratio: float = 1.5,
+        min_samples: int = 30,
+        warmup: int = 15,
+        accuracy: float = 0.01,
+        max_operations: int = 1000,
+    ):
+        self.interval_ms = int(interval_seconds * 1000)
+        self.intervals = intervals
+        self.recent = recent
+        self.ratio = ratio
+        self.min_samples = min_samples
+        self.warmup = max(warmup, recent + 1)
+        self.accuracy = accuracy
+        self.max_operations = max_operations
+        self._operations: "OrderedDict[str, _RollingSketch]" = OrderedDict()
+        # Row of the event store read up to, and the latest interval seen
+        self._row = 0
+        self._interval: Optional[int] = None
+
+    def _add(self, key: int, operation: str, value: float):
+        rolling = self._operations.get(operation)
+        if rolling is None:
+            rolling = self._operations[operation] = _RollingSketch(
+                self.intervals, self.accuracy
+            )
+            if len(self._operations) > self.max_operations:
+                self._operations.popitem(last=False)
+        else:
+            self._operations.move_to_end(operation)
+        rolling.add(key // self.interval_ms, value)
+
+    def update(self, store: LogEventStore) -> List[Incident]:
+        """Read the response times stored since the last update, and return new regressions."""
+        regressions = []
+        for key, operation, value in store.response_times(self._row):
+            interval = key // self.interval_ms
+            if self._interval is not None and interval > self._interval:
+                # Every interval up to `interval - 1` is now complete
+                regressions.extend(self._check(interval - 1))
+            if self._interval is None or interval > self._interval:
+                self._interval = interval
+            self._add(key, operation, value)
+        self._row = store.end_row
+        return regressions
+
+    def _check(self, last_closed: int) -> List[Incident]:
+        first_recent = last_closed - self.recent + 1
+        regressions = []
+        for operation, rolling in self._operations.items():
+            if last_closed - rolling.first + 1 < self.warmup:
+                continue
+            recent = rolling.window(first_recent, last_closed)
+            if recent.count < self.min_samples:
+                continue
+            baseline = rolling.window(
+                last_closed - self.intervals + 1, first_recent - 1
+            )
+            if baseline.count < self.min_samples:
+                continue
+            before = [baseline.quantile(q) for q in QUANTILES]
+            after = [recent.quantile(q) for q in QUANTILES]
+            if not any(
+                old > 0 and new >= self.ratio * old for old, new in zip(before, after)
+            ):
+                continue
+            regressions.append(
+                self._incident(operation, first_recent, last_closed, recent, baseline)
+            )
+        return regressions
+
+    def _incident(
+        self,
+        operation: str,
+        first: int,
+        last: int,
+        recent: DDSketch,
+        baseline: DDSketch,
+    ) -> Incident:
+        fingerprint = hashlib.blake2b(
+            f"latency:{operation}".encode(), digest_size=8
+        ).hexdigest()
+        incident = Incident(
+            fingerprint, f"Response time regression on {operation}", sample=None
+        )
+        incident.count = recent.count
+        incident.first_seen = first * self.interval_ms
+        incident.last_seen = (last + 1) * self.interval_ms - 1
+        quantiles = ", ".join(
+            f"p{round(q * 100)} {baseline.quantile(q):.3g}ms -> {recent.quantile(q):.3g}ms"
+            for q in QUANTILES
+        )
+        recent_minutes = self.recent * self.interval_ms / 60000
+        incident.reason = (
+            f"{quantiles} over the last {recent_minutes:g} min ({recent.count} samples), "
+            f"against the previous {baseline.count} samples"
+        )
+        logger.info(f"Latency regression on {operation}: {incident.reason}")
+        return incident
@@ -0,0 +1,195 @@
+import os
+import threading
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from utils.log_events import datetime_to_key
+from utils.log_index import line_key
+from utils.logger import logger
+
+try:
+    import zstandard
+except ImportError:  # Only needed for .zst archives
+    zstandard = None
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+# Decompressed bytes between two checkpoints of an archive index
+ARCHIVE_CHECKPOINT_SPAN = 1024 * 1024
+# Checkpoints kept per archive: past this, every other one is dropped and the span doubled, so a
+# gzip archive's index stays within ~2.5MB of decompressor snapshots whatever its size
+_MAX_ARCHIVE_CHECKPOINTS = 64
+# Compressed bytes fed to the decompressor at a time
+_READ_SIZE = 256 * 1024
+# Archive indexes kept in memory, least recently used ones are dropped first
+_MAX_CACHED_ARCHIVES = 16
+
+
+class _Checkpoint:
+    """A point in an archive from which decompression can resume."""
+
+    __slots__ = ("key", "offset", "position", "decompressor", "pending")
+
+    def __init__(self, key, offset, position, decompressor, pending):
+        # Epoch milliseconds of the first record header after the checkpoint
+        self.key: Optional[int] = key
+        # Compressed bytes before the checkpoint
+        self.offset: int = offset
+        # Decompressed bytes before the checkpoint
+        self.position: int = position
+        # Decompressor state at the checkpoint, None at a gzip member / zstd frame boundary
+        self.decompressor = decompressor
+        # Start of a line cut by the checkpoint
+        self.pending: bytes = pending
+
+
+class CompressedLogArchive:
+    """
+    Streams the lines of a compressed rotated log (`.gz`, or `.zst` when `zstandard` is installed)
+    and keeps an in-memory checkpoint index, filled in as the archive is read, so that later
+    windows only decompress from the checkpoint preceding their start.
+
+    gzip checkpoints are snapshots of the decompressor (`zlib` can copy its state) taken every
+    ARCHIVE_CHECKPOINT_SPAN decompressed bytes, thinned out to at most _MAX_ARCHIVE_CHECKPOINTS
+    per archive as it is read further (a large archive gets proportionally wider spans). zstd decompressors cannot be copied, so zstd
+    archives only get checkpoints at frame boundaries: a single-frame archive is decompressed from
+    the top, but still only up to the end of the window.
+    """
+
+    def __init__(self, path: Path, span: int = ARCHIVE_CHECKPOINT_SPAN):
+        self.path = Path(path)
+        self.span = span
+        self._copyable = self.path.suffix == ".gz"
+        self._checkpoints: List[_Checkpoint] = [_Checkpoint(None, 0, 0, None, b"")]
+        # Keys of the checkpoints after the first one (the top of the archive has no key)
+        self._keys: List[int] = []
+        self._lock = threading.Lock()
+
+    def _decompressor(self):
+        if self.path.suffix == ".gz":
+            return zlib.decompressobj(wbits=31)
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    def _start(self, dt: Optional[datetime]) -> _Checkpoint:
+        """The last checkpoint from which a forward scan sees every line logged at or after `dt`."""
+        with self._lock:
+            if dt is None:
+                return self._checkpoints[0]
+            position = bisect_left(self._keys, datetime_to_key(dt))
+            # `_keys[position - 1]` is the last key before `dt`, and belongs to `_checkpoints[position]`
+            return self._checkpoints[position]
+
+    def _add_checkpoint(self, checkpoint: _Checkpoint):
+        with self._lock:
+            if checkpoint.position > self._checkpoints[-1].position:
+                self._checkpoints.append(checkpoint)
+                self._keys.append(checkpoint.key)
+                if len(self._keys) > _MAX_ARCHIVE_CHECKPOINTS:
+                    self._thin_checkpoints()
+
+    def _thin_checkpoints(self):
+        """Drop every other checkpoint but the top of the archive and the last one."""
+        kept = self._checkpoints[2 - len(self._keys) % 2 :: 2]
+        self._checkpoints = [self._checkpoints[0], *kept]
+        self._keys = [checkpoint.key for checkpoint in kept]
+        self.span *= 2
+        logger.debug(
+            f"Thinned the checkpoints of {self.path} out to {len(kept)}, every {self.span} bytes"
+        )
+
+    def iter_lines(self, since: Optional[datetime] = None) -> Iterator[str]:
+        """
+        Yield the decompressed lines of the archive, starting at the checkpoint preceding `since`.
+        Decompression stops as soon as the caller stops iterating.
+        """
+        start = self._start(since)
+        decompressor = (
+            start.decompressor.copy()
+            if start.decompressor is not None
+            else self._decompressor()
+        )
+        offset, position, pending = start.offset, start.position, start.pending
+        # Checkpoint waiting for the first header line after it to be searchable
+        candidate: Optional[_Checkpoint] = None
+        logger.debug(f"Decompressing {self.path} from byte {offset}")
+
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            while True:
+                chunk = file.read(_READ_SIZE)
+                if not chunk:
+                    break
+                while chunk:
+                    data = decompressor.decompress(chunk)
+                    if decompressor.eof:
+                        # End of a gzip member or zstd frame, the rest of the chunk starts the next one
+                        rest = decompressor.unused_data
+                        offset += len(chunk) - len(rest)
+                        # gzip members may be followed by zero padding
+                        chunk = rest.lstrip(b"\0")
+                        decompressor = None
+                    else:
+                        offset += len(chunk)
+                        chunk = b""
+                    position += len(data)
+
+                    lines = (pending + data).split(b"\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        if candidate is not None:
+                            key = line_key(line)
+                            if key is not None:
+                                candidate.key = key
+                                self._add_checkpoint(candidate)
+                                candidate = None
+                        yield line.decode("utf-8", errors="replace") + "\n"
+
+                    if (
+                        candidate is None
+                        and position - self._checkpoints[-1].position >= self.span
+                        and (decompressor is None or self._copyable)
+                    ):
+                        candidate = _Checkpoint(
+                            None,
+                            offset,
+                            position,
+                            decompressor.copy() if decompressor is not None else None,
+                            pending,
+                        )
+                    if decompressor is None:
+                        decompressor = self._decompressor()
+        if pending:
+            yield pending.decode("utf-8", errors="replace")
+
+
+_archives: "OrderedDict[Tuple[int, int, int], CompressedLogArchive]" = OrderedDict()
+_archives_lock = threading.Lock()
+
+
+def open_archive(path: Path) -> Optional[CompressedLogArchive]:
+    """
+    The archive at `path`, reusing its index if it was read before. Archives are identified by
+    inode, size and mtime, so the index follows them through logrotate's renames (`.1.gz` to
+    `.2.gz`). Returns None when the archive cannot be decompressed here.
+    """
+    path = Path(path)
+    if path.suffix == ".zst" and zstandard is None:
+        logger.warning(f"Skipping {path}: zstandard is required to read .zst logs")
+        return None
+    stat = os.stat(path)
+    identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _archives_lock:
+        archive = _archives.get(identity)
+        if archive is None:
+            archive = _archives[identity] = CompressedLogArchive(path)
+            if len(_archives) > _MAX_CACHED_ARCHIVES:
+                _archives.popitem(last=False)
+        else:
+            # Renamed since it was indexed
+            archive.path = path
+            _archives.move_to_end(identity)
+    return archive
@@ -0,0 +1,230 @@
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from utils.logger import logger
+
+# `[2025-05-01 17:44:43.055] [ERROR] ...`, the header of every record written by BankLogGenerator.
+# The fixed layout lets the fast path slice fields at known offsets; the pattern is the fallback
+# for headers with a different sub-second precision.
+_HEADER_PATTERN = re.compile(
+    r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:\.(\d+))?\](?: \[([A-Z]+)\])?"
+)
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_DAY_CACHE_SIZE = 4096
+
+# Epoch milliseconds of each `YYYY-MM-DD` date seen recently: a log spans few days
+_day_keys: Dict[str, int] = {}
+# `17:44` -> milliseconds since midnight, and `:43` -> milliseconds: validating and converting
+# the time of day takes two lookups
+_HOUR_MINUTES = {
+    f"{hour:02d}:{minute:02d}": (hour * 60 + minute) * 60000
+    for hour in range(24)
+    for minute in range(60)
+}
+_SECONDS = {f":{second:02d}": second * 1000 for second in range(60)}
+# `.055]` -> 55, validates the separators and converts the milliseconds in one lookup
+_MILLIS = {f".{millis:03d}]": millis for millis in range(1000)}
+# The standard levels, their ` [LEVEL]` field and where it ends, keyed by their (distinct) initials
+_LEVELS = {
+    level[0]: (level, f" [{level}]", 28 + len(level))
+    for level in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+}
+
+
+def datetime_to_key(dt: datetime) -> int:
+    """Naive datetime to the integer key (milliseconds since epoch) log timestamps are compared on."""
+    return (dt - _EPOCH) // timedelta(milliseconds=1)
+
+
+def key_to_datetime(key: int) -> datetime:
+    return _EPOCH + timedelta(milliseconds=key)
+
+
+def _day_key(day: str) -> Optional[int]:
+    # Also keeps out the ISO week dates fromisoformat accepts (`2025-W18-4`)
+    if day[4:5] != "-" or day[7:8] != "-" or not day[5:7].isdigit():
+        return None
+    try:
+        key = (date.fromisoformat(day).toordinal() - _EPOCH_ORDINAL) * 86400000
+    except ValueError:
+        return None
+    if len(_day_keys) >= _DAY_CACHE_SIZE:
+        _day_keys.clear()
+    _day_keys[day] = key
+    return key
+
+
+def _parse_header_slow(line: str) -> Optional[Tuple[int, Optional[str]]]:
+    match = _HEADER_PATTERN.match(line)
+    if not match:
+        return None
+    try:
+        timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        logger.warning(f"Failed to parse timestamp: {match.group(1)}")
+        return None
+    millis = int((match.group(2) or "0")[:3].ljust(3, "0"))
+    return datetime_to_key(timestamp) + millis, match.group(3)
+
+
+def parse_header(line: str) -> Optional[Tuple[int, Optional[str]]]:
+    """
+    Return (epoch milliseconds, level) if `line` starts a new record, None for continuation lines.
+
+    Fields are sliced at fixed offsets and converted with table lookups; only the date goes
+    through a (cached) conversion, so the common case costs a few slices and dict lookups instead
+    of a regex and strptime, whether or not the second was seen before.
+    """
+    if line[:1] != "[":
+        return None
+    key = _day_keys.get(line[1:11])
+    if key is None:
+        key = _day_key(line[1:11])
+    time_of_day = _HOUR_MINUTES.get(line[12:17])
+    seconds = _SECONDS.get(line[17:20])
+    millis = _MILLIS.get(line[20:25])
+    if (
+        key is None
+        or time_of_day is None
+        or seconds is None
+        or millis is None
+        or line[11:12] != " "
+    ):
+        return _parse_header_slow(line)
+    key += time_of_day + seconds + millis
+
+    # Standard levels cost one lookup on their initial and one comparison of their field
+    level = _LEVELS.get(line[27:28])
+    if level is not None and line[25 : level[2]] == level[1]:
+        return key, level[0]
+    level = None
+    end = line.find("]", 27, 40)
+    if (
+        line[25:27] == " ["
+        and end > 0
+        and line[27:end].isalpha()
+        and line[27:end].isupper()
+    ):
+        level = line[27:end]
+    return key, level
+
+
+class LogEvent:
+    """A single log record: its timestamped header line plus any continuation lines (e.g. a traceback)."""
+
+    __slots__ = ("key", "level", "lines", "source")
+
+    def __init__(
+        self,
+        key: Optional[int],
+        level: Optional[str],
+        lines: Tuple[str, ...],
+        source: Optional[str] = None,
+    ):
+        # Epoch milliseconds of the header, None for orphaned continuation lines
+        self.key = key
+        self.level = level
+        self.lines = lines
+        # Name of the log file the event was read from
+        self.source = source
+
+    def __repr__(self):
+        return f"LogEvent({self.timestamp}, {self.level}, {len(self.lines)} lines)"
+
+    @property
+    def timestamp(self) -> Optional[datetime]:
+        return None if self.key is None else key_to_datetime(self.key)
+
+    @property
+    def header(self) -> str:
+        return self.lines[0]
+
+    @property
+    def text(self) -> str:
+        return "".join(self.lines)
+
+    @property
+    def size(self) -> int:
+        return sum(len(line) for line in self.lines)
+
+
+def iter_events(
+    lines: Iterable[str], source: Optional[str] = None
+) -> Iterator[LogEvent]:
+    """
+    Assemble lines into events in a single pass. Lines seen before the first header (e.g. the tail
+    of a record cut by a time-window seek) become an event without timestamp.
+    """
+    key = level = None
+    record = []
+    for line in lines:
+        header = parse_header(line)
+        if header:
+            if record:
+                yield LogEvent(key, level, tuple(record), source)
+            key, level = header
+            record = [line]
+        else:
+            record.append(line)
+    if record:
+        yield LogEvent(key, level, tuple(record), source)
+
+
+if __name__ == "__main__":
+    # Benchmark the fast header parser against the original regex + strptime path, on headers of
+    # the generator's records spaced like its output (0.1 to 4 s apart), so that nearly every
+    # line is a new second, starting from an empty cache on every run
+    import random
+    import timeit
+
+    from utils.random_log_generator import BankLogGenerator
+
+    random.seed(0)
+    generator = BankLogGenerator()
+    clock = datetime(2025, 5, 1, 23, 0)
+    lines = []
+    for _ in range(10000):
+        clock += timedelta(seconds=random.uniform(0.1, 4.0))
+        header = generator.generate_log().split("\n", 1)[0]
+        lines.append(f"[{clock:%Y-%m-%d %H:%M:%S.%f}"[:24] + header[24:] + "\n")
+    seconds = len({line[1:20] for line in lines})
+
+    # The original per-line path: a regex match, then strptime in a separate helper
+    def parse_timestamp_str(timestamp_str):
+        try:
+            return datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+
+    def parse_timestamp(line):
+        match = re.match(r"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)\]", line)
+        if match:
+            return parse_timestamp_str(match.group(1).split(".")[0])
+        return None
+
+    def baseline():
+        for line in lines:
+            parse_timestamp(line)
+
+    def fast():
+        for line in lines:
+            parse_header(line)
+
+    assert all(
+        parse_header(line)[0]
+        == datetime_to_key(parse_timestamp(line)) + int(line[21:24])
+        for line in lines
+    )
+    # Interleaved runs, keeping the best of each, so that noise affects both sides alike
+    baseline_time = fast_time = float("inf")
+    for _ in range(25):
+        baseline_time = min(baseline_time, timeit.timeit(baseline, number=1))
+        _day_keys.clear()
+        fast_time = min(fast_time, timeit.timeit(fast, number=1))
+    print(f"{len(lines)} headers, {seconds} distinct seconds")
+    print(f"regex + strptime: {baseline_time / len(lines) * 1e9:8.0f} ns/line")
+    print(
+        f"fast parser:      {fast_time / len(lines) * 1e9:8.0f} ns/line ({baseline_time / fast_time:.1f}x)"
+    )
@@ -0,0 +1,147 @@
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from utils.log_events import datetime_to_key, parse_header
+from utils.logger import logger
+
+# Distance in bytes between two checkpoints of the index
+INDEX_STRIDE = 256 * 1024
+
+_HEADER = struct.Struct("<8sq")
+_MAGIC = b"SREIDX02"
+
+
+def line_key(line: bytes) -> Optional[int]:
+    # Only the fixed-size header prefix needs decoding
+    header = parse_header(line[:40].decode("utf-8", errors="replace"))
+    return header[0] if header else None
+
+
+class SparseTimestampIndex:
+    """
+    On-disk sparse index mapping log timestamps to byte offsets.
+
+    A checkpoint (timestamp, offset of the line) is recorded roughly every `stride` bytes, so a
+    lookup for `from_time` is a binary search followed by a short forward scan. The index is
+    stored next to the log as `<log>.idx`, extended incrementally as the log grows and rebuilt
+    when the log is rotated or truncated.
+    """
+
+    def __init__(
+        self,
+        log_path: Path,
+        stride: int = INDEX_STRIDE,
+        index_path: Optional[Path] = None,
+    ):
+        self.log_path = Path(log_path)
+        self.index_path = index_path or self.log_path.with_name(
+            self.log_path.name + ".idx"
+        )
+        self.stride = stride
+        self.inode: Optional[int] = None
+        self._timestamps = array("q")
+        self._offsets = array("q")
+        self._persist = True
+        self._load()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _load(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, inode = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC:
+                    raise ValueError("unexpected header")
+                entries = array("q")
+                entries.frombytes(f.read())
+        except FileNotFoundError:
+            return
+        except (struct.error, ValueError) as e:
+            logger.warning(f"Ignoring corrupt log index {self.index_path}: {e}")
+            return
+
+        self.inode = inode
+        # Entries are stored as interleaved (timestamp, offset) pairs
+        self._timestamps = entries[0::2]
+        self._offsets = entries[1::2][: len(self._timestamps)]
+        del self._timestamps[len(self._offsets) :]
+        logger.debug(f"Loaded {len(self)} checkpoints from {self.index_path}")
+
+    def _reset(self, inode: int):
+        self.inode = inode
+        self._timestamps = array("q")
+        self._offsets = array("q")
+        self._write(array("q"), truncate=True)
+
+    def _write(self, entries: array, truncate: bool = False):
+        if not self._persist:
+            return
+        try:
+            with open(self.index_path, "wb" if truncate else "ab") as f:
+                if truncate:
+                    f.write(_HEADER.pack(_MAGIC, self.inode))
+                f.write(entries.tobytes())
+        except OSError as e:
+            logger.warning(
+                f"Cannot write log index {self.index_path}, keeping it in memory: {e}"
+            )
+            self._persist = False
+
+    def _next_checkpoint(self, file: BinaryIO, offset: int):
+        """Return (timestamp, offset) of the first timestamped line starting at or after `offset`."""
+        file.seek(offset)
+        if offset:
+            # Skip the remainder of the line we landed in
+            if not file.readline().endswith(b"\n"):
+                return None
+        while True:
+            line_offset = file.tell()
+            line = file.readline()
+            if not line.endswith(b"\n"):
+                # End of file or a line that is still being written
+                return None
+            timestamp = line_key(line)
+            if timestamp is not None:
+                return timestamp, line_offset
+
+    def update(self):
+        """Extend the index with checkpoints for the data appended since the last update."""
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return
+
+        if stat.st_ino != self.inode or (
+            self._offsets and stat.st_size < self._offsets[-1]
+        ):
+            logger.debug(f"Rebuilding log index for {self.log_path}")
+            self._reset(stat.st_ino)
+
+        new_entries = array("q")
+        with open(self.log_path, "rb") as file:
+            offset = self._offsets[-1] + self.stride if self._offsets else 0
+            while offset < stat.st_size:
+                checkpoint = self._next_checkpoint(file, offset)
+                if checkpoint is None:
+                    break
+                timestamp, line_offset = checkpoint
+                self._timestamps.append(timestamp)
+                self._offsets.append(line_offset)
+                new_entries.extend(checkpoint)
+                offset = line_offset + self.stride
+
+        if new_entries:
+            self._write(new_entries)
+            logger.debug(f"Added {len(new_entries) // 2} checkpoints to the log index")
+
+    def lookup(self, dt: datetime) -> int:
+        """Byte offset from which a forward scan sees every line logged at or after `dt`."""
+        position = bisect_left(self._timestamps, datetime_to_key(dt))
+        # The checkpoint before the first one >= dt may still precede lines logged at dt
+        return self._offsets[position - 1] if position else 0
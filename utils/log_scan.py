@@ -0,0 +1,294 @@
+import atexit
+import heapq
+import io
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+from utils.compaction import LogCompactor
+from utils.log_events import LogEvent, datetime_to_key, iter_events
+from utils.log_index import line_key
+from utils.logger import logger
+
+# Bytes decoded at a time when scanning a memory-mapped log, and scanned before their pages are released
+_SCAN_BLOCK_BYTES = 1024 * 1024
+_RELEASE_BYTES = 8 * 1024 * 1024
+
+# Processes scanning large windows in parallel, fewer than 2 scans them in the calling thread
+LOG_SCAN_WORKERS = int(os.environ.get("LOG_SCAN_WORKERS", os.cpu_count() or 1))
+# Windows smaller than this are not worth splitting across processes
+LOG_SCAN_PARALLEL_MIN_BYTES = int(
+    os.environ.get("LOG_SCAN_PARALLEL_MIN_BYTES", 64 * 1024 * 1024)
+)
+
+
+def filter_events(
+    events: Iterable[LogEvent],
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+) -> Iterator[LogEvent]:
+    """
+    Yield the events of one file inside the window. Logs are written in time order, so the scan
+    stops at the first event past `to_dt`. Bounds have second precision and are inclusive.
+    """
+    # Compare on integer epoch milliseconds rather than datetimes
+    from_key = datetime_to_key(from_dt) if from_dt else None
+    to_key = datetime_to_key(to_dt) + 999 if to_dt else None
+    for event in events:
+        if event.key is None:
+            # Continuation lines whose header is outside what was read
+            if from_key is None and to_key is None:
+                yield event
+            continue
+        if to_key is not None and event.key > to_key:
+            break
+        if from_key is not None and event.key < from_key:
+            continue
+        yield event
+
+
+def _merge_key(event: LogEvent) -> int:
+    # Orphaned continuation lines only show up at the top of a file, keep them first
+    return -1 if event.key is None else event.key
+
+
+def merge_events(streams: Iterable[Iterable[LogEvent]]) -> Iterator[LogEvent]:
+    """k-way merge of per-file event streams (each in time order) into one stream in time order."""
+    return heapq.merge(*streams, key=_merge_key)
+
+
+def _next_header(mapped: mmap.mmap, position: int) -> Tuple[int, Optional[int]]:
+    """Start and key of the first record header on a line starting at or after `position`."""
+    size = len(mapped)
+    if position and mapped[position - 1 : position] != b"\n":
+        position = mapped.find(b"\n", position) + 1 or size
+    while position < size:
+        if mapped[position : position + 1] == b"[":
+            key = line_key(mapped[position : position + 40])
+            if key is not None:
+                return position, key
+        # Continuation lines are skipped in C, without being decoded
+        position = mapped.find(b"\n[", position)
+        if position < 0:
+            break
+        position += 1
+    return size, None
+
+
+def _seek_key(mapped: mmap.mmap, offset: int, key: int) -> int:
+    """
+    Byte offset of the first record at or after `offset` logged at or after `key`, found by
+    bisecting on record headers (logs are written in time order) and finished by a short scan.
+    """
+    low, high = offset, len(mapped)
+    while high - low > _SCAN_BLOCK_BYTES:
+        middle = (low + high) // 2
+        start, start_key = _next_header(mapped, middle)
+        if start_key is not None and start_key < key:
+            low = start
+        else:
+            high = middle
+    while True:
+        start, start_key = _next_header(mapped, low)
+        if start_key is None or start_key >= key:
+            return start
+        low = start + 1
+
+
+def _map(file) -> Optional[mmap.mmap]:
+    try:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty file
+        return None
+
+
+def _window_bounds(
+    mapped: mmap.mmap,
+    offset: int,
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+) -> Tuple[int, int]:
+    """Byte range, from `offset` on, of the records logged in the window."""
+    start = _seek_key(mapped, offset, datetime_to_key(from_dt)) if from_dt else offset
+    end = (
+        _seek_key(mapped, start, datetime_to_key(to_dt) + 1000)
+        if to_dt
+        else len(mapped)
+    )
+    return start, end
+
+
+def _iter_range_events(
+    mapped: mmap.mmap,
+    start: int,
+    end: int,
+    source: str,
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+) -> Iterator[LogEvent]:
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    # Bounds are re-checked, in case of out of order entries around the window's edges
+    return filter_events(
+        iter_events(_iter_mapped_lines(mapped, start, end), source), from_dt, to_dt
+    )
+
+
+def iter_mapped_events(
+    path: Path,
+    offset: int,
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+) -> Iterator[LogEvent]:
+    """
+    Memory-mapped equivalent of `filter_events(iter_events(file))` from byte `offset` on.
+
+    The bytes of the window are located first, by bisecting on record headers where only the
+    header prefix is decoded; only the window itself is then decoded, a block at a time. Pages are
+    handed back to the kernel once scanned, so memory use stays flat whatever the size of the file.
+    """
+    with open(path, "rb") as file:
+        mapped = _map(file)
+        if mapped is None:
+            return
+        with mapped:
+            start, end = _window_bounds(mapped, offset, from_dt, to_dt)
+            yield from _iter_range_events(mapped, start, end, path.name, from_dt, to_dt)
+
+
+def _scan_range(
+    path: Path,
+    start: int,
+    end: int,
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+    limits: Tuple[int, Optional[int], Optional[int], Optional[int]],
+) -> LogCompactor:
+    """Process pool task: parse, filter and compact one byte range, see `scan_parallel`."""
+    compactor = LogCompactor(*limits)
+    with open(path, "rb") as file:
+        mapped = _map(file)
+        if mapped is None:
+            return compactor
+        with mapped:
+            for event in _iter_range_events(
+                mapped, start, end, path.name, from_dt, to_dt
+            ):
+                compactor.add(event)
+    return compactor
+
+
+_scan_pool: Optional[ProcessPoolExecutor] = None
+_scan_pool_lock = threading.Lock()
+
+
+def _get_scan_pool() -> Optional[ProcessPoolExecutor]:
+    """The shared pool of scan processes, None when parallel scans are off."""
+    global _scan_pool
+    if LOG_SCAN_WORKERS < 2:
+        return None
+    with _scan_pool_lock:
+        if _scan_pool is None:
+            # Forking the monitor, which runs threads, could leave a child holding a lock that it
+            # will never get back: workers are forked from a clean server process that has only
+            # imported this module, or spawned where there is no such server
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _scan_pool = ProcessPoolExecutor(LOG_SCAN_WORKERS, mp_context=context)
+            atexit.register(shutdown_scan_pool)
+        return _scan_pool
+
+
+def shutdown_scan_pool():
+    """Stop the scan processes, if they were started; a later scan starts them again."""
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is not None:
+            _scan_pool.shutdown(cancel_futures=True)
+            _scan_pool = None
+
+
+def scan_parallel(
+    path: Path,
+    offset: int,
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+    compactor: LogCompactor,
+) -> bool:
+    """
+    Add the events of the window of a large file to `compactor`, scanning it with the process
+    pool. The window is split into byte ranges starting on record headers, so a multi-line record
+    (e.g. a traceback) is never cut between two workers. Each worker compacts its range within
+    the same limits (fingerprinting the events being most of the work) and the results are merged
+    in range order, see `LogCompactor.merge`.
+
+    Returns False when the window is too small to be worth it and should be read with
+    `iter_mapped_events`.
+    """
+    pool = _get_scan_pool()
+    if pool is None:
+        return False
+    with open(path, "rb") as file:
+        mapped = _map(file)
+        if mapped is None:
+            return False
+        with mapped:
+            start, end = _window_bounds(mapped, offset, from_dt, to_dt)
+            if end - start < LOG_SCAN_PARALLEL_MIN_BYTES:
+                return False
+            # A few ranges per worker, so that uneven ranges don't leave workers idle
+            step = max((end - start) // (LOG_SCAN_WORKERS * 4), _SCAN_BLOCK_BYTES)
+            bounds = [start]
+            while bounds[-1] + step < end:
+                boundary = _next_header(mapped, bounds[-1] + step)[0]
+                if boundary >= end:
+                    break
+                bounds.append(boundary)
+            bounds.append(end)
+
+    logger.debug(f"Scanning {end - start} bytes of {path} in {len(bounds) - 1} ranges")
+    limits = (
+        compactor.token_budget,
+        compactor.max_records,
+        compactor.max_lines,
+        compactor.max_bytes,
+    )
+    futures = [
+        pool.submit(_scan_range, path, range_start, range_end, from_dt, to_dt, limits)
+        for range_start, range_end in zip(bounds, bounds[1:])
+    ]
+    for future in futures:
+        compactor.merge(future.result())
+    return True
+
+
+def _iter_mapped_lines(mapped: mmap.mmap, start: int, end: int) -> Iterator[str]:
+    """Decode [start, end) of the map in blocks ending on a line boundary."""
+    released = start - start % mmap.PAGESIZE
+    while start < end:
+        stop = min(start + _SCAN_BLOCK_BYTES, end)
+        if stop < end:
+            newline = mapped.rfind(b"\n", start, stop)
+            stop = (
+                newline + 1
+                if newline >= 0
+                else mapped.find(b"\n", stop, end) + 1 or end
+            )
+        # Universal newlines, like reading the file in text mode
+        yield from io.StringIO(
+            mapped[start:stop].decode("utf-8", errors="replace"), newline=None
+        )
+        start = stop
+        if start - released >= _RELEASE_BYTES and hasattr(mapped, "madvise"):
+            boundary = start - start % mmap.PAGESIZE
+            mapped.madvise(mmap.MADV_DONTNEED, released, boundary - released)
+            released = boundary
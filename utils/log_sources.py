@@ -0,0 +1,67 @@
+import glob
+import os
+import re
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from utils.logger import logger
+
+# Names rotated siblings get from logrotate and friends: `app.log.1`, `app.log.2.gz`, ...
+_ROTATED_SUFFIX = re.compile(r"\.(\d+)(\.gz|\.zst)?$")
+_GLOB_MAGIC = re.compile(r"[*?[]")
+# Files picked up when a directory is given as a source
+DIRECTORY_PATTERN = "*.log"
+
+
+class LogSourceRegistry:
+    """
+    The set of log files to monitor, described by plain paths, glob patterns or directories
+    (meaning every `*.log` file in them). Patterns are re-resolved on every call to `resolve`, so
+    files created after startup are picked up. Rotated siblings (`.1`, `.2.gz`, ...) are not live
+    sources, they are listed per file by `rotated`.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern:
+                continue
+            if os.path.isdir(pattern):
+                pattern = os.path.join(pattern, DIRECTORY_PATTERN)
+            self.patterns.append(os.path.abspath(pattern))
+        logger.debug(f"Log sources: {self.patterns}")
+
+    def resolve(self) -> List[Path]:
+        """The live log files currently matching the sources."""
+        paths = set()
+        for pattern in self.patterns:
+            if not _GLOB_MAGIC.search(pattern):
+                paths.add(Path(pattern))
+                continue
+            for match in glob.glob(pattern, recursive=True):
+                if os.path.isfile(match) and not _ROTATED_SUFFIX.search(match):
+                    paths.add(Path(match))
+        return sorted(paths)
+
+    def rotated(self, path: Path) -> List[Path]:
+        """Rotated siblings of `path`, most recent (`.1`) first."""
+        siblings = []
+        for sibling in glob.glob(glob.escape(str(path)) + ".*"):
+            match = _ROTATED_SUFFIX.fullmatch(sibling[len(str(path)) :])
+            if match:
+                siblings.append((int(match.group(1)), Path(sibling)))
+        return [sibling for _, sibling in sorted(siblings)]
+
+    def watch_targets(self) -> Optional[List[Tuple[Path, str]]]:
+        """
+        (directory, file name pattern) pairs covering every source, for directory watches. None when
+        a source has wildcards in its directory part and can only be followed by polling.
+        """
+        targets = []
+        for pattern in self.patterns:
+            directory, name = os.path.split(pattern)
+            if _GLOB_MAGIC.search(directory):
+                return None
+            targets.append((Path(directory), name))
+        return targets
@@ -0,0 +1,457 @@
+import math
+import re
+import threading
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.log_events import LogEvent, datetime_to_key, key_to_datetime
+from utils.logger import logger
+
+try:
+    import numpy as np
+except ImportError:  # Queries fall back to plain loops
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Only needed to spill evicted rows to Parquet
+    pyarrow = None
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# The kinds of records written by BankLogGenerator
+KINDS = ("request", "transaction", "auth", "system", "error")
+
+_REQUEST = re.compile(
+    r"\[RequestID: (?P<request_id>[0-9a-f-]{36})\] (?P<method>[A-Z]+) (?P<endpoint>\S+) - "
+    r"User: (?P<user>\S+) - Session: \S+ - IP: \S+ - Status: (?P<status>\d{3}) - "
+    r"Time: (?P<response_ms>[\d.]+)ms"
+)
+_ERROR = re.compile(
+    r"\[RequestID: (?P<request_id>[0-9a-f-]{36})\] \[host: (?P<host>[^\]]+)\] "
+    r"Unhandled exception during (?P<endpoint>\S+) request processing: (?P<error_type>\w+):"
+)
+_TRANSACTION = re.compile(
+    r"\[TransactionID: \w+\] (?P<user>\S+) [A-Z_]+ \$(?P<amount>[\d.]+) "
+    r".* - (?:SUCCESS|FAILED)$"
+)
+_AUTH = re.compile(
+    r"\[Auth\] (?:User (?P<user>\S+) successfully logged in|"
+    r"Failed login attempt for user (?P<failed_user>\S+))"
+)
+_SYSTEM = re.compile(
+    r"\[(?P<component>\w+)\] \[(?P<host>[^\]]+)\] \[PID:(?P<pid>\d+)\] "
+)
+_SLOW_QUERY = re.compile(r"Slow query detected: execution time (?P<seconds>[\d.]+)s")
+
+
+class ParsedFields(NamedTuple):
+    """Structured fields of one log record; absent fields are None."""
+
+    kind: Optional[str] = None
+    request_id: Optional[str] = None
+    method: Optional[str] = None
+    endpoint: Optional[str] = None
+    status: Optional[int] = None
+    response_ms: Optional[float] = None
+    user: Optional[str] = None
+    component: Optional[str] = None
+    host: Optional[str] = None
+    pid: Optional[int] = None
+    error_type: Optional[str] = None
+    amount: Optional[float] = None
+
+
+def parse_fields(event: LogEvent) -> ParsedFields:
+    """Extract the structured fields of a record in one of the BankLogGenerator formats."""
+    if event.key is None:
+        return ParsedFields()
+    header = event.lines[0]
+    # Skip `[timestamp] [LEVEL] `
+    start = header.find("] ", 25) + 2
+    if start < 2:
+        return ParsedFields()
+    rest = header[start:].rstrip("\n")
+
+    if rest.startswith("[RequestID: "):
+        match = _REQUEST.match(rest)
+        if match:
+            return ParsedFields(
+                kind="request",
+                request_id=match["request_id"],
+                method=match["method"],
+                endpoint=match["endpoint"],
+                status=int(match["status"]),
+                response_ms=float(match["response_ms"]),
+                user=match["user"],
+            )
+        match = _ERROR.match(rest)
+        if match:
+            return ParsedFields(
+                kind="error",
+                request_id=match["request_id"],
+                endpoint=match["endpoint"],
+                host=match["host"],
+                error_type=match["error_type"],
+            )
+    elif rest.startswith("[TransactionID: "):
+        match = _TRANSACTION.match(rest)
+        if match:
+            return ParsedFields(
+                kind="transaction",
+                user=match["user"],
+                amount=float(match["amount"]),
+            )
+    elif rest.startswith("[Auth] "):
+        match = _AUTH.match(rest)
+        if match:
+            return ParsedFields(
+                kind="auth",
+                user=match["user"] or match["failed_user"],
+            )
+    else:
+        match = _SYSTEM.match(rest)
+        if match:
+            slow_query = _SLOW_QUERY.search(rest, match.end())
+            return ParsedFields(
+                kind="system",
+                component=match["component"],
+                host=match["host"],
+                pid=int(match["pid"]),
+                response_ms=(
+                    float(slow_query["seconds"]) * 1000 if slow_query else None
+                ),
+            )
+    return ParsedFields()
+
+
+class _Dictionary:
+    """
+    Dictionary encoding of a low-cardinality string column. Codes are reference counted, so a
+    value (a user, a host, ...) is dropped with the last row using it and its code reused.
+    """
+
+    def __init__(self):
+        # None for the codes no row uses any more
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[str, int] = {}
+        self._rows = array("q")
+        self._free: List[int] = []
+
+    def __len__(self):
+        return len(self._codes)
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._codes.get(value)
+        if code is None:
+            if self._free:
+                code = self._free.pop()
+                self.values[code] = value
+            else:
+                code = len(self.values)
+                self.values.append(value)
+                self._rows.append(0)
+            self._codes[value] = code
+        self._rows[code] += 1
+        return code
+
+    def release(self, codes: Iterable[int]):
+        """Drop one row per code in `codes`, and the values no row uses any more."""
+        for code, count in Counter(codes).items():
+            if code < 0:
+                continue
+            self._rows[code] -= count
+            if not self._rows[code]:
+                del self._codes[self.values[code]]
+                self.values[code] = None
+                self._free.append(code)
+
+
+class EndpointStats(NamedTuple):
+    endpoint: str
+    requests: int
+    server_errors: int
+    avg_response_ms: float
+
+    @property
+    def error_rate(self) -> float:
+        return self.server_errors / self.requests if self.requests else 0.0
+
+
+class LogEventStore:
+    """
+    In-memory columnar store of the structured fields of recent log records.
+
+    Each field is a typed `array` column (strings are dictionary encoded, request IDs packed as 16
+    bytes), so a question like "5xx rate per endpoint over the last hour" is a bisect on the
+    timestamp column followed by scans over a few contiguous buffers, vectorized with NumPy when it
+    is installed. Rows older than `retention` seconds are evicted as new ones arrive, and written
+    to a Parquet file in `spill_dir` first if one is configured and pyarrow is installed; string
+    values go with the last row using them.
+    """
+
+    def __init__(self, retention: float = 3600, spill_dir: Optional[Path] = None):
+        self.retention = retention
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        if self.spill_dir and pyarrow is None:
+            logger.warning(
+                "pyarrow is not installed, evicted log rows won't be spilled"
+            )
+            self.spill_dir = None
+        self._lock = threading.Lock()
+        self._strings = {
+            name: _Dictionary()
+            for name in (
+                "method",
+                "endpoint",
+                "user",
+                "component",
+                "host",
+                "error_type",
+            )
+        }
+        # Epoch milliseconds, in log order
+        self._timestamps = array("q")
+        self._levels = array("b")
+        self._kinds = array("b")
+        self._status = array("h")
+        self._response_ms = array("d")
+        self._pids = array("i")
+        self._amounts = array("d")
+        self._codes = {name: array("i") for name in self._strings}
+        self._request_ids = bytearray()
+        # Rows evicted so far, so that row numbers stay stable across evictions
+        self._evicted = 0
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, event: LogEvent):
+        if event.key is None:
+            # Continuation lines without their header
+            return
+        fields = parse_fields(event)
+        with self._lock:
+            self._append(event, fields)
+
+    def _append(self, event: LogEvent, fields: ParsedFields):
+        self._timestamps.append(event.key)
+        self._levels.append(LEVELS.index(event.level) if event.level in LEVELS else -1)
+        self._kinds.append(KINDS.index(fields.kind) if fields.kind else -1)
+        self._status.append(fields.status or 0)
+        self._response_ms.append(
+            fields.response_ms if fields.response_ms is not None else math.nan
+        )
+        self._pids.append(fields.pid or 0)
+        self._amounts.append(fields.amount if fields.amount is not None else math.nan)
+        for name, codes in self._codes.items():
+            codes.append(self._strings[name].encode(getattr(fields, name)))
+        self._request_ids += (
+            uuid.UUID(fields.request_id).bytes if fields.request_id else bytes(16)
+        )
+
+    def ingest(self, events: Iterable[LogEvent]) -> Iterator[LogEvent]:
+        """Pass `events` through, storing each of them on the way, then evict expired rows."""
+        for event in events:
+            self.append(event)
+            yield event
+        if self._timestamps:
+            self.evict(self._timestamps[-1] - int(self.retention * 1000))
+
+    def extend(self, events: Iterable[LogEvent]):
+        for _ in self.ingest(events):
+            pass
+
+    def evict(self, before_key: int):
+        """Drop the rows logged before `before_key` (epoch milliseconds)."""
+        with self._lock:
+            count = bisect_left(self._timestamps, before_key)
+            if not count:
+                return
+            if self.spill_dir:
+                self._spill(count)
+            for name, codes in self._codes.items():
+                self._strings[name].release(codes[:count])
+            for column in (
+                self._timestamps,
+                self._levels,
+                self._kinds,
+                self._status,
+                self._response_ms,
+                self._pids,
+                self._amounts,
+                *self._codes.values(),
+            ):
+                del column[:count]
+            del self._request_ids[: count * 16]
+            self._evicted += count
+        logger.debug(f"Evicted {count} rows from the log event store")
+
+    @property
+    def end_row(self) -> int:
+        """Row number the next appended record will get."""
+        return self._evicted + len(self._timestamps)
+
+    def response_times(self, since_row: int) -> List[Tuple[int, str, float]]:
+        """
+        (timestamp key, operation, response time in ms) of the timed records from row `since_row`
+        on. The operation is "METHOD /endpoint" for requests and "<Component> slow queries" for
+        slow query reports.
+        """
+        with self._lock:
+            start = max(since_row - self._evicted, 0)
+            methods = self._strings["method"].values
+            endpoints = self._strings["endpoint"].values
+            components = self._strings["component"].values
+            timed = []
+            for row in range(start, len(self._timestamps)):
+                response_ms = self._response_ms[row]
+                if math.isnan(response_ms):
+                    continue
+                endpoint = self._codes["endpoint"][row]
+                if endpoint >= 0:
+                    method = self._codes["method"][row]
+                    operation = f"{methods[method] if method >= 0 else '?'} {endpoints[endpoint]}"
+                else:
+                    operation = (
+                        f"{components[self._codes['component'][row]]} slow queries"
+                    )
+                timed.append((self._timestamps[row], operation, response_ms))
+            return timed
+
+    def _columns(self, stop: int) -> Dict[str, list]:
+        """The first `stop` rows as decoded Python lists, for Arrow."""
+        rows = slice(0, stop)
+        columns = {
+            "timestamp": [key_to_datetime(key) for key in self._timestamps[rows]],
+            "level": [LEVELS[i] if i >= 0 else None for i in self._levels[rows]],
+            "kind": [KINDS[i] if i >= 0 else None for i in self._kinds[rows]],
+            "status": [status or None for status in self._status[rows]],
+            "response_ms": [
+                None if math.isnan(value) else value
+                for value in self._response_ms[rows]
+            ],
+            "pid": [pid or None for pid in self._pids[rows]],
+            "amount": [
+                None if math.isnan(value) else value for value in self._amounts[rows]
+            ],
+            "request_id": [
+                (
+                    str(uuid.UUID(bytes=bytes(self._request_ids[i * 16 : i * 16 + 16])))
+                    if any(self._request_ids[i * 16 : i * 16 + 16])
+                    else None
+                )
+                for i in range(len(self._timestamps[rows]))
+            ],
+        }
+        for name, codes in self._codes.items():
+            values = self._strings[name].values
+            columns[name] = [
+                values[code] if code >= 0 else None for code in codes[rows]
+            ]
+        return columns
+
+    def _spill(self, count: int):
+        table = pyarrow.table(self._columns(count))
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"events-{self._timestamps[0]}.parquet"
+        try:
+            pyarrow.parquet.write_table(table, path)
+        except OSError as e:
+            logger.warning(f"Cannot spill log rows to {path}: {e}")
+            return
+        logger.info(f"Spilled {count} log rows to {path}")
+
+    def _window(self, from_dt: Optional[datetime], to_dt: Optional[datetime]) -> slice:
+        start = (
+            bisect_left(self._timestamps, datetime_to_key(from_dt)) if from_dt else 0
+        )
+        stop = (
+            bisect_right(self._timestamps, datetime_to_key(to_dt) + 999)
+            if to_dt
+            else len(self._timestamps)
+        )
+        return slice(start, stop)
+
+    def endpoint_stats(
+        self, from_dt: Optional[datetime] = None, to_dt: Optional[datetime] = None
+    ) -> List[EndpointStats]:
+        """
+        Requests, server errors (5xx responses and unhandled exceptions) and mean response time
+        per endpoint, for the records logged in [from_dt, to_dt].
+        """
+        with self._lock:
+            window = self._window(from_dt, to_dt)
+            endpoints = self._strings["endpoint"].values
+            if np is not None:
+                counts, errors, times = self._endpoint_columns_numpy(
+                    window, len(endpoints)
+                )
+            else:
+                counts, errors, times = self._endpoint_columns_python(
+                    window, len(endpoints)
+                )
+        return sorted(
+            (
+                EndpointStats(
+                    endpoint,
+                    int(counts[code]),
+                    int(errors[code]),
+                    float(times[code]),
+                )
+                for code, endpoint in enumerate(endpoints)
+                if counts[code]
+            ),
+            key=lambda stats: (-stats.error_rate, stats.endpoint),
+        )
+
+    def _endpoint_columns_numpy(self, window: slice, size: int):
+        # Zero-copy views of the columns; they must be released before the arrays grow again
+        endpoint = np.frombuffer(self._codes["endpoint"], dtype=np.int32)[window]
+        status = np.frombuffer(self._status, dtype=np.int16)[window]
+        kind = np.frombuffer(self._kinds, dtype=np.int8)[window]
+        response_ms = np.frombuffer(self._response_ms, dtype=np.float64)[window]
+
+        requests = endpoint >= 0
+        failed = requests & ((status >= 500) | (kind == KINDS.index("error")))
+        timed = requests & ~np.isnan(response_ms)
+        counts = np.bincount(endpoint[requests], minlength=size)
+        errors = np.bincount(endpoint[failed], minlength=size)
+        timed_counts = np.bincount(endpoint[timed], minlength=size)
+        total_ms = np.bincount(
+            endpoint[timed], weights=response_ms[timed], minlength=size
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(timed_counts > 0, total_ms / timed_counts, np.nan)
+        return counts, errors, means
+
+    def _endpoint_columns_python(self, window: slice, size: int):
+        counts, errors = [0] * size, [0] * size
+        timed_counts, total_ms = [0] * size, [0.0] * size
+        error_kind = KINDS.index("error")
+        for code, status, kind, response_ms in zip(
+            self._codes["endpoint"][window],
+            self._status[window],
+            self._kinds[window],
+            self._response_ms[window],
+        ):
+            if code < 0:
+                continue
+            counts[code] += 1
+            if status >= 500 or kind == error_kind:
+                errors[code] += 1
+            if not math.isnan(response_ms):
+                timed_counts[code] += 1
+                total_ms[code] += response_ms
+        means = [
+            total / count if count else math.nan
+            for total, count in zip(total_ms, timed_counts)
+        ]
+        return counts, errors, means
@@ -0,0 +1,87 @@
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from utils.logger import logger
+
+# Amount of data pulled from disk per read while tailing
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class LogTailCursor:
+    """
+    Persistent byte-offset cursor over a log file.
+
+    Every call to `read_new` only reads the bytes appended since the previous call, so the
+    cost of a poll scales with the new data instead of the size of the file. Rotation is
+    detected through the inode of the path and truncation through the file size; in both
+    cases the cursor drains what is left in the old file and starts over from the beginning.
+    """
+
+    def __init__(self, path: Path, offset: int = 0, inode: Optional[int] = None):
+        self.path = Path(path)
+        self.offset = offset
+        self.inode = inode
+        self._file: Optional[BinaryIO] = None
+
+    def _open(self) -> bool:
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            logger.warning(f"Log file not found while tailing: {self.path}")
+            return False
+
+        inode = os.fstat(self._file.fileno()).st_ino
+        if self.inode is not None and inode != self.inode:
+            logger.info(f"Log file {self.path} was replaced, tailing it from the start")
+            self.offset = 0
+        self.inode = inode
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_lines(self, file: BinaryIO) -> Iterator[str]:
+        """Yield the complete lines between the cursor and the end of `file`, advancing the cursor."""
+        file.seek(self.offset)
+        pending = b""
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            pending += chunk
+            end = pending.rfind(b"\n") + 1
+            if not end:
+                continue
+            complete, pending = pending[:end], pending[end:]
+            self.offset += end
+            yield from complete.decode("utf-8", errors="replace").splitlines(
+                keepends=True
+            )
+        # A partially written last line is left for the next poll
+
+    def read_new(self) -> Iterator[str]:
+        """Yield the lines appended to the log since the last call."""
+        if self._file is None and not self._open():
+            return
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is None or stat.st_ino != self.inode:
+            # Rotated: finish whatever the writer appended to the old file, then switch over
+            yield from self._read_lines(self._file)
+            self.close()
+            if stat is None or not self._open():
+                return
+        elif stat.st_size < self.offset:
+            logger.info(
+                f"Log file {self.path} was truncated, tailing it from the start"
+            )
+            self.offset = 0
+
+        yield from self._read_lines(self._file)
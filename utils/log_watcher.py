@@ -0,0 +1,187 @@
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from utils.log_sources import LogSourceRegistry
+from utils.logger import logger
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """Return libc if it exposes inotify (Linux), None otherwise."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class LogWatcher:
+    """
+    Wakes the monitor up when a file of the log sources is appended to, created, replaced or
+    rotated, instead of sleeping for a fixed interval. Waiting is done on the asyncio event loop.
+
+    On Linux the source directories are watched through inotify (via ctypes, no extra dependency),
+    which also catches rotations and files newly matching a glob. Elsewhere, if inotify is
+    unavailable, or if a source has wildcards in its directory part, the files are stat-ed every
+    `poll_interval` seconds. Bursts of changes are debounced into one wake-up: after the
+    first change `wait` keeps collecting until the files have been quiet for `debounce` seconds,
+    and for at most `max_delay` seconds.
+    """
+
+    def __init__(
+        self,
+        sources: LogSourceRegistry,
+        debounce: float = 0.2,
+        max_delay: float = 1.0,
+        poll_interval: float = 1.0,
+    ):
+        self.sources = sources
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        # Watch descriptor -> file name patterns of the sources in that directory
+        self._watches: Dict[int, Set[str]] = {}
+        self._stats: Dict[Path, Tuple[int, int, int]] = {}
+
+        targets = sources.watch_targets()
+        libc = _load_inotify() if targets is not None else None
+        if libc is not None:
+            self._init_inotify(libc, targets)
+        if self._fd is None:
+            logger.info("inotify is unavailable, falling back to polling the log files")
+            self._stats = self._snapshot()
+
+    def _init_inotify(self, libc, targets):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return
+
+        directories: Dict[Path, Set[str]] = {}
+        for directory, pattern in targets:
+            directories.setdefault(directory, set()).add(pattern)
+        for directory, names in directories.items():
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                logger.warning(
+                    f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}"
+                )
+                os.close(fd)
+                self._watches = {}
+                return
+            self._watches[wd] = names
+        self._fd = fd
+        logger.debug(f"Watching {len(directories)} log directories through inotify")
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_events(self) -> bool:
+        """Drain the inotify queue, returning whether any event concerned a source file."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW or any(
+                    fnmatch.fnmatchcase(name, pattern)
+                    for pattern in self._watches.get(wd, ())
+                ):
+                    relevant = True
+
+    async def _wait_inotify(self, timeout: Optional[float]) -> bool:
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(self._fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(self._fd)
+        return self._read_events()
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int, int]]:
+        stats = {}
+        # Resolved on every poll, so files newly matching a glob count as a change
+        for path in self.sources.resolve():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats[path] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    async def _wait_polling(self, timeout: Optional[float]) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self._snapshot()
+            if stats != self._stats:
+                self._stats = stats
+                return True
+            remaining = (
+                self.poll_interval
+                if deadline is None
+                else min(self.poll_interval, deadline - time.monotonic())
+            )
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(remaining)
+
+    async def _wait_once(self, timeout: Optional[float]) -> bool:
+        if self._fd is not None:
+            return await self._wait_inotify(timeout)
+        return await self._wait_polling(timeout)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a watched file changes (returning True) or `timeout` seconds pass (returning False).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if await self._wait_once(remaining):
+                break
+
+        # Debounce: let the rest of the burst land so it is processed as one micro-batch
+        batch_deadline = time.monotonic() + self.max_delay
+        while True:
+            quiet = min(self.debounce, batch_deadline - time.monotonic())
+            if quiet <= 0 or not await self._wait_once(quiet):
+                return True
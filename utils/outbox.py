@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+# Delivers a batch of payloads of one kind, returning (succeeded, result) for each, in order
+Handler = Callable[[List[dict]], Awaitable[List[Tuple[bool, str]]]]
+
+
+def idempotency_key(kind: str, payload: dict) -> str:
+    """Key of an action: the same action submitted twice is only carried out once."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(f"{kind}:{canonical}".encode(), digest_size=16).hexdigest()
+
+
+class _TokenBucket:
+    """Allows `rate` actions per second, in bursts of up to `burst`; a `rate` of 0 is unlimited."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, count: int) -> int:
+        """Wait for a token, then take up to `count` of them: the number of actions allowed."""
+        if self.rate <= 0:
+            return count
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                taken = min(count, int(self._tokens))
+                self._tokens -= taken
+                return taken
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def give_back(self, count: int):
+        """Return tokens taken for actions that were not carried out."""
+        if self.rate > 0:
+            self._refill()
+            self._tokens = min(self.burst, self._tokens + count)
+
+
+class Outbox:
+    """
+    Durable queue of outbound actions (ticket creation, ...), so that the monitor never waits on
+    an external service and never loses an action when it is down.
+
+    Actions are written to a SQLite table and committed before `enqueue` returns (write-ahead):
+    whatever happens next, they are carried out eventually. `run` drains the table with a pool of
+    `workers` tasks, each claiming up to `batch_size` due actions of one kind and handing them to
+    the handler registered for that kind. Failed actions are retried with exponential backoff up
+    to `max_attempts` times, then kept as 'failed' for inspection. The delivery rate across workers
+    is capped at `rate` actions per second: a worker only claims as many actions as the rate allows
+    (one second's worth after a quiet period), so batches are smaller than `batch_size` when the
+    rate is lower. Actions claimed but not finished when the process died are put back in the
+    queue when the outbox is opened again.
+
+    Each action has an idempotency key (by default a hash of its kind and payload): enqueuing an
+    action whose key is still queued replaces its payload, enqueuing one in flight is a no-op, and
+    both return the queued action; the key of a finished action can be queued again.
+
+    A worker hitting an error of its own (e.g. the database being locked) logs it and backs off
+    rather than stopping.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        workers: int = 2,
+        batch_size: int = 50,
+        max_attempts: int = 8,
+        backoff: float = 2.0,
+        max_backoff: float = 300.0,
+        rate: float = 5.0,
+        retention: float = 24 * 3600,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self._bucket = _TokenBucket(rate, burst=max(rate, 1))
+        self._handlers: Dict[str, Handler] = {}
+        # Enqueues may come from tool calls running in other threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        with self._lock, self._conn:
+            replayed = self._conn.execute(
+                "UPDATE outbox SET status = 'pending' WHERE status = 'in_flight'"
+            ).rowcount
+        if replayed:
+            logger.warning(f"Replaying {replayed} unfinished outbox actions")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: dict, key: Optional[str] = None) -> int:
+        """Durably queue an action and return its id (that of the queued one, for a known key)."""
+        key = key or idempotency_key(kind, payload)
+        now = time.time()
+        with self._lock, self._conn:
+            # A finished action is queued again from scratch, a queued one gets the newer payload
+            # below, and one in flight is left as it is being carried out
+            self._conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+                "result = NULL, created_at = ? WHERE idempotency_key = ? "
+                "AND status IN ('done', 'failed')",
+                (now, now, key),
+            )
+            self._conn.execute(
+                "INSERT INTO outbox (idempotency_key, kind, payload, next_attempt_at, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (idempotency_key) DO UPDATE SET payload = excluded.payload, "
+                "updated_at = excluded.updated_at WHERE status = 'pending'",
+                (key, kind, json.dumps(payload), now, now, now),
+            )
+            action_id = self._conn.execute(
+                "SELECT id FROM outbox WHERE idempotency_key = ?", (key,)
+            ).fetchone()[0]
+        self._wake()
+        return action_id
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'in_flight')"
+            ).fetchone()[0]
+
+    def _wake(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self, limit: int) -> List[Tuple[int, str, dict, int]]:
+        """Mark a batch of up to `limit` due actions of one kind in flight, oldest first."""
+        now = time.time()
+        with self._lock, self._conn:
+            first = self._conn.execute(
+                "SELECT kind FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if first is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT id, kind, payload, attempts FROM outbox WHERE status = 'pending' "
+                "AND kind = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (first[0], now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'in_flight', updated_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+        return [(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def _next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+        return row[0]
+
+    def _finish(self, actions, results: List[Tuple[bool, str]]):
+        now = time.time()
+        updates = []
+        for (action_id, kind, _, attempts), (succeeded, result) in zip(
+            actions, results
+        ):
+            attempts += 1
+            if succeeded:
+                updates.append(("done", attempts, now, result, now, action_id))
+            elif attempts >= self.max_attempts:
+                logger.error(
+                    f"Giving up on {kind} action {action_id} after {attempts} attempts: {result}"
+                )
+                updates.append(("failed", attempts, now, result, now, action_id))
+            else:
+                delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+                logger.warning(
+                    f"{kind} action {action_id} failed, retrying in {delay:.0f}s: {result}"
+                )
+                updates.append(
+                    ("pending", attempts, now + delay, result, now, action_id)
+                )
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, result = ?, "
+                "updated_at = ? WHERE id = ?",
+                updates,
+            )
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (now - self.retention,),
+            )
+
+    async def _deliver(self, actions):
+        kind = actions[0][1]
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for {kind} actions")
+            results = await handler([payload for _, _, payload, _ in actions])
+        except Exception as e:
+            logger.exception(f"Failed to deliver {len(actions)} {kind} actions")
+            results = [(False, str(e))] * len(actions)
+        # The actions were carried out: their outcome is retried until it is recorded, rather
+        # than leaving them in flight to be replayed by the next run
+        for attempt in itertools.count():
+            try:
+                self._finish(actions, results)
+                return
+            except sqlite3.Error:
+                delay = min(self.backoff * 2**attempt, self.max_backoff)
+                logger.exception(
+                    f"Failed to record the outcome of {len(actions)} {kind} actions, "
+                    f"retrying in {delay:.0f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _work(self):
+        failures = 0
+        while True:
+            try:
+                await self._step()
+                failures = 0
+            except Exception:
+                delay = min(self.backoff * 2**failures, self.max_backoff)
+                failures += 1
+                logger.exception(f"Outbox worker failed, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    async def _step(self):
+        """Deliver one batch of due actions, or wait for one."""
+        # Cleared before looking, so an enqueue in between still wakes the worker up
+        self._wakeup.clear()
+        allowed = await self._bucket.take(self.batch_size)
+        actions = self._claim(allowed)
+        self._bucket.give_back(allowed - len(actions))
+        if not actions:
+            next_due = self._next_due()
+            timeout = None if next_due is None else max(next_due - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return
+        await self._deliver(actions)
+
+    async def run(self):
+        """Drain the outbox until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        logger.info(f"Outbox worker pool started with {self.pending()} pending actions")
+        workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,43 @@
+import re
+from typing import Iterable, List, Optional
+
+from utils.log_events import LogEvent
+
+# Levels that always warrant a look from the agent
+ALERT_LEVELS = ("ERROR", "CRITICAL")
+TRACEBACK_MARKER = "Traceback (most recent call last):"
+
+
+class ErrorPrefilter:
+    """
+    Cheap local classifier deciding which log events are worth sending to the agent: events at an
+    alert level, events carrying a traceback, and events matching any of the configured patterns.
+    """
+
+    def __init__(
+        self,
+        levels: Iterable[str] = ALERT_LEVELS,
+        patterns: Iterable[str] = (),
+    ):
+        self.levels = frozenset(levels)
+        patterns = [pattern for pattern in patterns if pattern]
+        # A single alternation keeps pattern matching to one regex search per line
+        self._pattern: Optional[re.Pattern] = (
+            re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+            if patterns
+            else None
+        )
+
+    def is_incident(self, event: LogEvent) -> bool:
+        if event.level in self.levels:
+            return True
+        for line in event.lines[1:]:
+            if line.startswith(TRACEBACK_MARKER):
+                return True
+        if self._pattern is not None:
+            return any(self._pattern.search(line) for line in event.lines)
+        return False
+
+    def select(self, events: Iterable[LogEvent]) -> List[LogEvent]:
+        """Consume `events` in one pass and return only those that qualify."""
+        return [event for event in events if self.is_incident(event)]
@@ -0,0 +1,84 @@
+import math
+from typing import Dict, Iterable
+
+
+class DDSketch:
+    """
+    Quantile sketch with relative error guarantees (DDSketch, Masson et al. 2019).
+
+    Values are counted in logarithmically sized bins: with a relative accuracy of `accuracy`,
+    every quantile returned is within `accuracy` of the true one, relatively. Once there are more
+    than `max_bins` bins the lowest ones are collapsed together, which bounds memory whatever the
+    number or the spread of the values, at the cost of accuracy for the lowest quantiles only.
+    Sketches with the same parameters merge exactly, so rolling windows are a merge of sketches.
+    """
+
+    __slots__ = ("accuracy", "max_bins", "_log_gamma", "bins", "zero_count", "count")
+
+    def __init__(self, accuracy: float = 0.01, max_bins: int = 512):
+        self.accuracy = accuracy
+        self.max_bins = max_bins
+        self._log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        # Bin index -> count, the bin `i` covering (gamma^(i-1), gamma^i]
+        self.bins: Dict[int, int] = {}
+        # Values too small to be binned (zero and below)
+        self.zero_count = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value: float, count: int = 1):
+        self.count += count
+        if value <= 1e-9:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins + 1
+        collapsed = sum(self.bins.pop(index) for index in indexes[:excess])
+        lowest = indexes[excess]
+        self.bins[lowest] += collapsed
+
+    def merge(self, other: "DDSketch"):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile `q` (0 to 1), NaN for an empty sketch."""
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Midpoint of the bin, in the relative sense
+                return (
+                    2
+                    * math.exp(index * self._log_gamma)
+                    / (1 + math.exp(self._log_gamma))
+                )
+        return (
+            2
+            * math.exp(max(self.bins) * self._log_gamma)
+            / (1 + math.exp(self._log_gamma))
+        )
+
+    @classmethod
+    def merged(cls, sketches: Iterable["DDSketch"], **kwargs) -> "DDSketch":
+        result = cls(**kwargs)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
@@ -0,0 +1,357 @@
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.logger import logger
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class Shift(NamedTuple):
+    """An on-call shift, repeated every `every` (a rotation) `count` times, or forever if None."""
+
+    start: datetime
+    end: datetime
+    every: Optional[timedelta] = None
+    count: Optional[int] = None
+    until: Optional[datetime] = None
+
+    def covers(self, at: datetime) -> bool:
+        if at < self.start or (self.until is not None and at >= self.until):
+            return False
+        if self.every is None:
+            return at < self.end
+        occurrence, offset = divmod(at - self.start, self.every)
+        if self.count is not None and occurrence >= self.count:
+            return False
+        return offset < self.end - self.start
+
+    def next_change(self, at: datetime) -> Optional[datetime]:
+        """The first time after `at` at which `covers` changes, None if it never does."""
+        if at < self.start:
+            return self.start
+        if self.until is not None and at >= self.until:
+            return None
+        if self.every is None:
+            change = self.end if at < self.end else None
+        else:
+            occurrence, offset = divmod(at - self.start, self.every)
+            if self.count is not None and occurrence >= self.count:
+                return None
+            occurrence_start = self.start + occurrence * self.every
+            if offset < self.end - self.start:
+                change = occurrence_start + (self.end - self.start)
+            elif self.count is None or occurrence + 1 < self.count:
+                change = occurrence_start + self.every
+            else:
+                change = None
+        if self.until is not None and (change is None or change > self.until):
+            return self.until
+        return change
+
+
+class OncallEmployee(NamedTuple):
+    name: str
+    email: str
+    role: str
+    team: str
+    # No shifts means always on call
+    shifts: Tuple[Shift, ...] = ()
+
+    def on_call(self, at: datetime) -> bool:
+        return not self.shifts or any(shift.covers(at) for shift in self.shifts)
+
+
+def _parse_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _parse_mapping(data) -> List[OncallEmployee]:
+    """JSON/YAML: a list of employees, or a mapping with an `employees` list."""
+    records = data.get("employees", []) if isinstance(data, dict) else data
+    employees = []
+    for record in records:
+        shifts = tuple(
+            Shift(
+                _parse_datetime(shift["start"]),
+                _parse_datetime(shift["end"]),
+                (
+                    timedelta(days=shift["rotation_days"])
+                    if shift.get("rotation_days")
+                    else None
+                ),
+                shift.get("count"),
+                _parse_datetime(shift["until"]) if shift.get("until") else None,
+            )
+            for shift in record.get("shifts") or ()
+        )
+        employees.append(
+            OncallEmployee(
+                record["name"], record["email"], record["role"], record["team"], shifts
+            )
+        )
+    return employees
+
+
+_ICS_DATETIME = re.compile(r"(\d{8})(?:T(\d{6})(Z)?)?")
+_ICS_FREQUENCIES = {"DAILY": timedelta(days=1), "WEEKLY": timedelta(weeks=1)}
+
+
+def _parse_ics_datetime(value: str, tzid: Optional[str] = None) -> datetime:
+    """
+    The local wall-clock time, compared with the log timestamps, of an iCalendar date or time:
+    UTC (`Z`) and `TZID` times are converted, floating times and dates are taken as they are.
+    """
+    date, clock, utc = _ICS_DATETIME.match(value).groups()
+    parsed = datetime.strptime(date + (clock or "000000"), "%Y%m%d%H%M%S")
+    if utc:
+        zone = timezone.utc
+    elif tzid and clock:
+        try:
+            zone = ZoneInfo(tzid.strip('"'))
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Unknown time zone {tzid}, reading {value} as local time")
+            return parsed
+    else:
+        return parsed
+    return parsed.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+
+
+def _parse_ics(text: str) -> List[OncallEmployee]:
+    """
+    iCalendar: one VEVENT per shift, SUMMARY being the employee's name, CATEGORIES the team,
+    ATTENDEE the email (mailto:) and X-ROLE the role. Daily and weekly RRULEs define rotations.
+    Events of the same employee are merged.
+    """
+    # Unfold continuation lines
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+    employees: Dict[str, OncallEmployee] = {}
+    event: Optional[Dict[str, str]] = None
+    # Property name -> its TZID parameter, for the times of the event
+    tzids: Dict[str, str] = {}
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event = {}
+            tzids = {}
+            continue
+        if event is None:
+            continue
+        if line == "END:VEVENT":
+            rule = dict(
+                part.split("=", 1) for part in event.get("RRULE", "").split(";") if part
+            )
+            every = None
+            if rule.get("FREQ") in _ICS_FREQUENCIES:
+                every = _ICS_FREQUENCIES[rule["FREQ"]] * int(rule.get("INTERVAL", 1))
+            shift = Shift(
+                _parse_ics_datetime(event["DTSTART"], tzids.get("DTSTART")),
+                _parse_ics_datetime(event["DTEND"], tzids.get("DTEND")),
+                every,
+                int(rule["COUNT"]) if "COUNT" in rule else None,
+                _parse_ics_datetime(rule["UNTIL"]) if "UNTIL" in rule else None,
+            )
+            email = event.get("ATTENDEE", "").split("mailto:")[-1]
+            employee = employees.get(email)
+            if employee is None:
+                employees[email] = OncallEmployee(
+                    event.get("SUMMARY", email),
+                    email,
+                    event.get("X-ROLE", ""),
+                    event.get("CATEGORIES", ""),
+                    (shift,),
+                )
+            else:
+                employees[email] = employee._replace(shifts=employee.shifts + (shift,))
+            event = None
+            continue
+        name, _, value = line.partition(":")
+        # Only TZID is kept out of the parameters, such as ATTENDEE;CN=...
+        name, *parameters = name.split(";")
+        event[name] = value
+        for parameter in parameters:
+            if parameter.startswith("TZID="):
+                tzids[name] = parameter[len("TZID=") :]
+    return list(employees.values())
+
+
+def load_roster(path: Path) -> List[OncallEmployee]:
+    """Read a roster file, its format given by its extension: .json, .yaml/.yml or .ics."""
+    text = path.read_text()
+    suffix = path.suffix.lower()
+    if suffix == ".ics":
+        return _parse_ics(text)
+    if suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuntimeError(f"pyyaml is required to read {path}")
+        return _parse_mapping(yaml.safe_load(text))
+    return _parse_mapping(json.loads(text))
+
+
+class _Slot(NamedTuple):
+    """Who is on call from `start` until the next shift change, `end` (None if there is none)."""
+
+    start: datetime
+    end: Optional[datetime]
+    employees: List[OncallEmployee]
+    by_team: Dict[str, List[OncallEmployee]]
+    by_role: Dict[str, List[OncallEmployee]]
+    # Team (None for everyone) -> formatted answer
+    responses: Dict[Optional[str], str]
+
+    def holds(self, at: datetime) -> bool:
+        return self.start <= at and (self.end is None or at < self.end)
+
+
+def _group(
+    employees: Iterable[OncallEmployee], field: str
+) -> Dict[str, List[OncallEmployee]]:
+    index: Dict[str, List[OncallEmployee]] = {}
+    for employee in employees:
+        index.setdefault(getattr(employee, field).lower(), []).append(employee)
+    return index
+
+
+class OncallRoster:
+    """
+    Who is on call, by team or role, at any time. Employees are indexed by team and role when
+    the roster is loaded, and the on-call ones by team and role for the current time slot, i.e.
+    until the next shift change of anyone; the formatted answer for a team is cached in the
+    slot as well, so a lookup is a couple of dictionary hits. With a `path`, the file is checked
+    for changes (by mtime) at most every `check_interval` seconds and reloaded when it changed;
+    a roster that fails to load leaves the previous one in place.
+    """
+
+    def __init__(
+        self,
+        employees: Iterable[OncallEmployee] = (),
+        path: Optional[Path] = None,
+        check_interval: float = 1.0,
+    ):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._index(list(employees))
+        if self.path is not None:
+            self._reload()
+
+    def _index(self, employees: List[OncallEmployee]):
+        self.employees = employees
+        self._by_team = _group(employees, "team")
+        self._by_role = _group(employees, "role")
+        self.teams = list(dict.fromkeys(employee.team for employee in employees))
+        # Built for the time of the first lookup
+        self._slot: Optional[_Slot] = None
+
+    def _slot_at(self, at: datetime) -> _Slot:
+        """The time slot `at` falls in, indexed again once a shift changes."""
+        slot = self._slot
+        if slot is not None and slot.holds(at):
+            return slot
+        employees = [employee for employee in self.employees if employee.on_call(at)]
+        changes = [
+            change
+            for employee in self.employees
+            for shift in employee.shifts
+            if (change := shift.next_change(at)) is not None
+        ]
+        slot = self._slot = _Slot(
+            at,
+            min(changes, default=None),
+            employees,
+            _group(employees, "team"),
+            _group(employees, "role"),
+            {},
+        )
+        return slot
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Cannot read the on-call roster {self.path}: {e}")
+            return
+        if mtime == self._mtime:
+            return
+        # Set even if the file is invalid, so that it is only reported once per change
+        self._mtime = mtime
+        try:
+            employees = load_roster(self.path)
+        except Exception as e:
+            logger.exception(
+                f"Invalid on-call roster {self.path}, keeping the previous one: {e}"
+            )
+            return
+        self._index(employees)
+        logger.info(f"Loaded {len(employees)} on-call employees from {self.path}")
+
+    def _maybe_reload(self):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload()
+
+    def has_team(self, team: str) -> bool:
+        self._maybe_reload()
+        return team.lower() in self._by_team
+
+    def by_role(self, role: str) -> List[OncallEmployee]:
+        """The employees of the roster with `role`, on call or not."""
+        self._maybe_reload()
+        return self._by_role.get(role.lower(), [])
+
+    def on_call(
+        self,
+        team: Optional[str] = None,
+        at: Optional[datetime] = None,
+        role: Optional[str] = None,
+    ) -> List[OncallEmployee]:
+        """
+        The employees of `team` (everyone if None) on call at `at` (now if None), only those with
+        `role` if given.
+        """
+        self._maybe_reload()
+        slot = self._slot_at(at or datetime.now())
+        if role is not None:
+            employees = slot.by_role.get(role.lower(), [])
+            if team:
+                employees = [
+                    employee
+                    for employee in employees
+                    if employee.team.lower() == team.lower()
+                ]
+            return employees
+        return slot.by_team.get(team.lower(), []) if team else slot.employees
+
+    def format(self, team: Optional[str] = None, at: Optional[datetime] = None) -> str:
+        """The on-call employees of `team` as text, cached until the next shift change."""
+        self._maybe_reload()
+        slot = self._slot_at(at or datetime.now())
+        key = team.lower() if team else None
+        response = slot.responses.get(key)
+        if response is not None:
+            return response
+
+        on_call = slot.by_team.get(key, []) if key else slot.employees
+        if not on_call:
+            response = f"No on-call employees found for team '{team}'."
+        else:
+            response = "Current on-call employees:\n\n" + "".join(
+                f"Name: {employee.name}\n"
+                f"Email: {employee.email}\n"
+                f"Role: {employee.role}\n"
+                f"Team: {employee.team}\n\n"
+                for employee in on_call
+            )
+        slot.responses[key] = response
+        return response
@@ -0,0 +1,170 @@
+import json
+import re
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+from utils.fingerprint import Incident
+from utils.logger import logger
+from utils.roster import OncallEmployee, OncallRoster
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Ownership of the errors of utils/random_log_generator.py by the teams of the demonstration roster,
+# used when no routing rules file is configured
+DEFAULT_RULES: Dict[str, Dict[str, str]] = {
+    "exceptions": {
+        "DatabaseConnectionError": "Data Platform",
+        "DatabaseDeadlockError": "Data Platform",
+        "ConnectionRefusedError": "Data Platform",
+        "ElasticsearchClusterHealthError": "Data Platform",
+        "KafkaProducerTimeoutError": "Data Platform",
+        "RedisConnectionError": "Infrastructure",
+        "ConnectionResetError": "Infrastructure",
+        "MemoryError": "Platform",
+        "ResourceExhaustionError": "Platform",
+        "ThreadPoolExhaustionError": "Platform",
+        "CircuitBreakerOpenError": "Reliability",
+        "DependencyFailureError": "Reliability",
+        "InternalServerError": "API Services",
+    },
+    "components": {
+        "DatabasePool": "Data Platform",
+        "ReportingEngine": "Data Platform",
+        "APIGateway": "Infrastructure",
+        "CacheService": "Infrastructure",
+        "NotificationService": "Platform",
+        "AuthService": "API Services",
+        "TransactionProcessor": "API Services",
+        "FraudDetection": "API Services",
+    },
+    "endpoints": {
+        "/api": "API Services",
+    },
+}
+
+
+class Route(NamedTuple):
+    team: str
+    # The first on-call employee of the team, None if nobody is on call
+    assignee: Optional[OncallEmployee]
+    # What matched, e.g. "exception RedisConnectionError"
+    rule: str
+
+
+def load_rules(path: Path) -> Dict[str, Dict[str, str]]:
+    """Read a routing rules file, JSON or YAML (.yaml/.yml)."""
+    text = Path(path).read_text()
+    if Path(path).suffix.lower() in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuntimeError(f"pyyaml is required to read {path}")
+        return yaml.safe_load(text) or {}
+    return json.loads(text)
+
+
+class _Matcher:
+    """One compiled alternation of literal keywords, the longest keyword tried first."""
+
+    def __init__(self, keywords: Dict[str, str], before: str, after: str):
+        self.teams = keywords
+        self._pattern: Optional[re.Pattern] = (
+            re.compile(
+                before
+                + "("
+                + "|".join(
+                    re.escape(keyword)
+                    for keyword in sorted(keywords, key=len, reverse=True)
+                )
+                + ")"
+                + after
+            )
+            if keywords
+            else None
+        )
+
+    def match(self, text: str) -> Optional[str]:
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(text)
+        return match.group(1) if match else None
+
+
+class TeamRouter:
+    """
+    Deterministic routing of incidents to the team that owns them, so the LLM only has to pick a
+    team for incidents no rule covers. Rules map exception types, components (e.g. `DatabasePool`)
+    and endpoint path prefixes to teams; each kind is compiled into a single regex. The exception
+    raised wins over the component, which wins over the endpoint; between endpoints the longest
+    prefix wins. Rules naming a team missing from the roster are ignored, and the assignee is the
+    first employee of the team on call at the time. Matches are cached by fingerprint, so a
+    recurring error is only matched once.
+    """
+
+    # Fingerprints whose match is remembered, the cache is emptied past this size
+    _CACHE_SIZE = 10000
+
+    _KINDS = (
+        # kind, rules key, what may precede and follow the keyword
+        ("exception", "exceptions", r"(?<!\w)", r"(?!\w)"),
+        ("component", "components", r"(?<!\w)", r"(?!\w)"),
+        ("endpoint", "endpoints", r"(?<![\w/.-])", r"(?=[/?#\s:]|$)"),
+    )
+
+    def __init__(self, rules: Dict[str, Dict[str, str]], roster: OncallRoster):
+        self._roster = roster
+        self._matchers = [
+            (kind, _Matcher(rules.get(key) or {}, before, after))
+            for kind, key, before, after in self._KINDS
+        ]
+        # fingerprint -> (team, rule) per kind, in order of precedence
+        self._matches: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+        self._warned: Set[str] = set()
+
+    def _match(self, incident: Incident) -> Tuple[Tuple[str, str], ...]:
+        matches = self._matches.get(incident.fingerprint)
+        if matches is not None:
+            return matches
+        # Latency regressions have no sample, their template names the endpoint
+        header = incident.sample.header if incident.sample else incident.template
+        found = []
+        for kind, matcher in self._matchers:
+            # Exceptions are usually only named in the last line of the traceback
+            text = (
+                incident.sample.text
+                if incident.sample and kind == "exception"
+                else header
+            )
+            keyword = matcher.match(text)
+            if keyword is not None:
+                found.append((matcher.teams[keyword], f"{kind} {keyword}"))
+        if len(self._matches) >= self._CACHE_SIZE:
+            self._matches.clear()
+        matches = self._matches[incident.fingerprint] = tuple(found)
+        return matches
+
+    def route(self, incident: Incident) -> Optional[Route]:
+        """The owner of `incident` per the rules, None if no rule matches."""
+        for team, rule in self._match(incident):
+            # Checked on every call as the roster may have been reloaded
+            if not self._roster.has_team(team):
+                if rule not in self._warned:
+                    self._warned.add(rule)
+                    logger.warning(f"Routing rule {rule} names unknown team {team}")
+                continue
+            on_call = self._roster.on_call(team)
+            return Route(team, on_call[0] if on_call else None, rule)
+        return None
+
+    @staticmethod
+    def describe(route: Optional[Route]) -> str:
+        """The route as a suffix of an incident line in a prompt, empty if there is none."""
+        if route is None:
+            return ""
+        if route.assignee is None:
+            return f" [Owner: {route.team}, nobody on call]"
+        return (
+            f" [Owner: {route.team}, assignee: {route.assignee.name} "
+            f"<{route.assignee.email}>]"
+        )
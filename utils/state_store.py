@@ -0,0 +1,116 @@
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    inode INTEGER
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprints_last_seen ON fingerprints (last_seen);
+CREATE TABLE IF NOT EXISTS tickets (
+    fingerprint TEXT PRIMARY KEY,
+    ticket_key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    Small SQLite database (WAL mode) holding what the monitor needs to resume after a restart:
+    tail cursors, the last check time, the known error fingerprints and the tickets created for them.
+
+    Writes are grouped into one transaction per monitoring cycle by calling `commit` once the cycle
+    is done, so a crash mid-cycle replays that cycle instead of losing it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        logger.debug(f"Opened state store at {self.path}")
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def get_last_check_time(self) -> Optional[datetime]:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'last_check_time'"
+        ).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def set_last_check_time(self, value: datetime):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_check_time', ?)",
+            (value.isoformat(),),
+        )
+
+    def get_cursor(self, path: Path) -> Optional[Tuple[int, Optional[int]]]:
+        """Saved (offset, inode) of the tail cursor for `path`."""
+        return self._conn.execute(
+            "SELECT offset, inode FROM cursors WHERE path = ?", (str(path),)
+        ).fetchone()
+
+    def set_cursor(self, path: Path, offset: int, inode: Optional[int]):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cursors (path, offset, inode) VALUES (?, ?, ?)",
+            (str(path), offset, inode),
+        )
+
+    def get_fingerprints(self, seen_after: float) -> Dict[str, float]:
+        """Fingerprints seen after `seen_after` (epoch seconds), mapped to when they were last seen."""
+        return dict(
+            self._conn.execute(
+                "SELECT fingerprint, last_seen FROM fingerprints WHERE last_seen > ? "
+                "ORDER BY last_seen",
+                (seen_after,),
+            )
+        )
+
+    def set_fingerprints(self, fingerprints: Iterable[str], seen_at: float):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO fingerprints (fingerprint, last_seen) VALUES (?, ?)",
+            ((fingerprint, seen_at) for fingerprint in fingerprints),
+        )
+
+    def expire_fingerprints(self, seen_before: float):
+        self._conn.execute(
+            "DELETE FROM fingerprints WHERE last_seen <= ?", (seen_before,)
+        )
+
+    def get_ticket(self, fingerprint: str) -> Optional[Tuple[str, float]]:
+        """The ticket key of the fingerprint and when it was recorded."""
+        row = self._conn.execute(
+            "SELECT ticket_key, created_at FROM tickets WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def set_ticket(
+        self, fingerprint: str, ticket_key: str, recorded_at: Optional[float] = None
+    ):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO tickets (fingerprint, ticket_key, created_at) VALUES (?, ?, ?)",
+            (fingerprint, ticket_key, recorded_at or time.time()),
+        )